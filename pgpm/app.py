@@ -10,17 +10,34 @@ Usage:
                 [-u | --user <user_role>])
                 [-m | --mode <mode>]
                 [-o | --owner <owner_role>] [--usage <usage_role>...]
-                [-f <file_name>...] [--add-config <config_file_path>] [--debug-mode]
+                [-f <file_name>... | --vcs-diff] [--add-config <config_file_path>] [--debug-mode]
                 [--vcs-ref <vcs_reference>] [--vcs-link <vcs_link>]
                 [--issue-ref <issue_reference>] [--issue-link <issue_link>]
                 [--compare-table-scripts-as-int]
                 [--log-file <log_file_name>] [--global-config <global_config_file_path>]
-                [--auto-commit] [--send-email]
+                [--auto-commit] [--send-email] [-j | --jobs <jobs>]
+                [--bundle <bundle_file_path>] [--force] [--batch-size <batch_size>]
+                [--transaction-pooling] [--timings] [--timings-json <timings_file_path>]
+                [--block-lock-risks] [--big-table-rows <big_table_rows>] [--notify-ddl-per-transaction]
+  pgpm plan (<connection_string> | set <environment_name> <product_name> ([--except] [<unique_name>...])
+                [-u | --user <user_role>])
+                [-m | --mode <mode>]
+                [-o | --owner <owner_role>] [--usage <usage_role>...]
+                [-f <file_name>...] [--debug-mode] [--compare-table-scripts-as-int]
+                [--bundle <bundle_file_path>] [--force]
+                [--rows-per-second <rows_per_second>] [--plan-json <plan_file_path>]
+                [--block-lock-risks] [--big-table-rows <big_table_rows>]
+                [--log-file <log_file_name>] [--global-config <global_config_file_path>]
+                [-j | --jobs <jobs>] [--transaction-pooling]
+  pgpm build [-f <file_name>...] [--output <bundle_file_path>]
+                [--vcs-ref <vcs_reference>] [--compare-table-scripts-as-int]
+                [--log-file <log_file_name>] [--debug-mode]
   pgpm execute (<connection_string> | set <environment_name> <product_name> ([--except] [<unique_name>...])
                 --query <query>
                 [-u | --user <user_role>])
                 [--until-zero]
                 [--log-file <log_file_name>] [--debug-mode] [--global-config <global_config_file_path>]
+                [-j | --jobs <jobs>] [--transaction-pooling]
   pgpm remove <connection_string> --pkg-name <schema_name>
                 <v_major> <v_minor> <v_patch> <v_pre>
                 [--old-rev <old_rev>] [--log-file <log_file_name>]
@@ -29,9 +46,18 @@ Usage:
                 [--upgrade] [--debug-mode]
                 [--usage <usage_role>...]
                 [--log-file <log_file_name>] [--global-config <global_config_file_path>]
+                [-j | --jobs <jobs>] [--transaction-pooling]
   pgpm uninstall (<connection_string> | set <environment_name> <product_name> [-u | --user <user_role>])
                 [--log-file <log_file_name>] [--global-config <global_config_file_path>]
-                [--debug-mode]
+                [--debug-mode] [-j | --jobs <jobs>]
+  pgpm prune-logs (<connection_string> | set <environment_name> <product_name> ([--except] [<unique_name>...])
+                [-u | --user <user_role>])
+                [--older-than <interval>] [--prune-batch-size <rows>] [--no-archive]
+                [--log-file <log_file_name>] [--debug-mode] [--global-config <global_config_file_path>]
+                [-j | --jobs <jobs>] [--transaction-pooling]
+  pgpm listen <connection_string> [<package_name>...] [--ddl-changes]
+                [--debounce <seconds>] [--timeout <seconds>]
+                [--log-file <log_file_name>] [--debug-mode]
   pgpm list set <environment_name> <product_name> ([--except] [<unique_name>...])
                 [--log-file <log_file_name>] [--global-config <global_config_file_path>]
   pgpm -h | --help
@@ -43,6 +69,7 @@ Arguments:
   <environment_name>        Name of an environment to be used to get connection strings from global-config file
   <product_name>            Name of a product. E.g. ed_live
   <unique_name>             Unique name that identifies DB within the set
+  <package_name>            Name of a package whose deployments are listened to
 
 Options:
   -h --help                 Show this screen.
@@ -51,6 +78,9 @@ Options:
                             Use it if you want to deploy only specific files (functions, types, etc).
                             In that case these files if exist will be overridden.
                             Should be followed by the list of names of files to deploy.
+  --vcs-diff                Deploy only files changed in git between the commit last deployed to the DB and HEAD.
+                            Changes that are not committed are not taken into account. Only files in script
+                            directories of the configuration are taken. Works as if they were listed with --file
   -o <owner_role>, --owner <owner_role>
                             Role to which schema owner and all objects inside will be changed. User connecting to DB
                             needs to be a superuser. If omitted, user running the script
@@ -106,24 +136,82 @@ Options:
                             path to a global-config file. If global gonfig exists also in ~/.pgpmconfig file then
                             two dicts are merged (file formats are JSON).
   --send-email              Send mail about deployment. Works only if email block exists in global config
+  --bundle <bundle_file_path>
+                            Deploy precompiled bundle built with pgpm build instead of package in current directory.
+                            Files and ordering of table scripts are taken from the bundle
+  --force                   Deploy function, view and trigger scripts even if they haven't changed since last deployment.
+                            By default unchanged scripts are skipped when existing schema is updated
+                            and no type drop or table scripts are executed
+  --batch-size <batch_size>
+                            Join function, view and trigger scripts into batches of up to this number of characters
+                            and send each batch to DB in one round trip. 0 to send scripts one by one.
+                            Ignored with --auto-commit.
+                            [default: 0]
+  --older-than <interval>   Prune log rows older than this interval (in Postgres notation)
+                            [default: 90 days]
+  --prune-batch-size <rows>
+                            Max number of log rows removed in one transaction [default: 10000]
+  --no-archive              Delete pruned log rows instead of moving them to archive table
+  --output <bundle_file_path>
+                            Path to a bundle file to build. Defaults to <name>_<version>.pgpm in current directory
+  --transaction-pooling     DB is connected through a transaction-mode pooler (e.g. pgBouncer with pool_mode=transaction).
+                            Settings are applied with SET LOCAL within deployment transaction and pgpm functions
+                            are called schema-qualified so that no session state is relied on.
+                            Can't be used with --auto-commit
+  --timings                 Print durations of deployment phases and the slowest scripts after deployment
+  --timings-json <timings_file_path>
+                            Write durations of deployment phases and of every executed script to a JSON file.
+                            For a set of DBs timings are written per DB. Plan compilation shared by all DBs
+                            is written once
+  --rows-per-second <rows_per_second>
+                            Rough number of rows per second processed by ALTER TABLE statements. Used by plan to
+                            estimate table scripts that were never executed before from sizes of altered tables
+                            [default: 100000]
+  --plan-json <plan_file_path>
+                            Write deployment plan with estimates to a JSON file. For a set of DBs plans are written per DB
+  --block-lock-risks        Don't deploy if statements of table scripts to execute take locks blocking writes while
+                            rewriting or scanning big tables (e.g. ADD COLUMN with volatile DEFAULT, column type
+                            change, SET NOT NULL). Such statements and other locks on big tables are only warned
+                            about otherwise. For plan the deployment is reported as failing
+  --big-table-rows <big_table_rows>
+                            Number of rows from which a table is considered big by lock analysis of table scripts
+                            [default: 1000000]
+  --notify-ddl-per-transaction
+                            Notify about DDL changes of deployment once on commit with JSON payload of user, txid
+                            and count of changes instead of once per statement with user name as payload
+  --ddl-changes             Listen also to notifications about DDL changes
+  --debounce <seconds>      Notifications are written out once none came for this number of seconds
+                            [default: 0.5]
+  --timeout <seconds>       Stop listening after this number of seconds. If omitted listens until interrupted
+  -j <jobs>, --jobs <jobs>  Number of DBs of a set processed in parallel. If operation fails for one of DBs,
+                            DBs that were not yet started are skipped
+                            [default: 1]
 
 
 """
+import atexit
+import json
 import logging
 import os
 import smtplib
 from pprint import pprint
 
+import pgpm.lib.bundle
 import pgpm.lib.install
+import pgpm.lib.listen
+import pgpm.lib.locks
 import pgpm.lib.deploy
+import pgpm.lib.estimate
 import pgpm.lib.execute
+import pgpm.lib.maintenance
+import pgpm.lib.plan
 import pgpm.lib.utils.config
 import pgpm.lib.utils.db
-import pgpm.lib.utils.vcs
 import sys
 import colorama
 import getpass
 import pgpm.utils.config
+import pgpm.utils.fanout
 import pgpm.utils.issue_trackers
 
 from docopt import docopt
@@ -138,6 +226,8 @@ logger = logging.getLogger(__name__)
 def main():
     arguments = docopt(__doc__, version=settings.__version__)
     colorama.init()
+    # connections are shared by all operations of the process and closed when it finishes
+    atexit.register(pgpm.lib.utils.db.default_connection_pool.close_all)
 
     # setting logging
     formatter = logging.Formatter(settings.LOGGING_FORMATTER)
@@ -170,7 +260,20 @@ def main():
     if arguments['--usage']:
         usage_roles = arguments['--usage']
 
-    sys.stdout.write('\033[2J\033[0;0H')
+    jobs = 1
+    if arguments['--jobs']:
+        jobs = int(arguments['--jobs'][0])
+
+    batch_size = 0
+    if arguments['--batch-size']:
+        batch_size = int(arguments['--batch-size'])
+
+    big_table_rows = pgpm.lib.locks.DEFAULT_BIG_TABLE_ROWS
+    if arguments['--big-table-rows']:
+        big_table_rows = int(arguments['--big-table-rows'])
+
+    if not arguments['listen']:
+        sys.stdout.write('\033[2J\033[0;0H')
     if arguments['install']:
         if arguments['--global-config']:
             extra_config_file = arguments['--global-config']
@@ -183,14 +286,15 @@ def main():
                                                               arguments['--except'])
         if arguments['set']:
             if len(connections_list) > 0:
-                for connection_dict in connections_list:
-                    connection_string = 'host=' + connection_dict['host'] + ' port=' + str(connection_dict['port']) + \
-                                        ' dbname=' + connection_dict['dbname'] + ' user=' + connection_user
-                    _install_schema(connection_string, arguments['--usage'], arguments['--upgrade'])
+                _run_on_set(connections_list, connection_user, jobs,
+                            lambda connection_string: _install_schema(connection_string, arguments['--usage'],
+                                                                      arguments['--upgrade'],
+                                                                      arguments['--transaction-pooling']))
             else:
                 _emit_no_set_found(arguments['<environment_name>'], arguments['<product_name>'])
         else:
-            _install_schema(arguments['<connection_string>'], arguments['--usage'], arguments['--upgrade'])
+            _install_schema(arguments['<connection_string>'], arguments['--usage'], arguments['--upgrade'],
+                            arguments['--transaction-pooling'])
     elif arguments['uninstall']:
         if arguments['--global-config']:
             extra_config_file = arguments['--global-config']
@@ -203,10 +307,7 @@ def main():
                                                               arguments['--except'])
         if arguments['set']:
             if len(connections_list) > 0:
-                for connection_dict in connections_list:
-                    connection_string = 'host=' + connection_dict['host'] + ' port=' + str(connection_dict['port']) + \
-                                        ' dbname=' + connection_dict['dbname'] + ' user=' + connection_user
-                    _uninstall_schema(connection_string)
+                _run_on_set(connections_list, connection_user, jobs, _uninstall_schema)
             else:
                 _emit_no_set_found(arguments['<environment_name>'], arguments['<product_name>'])
         else:
@@ -223,16 +324,16 @@ def main():
                                                               arguments['--except'])
         if arguments['set']:
             if len(connections_list) > 0:
-                for connection_dict in connections_list:
-                    connection_string = 'host=' + connection_dict['host'] + ' port=' + str(connection_dict['port']) + \
-                                        ' dbname=' + connection_dict['dbname'] + ' user=' + connection_user
-                    _execute(connection_string, arguments['--query'], arguments['--until-zero'])
+                _run_on_set(connections_list, connection_user, jobs,
+                            lambda connection_string: _execute(connection_string, arguments['--query'],
+                                                               arguments['--until-zero'],
+                                                               arguments['--transaction-pooling']))
             else:
                 _emit_no_set_found(arguments['<environment_name>'], arguments['<product_name>'])
         else:
-            _execute(arguments['<connection_string>'], arguments['--query'], arguments['--until-zero'])
+            _execute(arguments['<connection_string>'], arguments['--query'], arguments['--until-zero'],
+                     arguments['--transaction-pooling'])
     elif arguments['deploy']:
-        deploy_result = {}
         if arguments['--global-config']:
             extra_config_file = arguments['--global-config']
         else:
@@ -242,32 +343,35 @@ def main():
                                                               arguments['<product_name>'],
                                                               arguments['<unique_name>'],
                                                               arguments['--except'])
-        config_dict = {}
-        if owner_role:
-            config_dict['owner_role'] = owner_role
-        if usage_roles:
-            config_dict['usage_roles'] = usage_roles
-        config_object = pgpm.lib.utils.config.SchemaConfiguration(
-                os.path.abspath(settings.CONFIG_FILE_NAME), config_dict, os.path.abspath('.'))
+        config_object, deployment_plan = _get_deployment_plan(arguments, owner_role, usage_roles)
         if arguments['set']:
             if len(connections_list) > 0:
-                target_names_list = []
-                for connection_dict in connections_list:
-                    connection_string = 'host=' + connection_dict['host'] + ' port=' + str(connection_dict['port']) + \
-                                        ' dbname=' + connection_dict['dbname'] + ' user=' + connection_user
-                    deploy_result = _deploy_schema(connection_string,
-                                   mode=arguments['--mode'][0], files_deployment=arguments['--file'],
-                                   vcs_ref=arguments['--vcs-ref'], vcs_link=arguments['--vcs-link'],
-                                   issue_ref=arguments['--issue-ref'], issue_link=arguments['--issue-link'],
-                                   compare_table_scripts_as_int=arguments['--compare-table-scripts-as-int'],
-                                   auto_commit=arguments['--auto-commit'],
-                                   config_object=config_object)
-                    if 'unique_name' in connection_dict and connection_dict['unique_name']:
-                        target_names_list.append(connection_dict['unique_name'])
-                    else:
-                        target_names_list.append(connection_dict['dbname'])
+                deploy_report = _run_on_set(
+                    connections_list, connection_user, jobs,
+                    lambda connection_string: _deploy_schema(
+                        connection_string,
+                        mode=arguments['--mode'][0], files_deployment=arguments['--file'],
+                        vcs_ref=arguments['--vcs-ref'], vcs_link=arguments['--vcs-link'],
+                        issue_ref=arguments['--issue-ref'], issue_link=arguments['--issue-link'],
+                        compare_table_scripts_as_int=arguments['--compare-table-scripts-as-int'],
+                        auto_commit=arguments['--auto-commit'],
+                        config_object=config_object, plan=deployment_plan, force=arguments['--force'],
+                        vcs_diff=arguments['--vcs-diff'], batch_size=batch_size,
+                        transaction_pooling=arguments['--transaction-pooling'],
+                        block_lock_risks=arguments['--block-lock-risks'], big_table_rows=big_table_rows,
+                        notify_ddl_per_transaction=arguments['--notify-ddl-per-transaction']))
+                deploy_result = _aggregate_deploy_results(deploy_report)
+                set_timings = dict((item.target_name, item.result['timings']) for item in deploy_report.succeeded)
+                if arguments['--timings']:
+                    _emit_compile_timings(deployment_plan)
+                    for target_name, timings in set_timings.items():
+                        _emit_timings(timings, target_name)
+                if arguments['--timings-json']:
+                    _write_json({'compilation': _get_compile_timings(deployment_plan), 'deployments': set_timings},
+                                arguments['--timings-json'])
 
                 if deploy_result['deployed_files_count'] > 0:
+                    target_names_list = [item.target_name for item in deploy_report.succeeded]
                     target_str = 'environment: ' + connections_list[0]['environment'] + ', product: ' + \
                                  connections_list[0]['product'] + ', DBs: ' + ', '.join(target_names_list)
                     if arguments['--issue-ref'] and ('issue-tracker' in global_config.global_config_dict):
@@ -286,7 +390,17 @@ def main():
                            issue_ref=arguments['--issue-ref'], issue_link=arguments['--issue-link'],
                            compare_table_scripts_as_int=arguments['--compare-table-scripts-as-int'],
                            auto_commit=arguments['--auto-commit'],
-                           config_object=config_object)
+                           config_object=config_object, plan=deployment_plan, force=arguments['--force'],
+                           vcs_diff=arguments['--vcs-diff'], batch_size=batch_size,
+                           transaction_pooling=arguments['--transaction-pooling'],
+                           block_lock_risks=arguments['--block-lock-risks'], big_table_rows=big_table_rows,
+                           notify_ddl_per_transaction=arguments['--notify-ddl-per-transaction'])
+            if arguments['--timings']:
+                _emit_compile_timings(deployment_plan)
+                _emit_timings(deploy_result['timings'], arguments['<connection_string>'])
+            if arguments['--timings-json']:
+                _write_json({'compilation': _get_compile_timings(deployment_plan),
+                             'deployment': deploy_result['timings']}, arguments['--timings-json'])
             if deploy_result['deployed_files_count'] > 0:
                 conn_parsed = pgpm.lib.utils.db.parse_connection_string_psycopg2(arguments['<connection_string>'])
                 target_str = 'host: ' + conn_parsed['host'] + ', DB: ' + conn_parsed['dbname']
@@ -296,6 +410,91 @@ def main():
                 if arguments['--send-email'] and ('email' in global_config.global_config_dict):
                     _send_mail(arguments, global_config, target_str, config_object, deploy_result)
 
+    elif arguments['plan']:
+        if arguments['--global-config']:
+            extra_config_file = arguments['--global-config']
+        else:
+            extra_config_file = None
+        global_config = pgpm.utils.config.GlobalConfiguration('~/.pgpmconfig', extra_config_file)
+        connections_list = global_config.get_list_connections(arguments['<environment_name>'],
+                                                              arguments['<product_name>'],
+                                                              arguments['<unique_name>'],
+                                                              arguments['--except'])
+        config_object, deployment_plan = _get_deployment_plan(arguments, owner_role, usage_roles)
+        rows_per_second = int(arguments['--rows-per-second'])
+        if arguments['set']:
+            if len(connections_list) > 0:
+                plan_report = _run_on_set(
+                    connections_list, connection_user, jobs,
+                    lambda connection_string: _plan_deployment(
+                        connection_string, deployment_plan, arguments['--mode'][0], arguments['--force'],
+                        rows_per_second, arguments['--transaction-pooling'], arguments['--block-lock-risks'],
+                        big_table_rows))
+                set_plans = dict((item.target_name, item.result) for item in plan_report.succeeded)
+                for target_name, plan_result in sorted(set_plans.items()):
+                    _emit_plan(plan_result, target_name)
+                if arguments['--plan-json']:
+                    _write_json(set_plans, arguments['--plan-json'])
+            else:
+                _emit_no_set_found(arguments['<environment_name>'], arguments['<product_name>'])
+        else:
+            plan_result = _plan_deployment(arguments['<connection_string>'], deployment_plan,
+                                           arguments['--mode'][0], arguments['--force'], rows_per_second,
+                                           arguments['--transaction-pooling'], arguments['--block-lock-risks'],
+                                           big_table_rows)
+            _emit_plan(plan_result, arguments['<connection_string>'])
+            if arguments['--plan-json']:
+                _write_json(plan_result, arguments['--plan-json'])
+    elif arguments['prune-logs']:
+        prune_batch_size = int(arguments['--prune-batch-size'])
+        if arguments['--global-config']:
+            extra_config_file = arguments['--global-config']
+        else:
+            extra_config_file = None
+        global_config = pgpm.utils.config.GlobalConfiguration('~/.pgpmconfig', extra_config_file)
+        connections_list = global_config.get_list_connections(arguments['<environment_name>'],
+                                                              arguments['<product_name>'],
+                                                              arguments['<unique_name>'],
+                                                              arguments['--except'])
+        if arguments['set']:
+            if len(connections_list) > 0:
+                _run_on_set(connections_list, connection_user, jobs,
+                            lambda connection_string: _prune_logs(connection_string, arguments['--older-than'],
+                                                                  prune_batch_size, not arguments['--no-archive'],
+                                                                  arguments['--transaction-pooling']))
+            else:
+                _emit_no_set_found(arguments['<environment_name>'], arguments['<product_name>'])
+        else:
+            _prune_logs(arguments['<connection_string>'], arguments['--older-than'], prune_batch_size,
+                        not arguments['--no-archive'], arguments['--transaction-pooling'])
+    elif arguments['listen']:
+        channels = [pgpm.lib.listen.get_package_channel(package_name)
+                    for package_name in arguments['<package_name>']]
+        if arguments['--ddl-changes']:
+            channels.append(pgpm.lib.listen.DDL_CHANGE_CHANNEL)
+        if not channels:
+            logger.error('Nothing to listen to. Provide package names and/or --ddl-changes')
+            sys.exit(1)
+        timeout = None
+        if arguments['--timeout']:
+            timeout = float(arguments['--timeout'])
+        _listen(arguments['<connection_string>'], channels, float(arguments['--debounce']), timeout)
+    elif arguments['build']:
+        config_object = pgpm.lib.utils.config.SchemaConfiguration(
+                os.path.abspath(settings.CONFIG_FILE_NAME), None, os.path.abspath('.'))
+        deployment_plan = pgpm.lib.plan.DeploymentPlan.compile(
+            config_object, os.path.abspath('.'), files_deployment=arguments['--file'],
+            compare_table_scripts_as_int=arguments['--compare-table-scripts-as-int'],
+            vcs_ref=arguments['--vcs-ref'], logger=logger)
+        if arguments['--output']:
+            bundle_path = os.path.abspath(os.path.expanduser(arguments['--output']))
+        else:
+            bundle_path = os.path.abspath('{0}_{1}{2}'.format(config_object.name, config_object.version.raw,
+                                                              settings.BUNDLE_FILE_EXTENSION))
+        pgpm.lib.bundle.write_bundle(deployment_plan, bundle_path, logger)
+        sys.stdout.write(colorama.Fore.GREEN + 'Bundle built' + colorama.Fore.RESET + ' | ' + bundle_path)
+        sys.stdout.write('\n')
+        logger.info('Bundle {0} built'.format(bundle_path))
     elif arguments['list']:
         if arguments['set']:
             if arguments['--global-config']:
@@ -314,13 +513,13 @@ def main():
         print(arguments)
 
 
-def _install_schema(connection_string, user, upgrade):
+def _install_schema(connection_string, user, upgrade, transaction_pooling=False):
     logger.info('Installing... {0}'.format(connection_string))
     sys.stdout.write(colorama.Fore.YELLOW + 'Installing...' + colorama.Fore.RESET +
                      ' | ' + connection_string)
     sys.stdout.flush()
     installation_manager = pgpm.lib.install.InstallationManager(connection_string, '_pgpm', 'basic',
-                                                                logger)
+                                                                logger, transaction_pooling)
     try:
         installation_manager.install_pgpm_to_db(user, upgrade)
     except:
@@ -363,10 +562,13 @@ def _uninstall_schema(connection_string):
 
 
 def _deploy_schema(connection_string, mode, files_deployment, vcs_ref, vcs_link, issue_ref, issue_link,
-                   compare_table_scripts_as_int, auto_commit, config_object):
+                   compare_table_scripts_as_int, auto_commit, config_object, plan=None, force=False,
+                   vcs_diff=False, batch_size=0, transaction_pooling=False, block_lock_risks=False,
+                   big_table_rows=pgpm.lib.locks.DEFAULT_BIG_TABLE_ROWS, notify_ddl_per_transaction=False):
     deploy_result = {}
     deploying = 'Deploying...'
     deployed_files = 'Deployed {0} files out of {1}'
+    skipped_files = ' ({0} unchanged skipped)'
     logger.info('Deploying... {0}'.format(connection_string))
     sys.stdout.write(colorama.Fore.YELLOW + deploying + colorama.Fore.RESET +
                      ' | ' + connection_string)
@@ -374,13 +576,15 @@ def _deploy_schema(connection_string, mode, files_deployment, vcs_ref, vcs_link,
 
     deployment_manager = pgpm.lib.deploy.DeploymentManager(
         connection_string=connection_string, source_code_path=os.path.abspath('.'), config_object=config_object,
-        pgpm_schema_name='_pgpm', logger=logger)
+        pgpm_schema_name='_pgpm', logger=logger, transaction_pooling=transaction_pooling)
 
     try:
         deploy_result = deployment_manager.deploy_schema_to_db(
             mode=mode, files_deployment=files_deployment, vcs_ref=vcs_ref, vcs_link=vcs_link,
             issue_ref=issue_ref, issue_link=issue_link, compare_table_scripts_as_int=compare_table_scripts_as_int,
-            auto_commit=auto_commit)
+            auto_commit=auto_commit, plan=plan, force=force, vcs_diff=vcs_diff, batch_size=batch_size,
+            block_lock_risks=block_lock_risks, big_table_rows=big_table_rows,
+            notify_ddl_per_transaction=notify_ddl_per_transaction)
     except:
         print('\n')
         print('Something went wrong, check the logs. Aborting')
@@ -389,8 +593,9 @@ def _deploy_schema(connection_string, mode, files_deployment, vcs_ref, vcs_link,
         print(sys.exc_info()[2])
         raise
 
-    if deploy_result['code'] == deployment_manager.DEPLOYMENT_OUTPUT_CODE_OK \
-            and deploy_result['deployed_files_count'] == deploy_result['requested_files_count']:
+    if deploy_result['skipped_files_count'] > 0:
+        deployed_files += skipped_files.format(deploy_result['skipped_files_count'])
+    if deploy_result['code'] == deployment_manager.DEPLOYMENT_OUTPUT_CODE_OK:
         sys.stdout.write('\033[2K\r' + colorama.Fore.GREEN +
                          deployed_files.format(deploy_result['deployed_files_count'],
                                                deploy_result['requested_files_count']) + colorama.Fore.RESET +
@@ -408,7 +613,150 @@ def _deploy_schema(connection_string, mode, files_deployment, vcs_ref, vcs_link,
     return deploy_result
 
 
-def _execute(connection_string, query, until_zero=False):
+def _emit_timings(timings, target_name, slowest_scripts_limit=10):
+    """
+    prints durations of deployment phases and the slowest scripts
+    :param timings: timings as returned in deploy result
+    :param target_name: name of DB timings are of
+    :param slowest_scripts_limit: max number of scripts printed
+    """
+    sys.stdout.write(colorama.Fore.CYAN + 'Timings' + colorama.Fore.RESET + ' | ' + target_name + '\n')
+    for phase, seconds in timings['phases'].items():
+        sys.stdout.write('  {0:<30} {1:>10.3f}s\n'.format(phase, seconds))
+    sys.stdout.write('  {0:<30} {1:>10.3f}s\n'.format('total', timings['total']))
+    slowest_scripts = sorted(timings['scripts'], key=lambda script: script['seconds'], reverse=True)
+    if slowest_scripts:
+        sys.stdout.write('  Slowest scripts:\n')
+        for script in slowest_scripts[:slowest_scripts_limit]:
+            sys.stdout.write('  {0:>10.3f}s  {1:<8} {2}\n'.format(script['seconds'], script['type'], script['file']))
+
+
+def _get_compile_timings(plan):
+    """
+    :param plan: DeploymentPlan compiled once for all DBs or None if plans are compiled per DB
+    :return: timings of plan compilation as in deploy result or None if plan wasn't compiled from sources here
+    """
+    if not plan or not plan.timings:
+        return None
+    return plan.timings.to_dict()
+
+
+def _emit_compile_timings(plan):
+    """
+    prints durations of compilation of the plan shared by all DBs (if any)
+    :param plan: DeploymentPlan compiled once for all DBs or None if plans are compiled per DB
+    """
+    compile_timings = _get_compile_timings(plan)
+    if compile_timings:
+        _emit_timings(compile_timings, 'plan compilation')
+
+
+def _write_json(data, file_path):
+    with open(os.path.abspath(os.path.expanduser(file_path)), 'w') as json_file:
+        json.dump(data, json_file, indent=2)
+    logger.info('{0} written'.format(file_path))
+
+
+def _get_deployment_plan(arguments, owner_role=None, usage_roles=None):
+    """
+    compiles deployment plan of package in current directory or reads it from bundle
+    :return: tuple of SchemaConfiguration and DeploymentPlan. Plan is None if it's compiled per DB (--vcs-diff)
+    """
+    config_dict = {}
+    if owner_role:
+        config_dict['owner_role'] = owner_role
+    if usage_roles:
+        config_dict['usage_roles'] = usage_roles
+    deployment_plan = None
+    if arguments['--bundle']:
+        if arguments['--vcs-diff']:
+            logger.error('--vcs-diff can\'t be used with --bundle')
+            sys.exit(1)
+        # bundle is precompiled so no sources are needed
+        deployment_plan = pgpm.lib.bundle.read_bundle(os.path.abspath(os.path.expanduser(arguments['--bundle'])),
+                                                      config_dict, logger=logger)
+        config_object = deployment_plan.config
+    else:
+        config_object = pgpm.lib.utils.config.SchemaConfiguration(
+                os.path.abspath(settings.CONFIG_FILE_NAME), config_dict, os.path.abspath('.'))
+    if not deployment_plan and not arguments['--vcs-diff']:
+        # scripts are collected and ordered once and then the same plan is deployed to every DB.
+        # With --vcs-diff changed files depend on what was deployed to every DB so plans are compiled per DB
+        deployment_plan = pgpm.lib.plan.DeploymentPlan.compile(
+            config_object, os.path.abspath('.'), files_deployment=arguments['--file'],
+            compare_table_scripts_as_int=arguments['--compare-table-scripts-as-int'],
+            vcs_ref=arguments['--vcs-ref'], logger=logger)
+    return config_object, deployment_plan
+
+
+def _plan_deployment(connection_string, plan, mode, force=False,
+                     rows_per_second=pgpm.lib.estimate.DEFAULT_ROWS_PER_SECOND, transaction_pooling=False,
+                     block_lock_risks=False, big_table_rows=pgpm.lib.locks.DEFAULT_BIG_TABLE_ROWS):
+    logger.info('Planning deployment... {0}'.format(connection_string))
+    deployment_manager = pgpm.lib.deploy.DeploymentManager(
+        connection_string=connection_string, source_code_path=os.path.abspath('.'), config_object=plan.config,
+        pgpm_schema_name='_pgpm', logger=logger, transaction_pooling=transaction_pooling)
+    try:
+        plan_result = deployment_manager.plan_deployment(plan, mode=mode, force=force,
+                                                         rows_per_second=rows_per_second,
+                                                         block_lock_risks=block_lock_risks,
+                                                         big_table_rows=big_table_rows)
+    except:
+        print('\n')
+        print('Something went wrong, check the logs. Aborting')
+        print(sys.exc_info()[0])
+        print(sys.exc_info()[1])
+        print(sys.exc_info()[2])
+        raise
+    return plan_result
+
+
+def _emit_plan(plan_result, target_name):
+    """
+    prints scripts that deployment would execute with their estimated durations
+    :param plan_result: result of DeploymentManager.plan_deployment
+    :param target_name: name of DB plan is for
+    """
+    if plan_result['code'] == pgpm.lib.deploy.DeploymentManager.DEPLOYMENT_OUTPUT_CODE_OK:
+        sys.stdout.write(colorama.Fore.GREEN + 'Plan' + colorama.Fore.RESET + ' | ' + target_name + '\n')
+    else:
+        sys.stdout.write(colorama.Fore.RED + 'Deployment would fail: ' + plan_result['message'] +
+                         colorama.Fore.RESET + ' | ' + target_name + '\n')
+    if plan_result['schema_action'] == 'rename':
+        sys.stdout.write('  schema {0} would be renamed to {1} and created again\n'
+                         .format(plan_result['schema_name'], plan_result['old_schema_name']))
+    elif plan_result['schema_action']:
+        sys.stdout.write('  schema {0}: {1}\n'.format(plan_result['schema_name'], plan_result['schema_action']))
+    for script in plan_result['scripts']:
+        if script['action'] != 'execute':
+            sys.stdout.write('  {0:>10}   {1:<8} {2} (skipped, {3})\n'
+                             .format('', script['type'], script['file'], script['reason']))
+            continue
+        if script['estimated_seconds'] is None:
+            estimate = '?'
+        else:
+            estimate = '{0:.3f}s'.format(script['estimated_seconds'])
+        tables = ', '.join('{0}{1} ({2} rows)'.format(table['schema'] + '.' if table['schema'] else '', table['name'],
+                                                      table['rows'] if table['rows'] is not None else '?')
+                           for table in script.get('tables', []))
+        sys.stdout.write('  {0:>10} {1:<1} {2:<8} {3}{4}\n'.format(
+            estimate, '~' if script['estimate_source'] not in (None, 'history') else '', script['type'],
+            script['file'], ' | ' + tables if tables else ''))
+        for lock_risk in script.get('locks', []):
+            if lock_risk['risk'] != pgpm.lib.locks.RISK_LOW:
+                sys.stdout.write((colorama.Fore.RED if lock_risk['risk'] == pgpm.lib.locks.RISK_HIGH
+                                  else colorama.Fore.YELLOW) +
+                                 '  {0:>10}   {1}\n'.format('', pgpm.lib.locks.format_lock_risk(lock_risk)) +
+                                 colorama.Fore.RESET)
+    sys.stdout.write('  Estimated duration: {0:.3f}s (overhead {1:.3f}s){2}\n'.format(
+        plan_result['estimated_seconds'], plan_result['overhead_seconds'],
+        ', {0} scripts not estimated'.format(plan_result['not_estimated_count'])
+        if plan_result['not_estimated_count'] else ''))
+    if plan_result['lock_risks_count']:
+        sys.stdout.write('  Statements with lock risk: {0}\n'.format(plan_result['lock_risks_count']))
+
+
+def _execute(connection_string, query, until_zero=False, transaction_pooling=False):
     calling = 'Executing query {0}...'.format(query)
     called = 'Executed query {0}    '.format(query)
     logger.info('Deploying... {0}'.format(connection_string))
@@ -417,7 +765,7 @@ def _execute(connection_string, query, until_zero=False):
     sys.stdout.flush()
 
     query_manager = pgpm.lib.execute.QueryExecutionManager(
-            connection_string=connection_string, logger=logger)
+            connection_string=connection_string, logger=logger, transaction_pooling=transaction_pooling)
     try:
         query_manager.execute(query, until_zero=until_zero)
     except:
@@ -436,6 +784,114 @@ def _execute(connection_string, query, until_zero=False):
     return 0
 
 
+def _prune_logs(connection_string, older_than,
+                batch_size=pgpm.lib.maintenance.MaintenanceManager.DEFAULT_PRUNE_BATCH_SIZE, archive=True,
+                transaction_pooling=False):
+    logger.info('Pruning logs... {0}'.format(connection_string))
+    sys.stdout.write(colorama.Fore.YELLOW + 'Pruning logs...' + colorama.Fore.RESET +
+                     ' | ' + connection_string)
+    sys.stdout.flush()
+    maintenance_manager = pgpm.lib.maintenance.MaintenanceManager(
+        connection_string=connection_string, logger=logger, transaction_pooling=transaction_pooling)
+    try:
+        pruned_count = maintenance_manager.prune_ddl_changes_log(older_than, batch_size, archive)
+    except:
+        print('\n')
+        print('Something went wrong, check the logs. Aborting')
+        print(sys.exc_info()[0])
+        print(sys.exc_info()[1])
+        print(sys.exc_info()[2])
+        raise
+
+    sys.stdout.write('\033[2K\r' + colorama.Fore.GREEN + 'Pruned {0} log rows'.format(pruned_count) +
+                     colorama.Fore.RESET + ' | ' + connection_string)
+    sys.stdout.write('\n')
+    logger.info('Successfully pruned logs of {0}'.format(connection_string))
+    return pruned_count
+
+
+def _listen(connection_string, channels, debounce_interval, timeout=None):
+    """
+    writes notifications as JSON lines to stdout. Logs go to stderr or log file so that output can be piped
+    """
+    logger.info('Listening on {0}'.format(', '.join(channels)))
+    batcher = pgpm.lib.listen.NotificationBatcher(debounce_interval=debounce_interval)
+    listener = pgpm.lib.listen.Listener(connection_string, channels, batcher=batcher, logger=logger)
+    try:
+        notifications_count = listener.listen(pgpm.lib.listen.get_jsonl_writer(sys.stdout), timeout=timeout)
+    except KeyboardInterrupt:
+        logger.info('Listening interrupted')
+        return 0
+    logger.info('Stopped listening. {0} notifications received'.format(notifications_count))
+    return notifications_count
+
+
+def _run_on_set(connections_list, connection_user, jobs, func):
+    """
+    runs an operation on every DB of a set (up to `jobs` DBs in parallel) and reports results.
+    Exits with error code if operation failed for any of DBs
+    :param connections_list: list of connection dictionaries from global config
+    :param connection_user: user to connect with
+    :param jobs: number of DBs processed in parallel
+    :param func: callable taking a connection string
+    :return: FanOutReport
+    """
+    targets = []
+    for connection_dict in connections_list:
+        connection_string = 'host=' + connection_dict['host'] + ' port=' + str(connection_dict['port']) + \
+                            ' dbname=' + connection_dict['dbname'] + ' user=' + connection_user
+        if 'unique_name' in connection_dict and connection_dict['unique_name']:
+            target_name = connection_dict['unique_name']
+        else:
+            target_name = connection_dict['dbname']
+        targets.append((target_name, connection_string))
+
+    report = pgpm.utils.fanout.fan_out(targets, func, jobs, logger)
+
+    if not report.is_ok:
+        sys.stdout.write(colorama.Fore.RED + 'Failed for {0} DB(s), skipped {1} DB(s) out of {2}'
+                         .format(len(report.failed), len(report.skipped), len(report.results)) +
+                         colorama.Fore.RESET)
+        sys.stdout.write('\n')
+        for item in report.failed:
+            sys.stdout.write(colorama.Fore.RED + 'Failed' + colorama.Fore.RESET + ' | ' + item.target_name +
+                             ' | ' + str(item.exc_info[1]))
+            sys.stdout.write('\n')
+        logger.error('Operation failed for: {0}. Skipped: {1}'
+                     .format(', '.join([item.target_name for item in report.failed]),
+                             ', '.join([item.target_name for item in report.skipped])))
+        sys.exit(1)
+
+    return report
+
+
+def _aggregate_deploy_results(deploy_report):
+    """
+    merges deploy results of all DBs of a set into one result of the same format as a single DB deploy result.
+    Counts are summed up, lists of files contain each file once. Per DB results are under `targets` key
+    :param deploy_report: FanOutReport of deployment
+    :return: dict
+    """
+    aggregated_result = {
+        'deployed_files_count': 0,
+        'requested_files_count': 0,
+        'targets': deploy_report.to_dict()
+    }
+    _seen_items = {}
+    for item in deploy_report.succeeded:
+        for key, value in item.result.items():
+            if key.endswith('_count'):
+                aggregated_result[key] = aggregated_result.get(key, 0) + value
+            elif isinstance(value, list):
+                aggregated_list = aggregated_result.setdefault(key, [])
+                seen_items = _seen_items.setdefault(key, set())
+                for list_item in value:
+                    if list_item not in seen_items:
+                        seen_items.add(list_item)
+                        aggregated_list.append(list_item)
+    return aggregated_result
+
+
 def _emit_no_set_found(environment_name, product_name):
     """
     writes to std out and logs if no connection string is found for deployment
@@ -452,6 +908,15 @@ def _emit_no_set_found(environment_name, product_name):
                    .format(environment_name, product_name))
 
 
+def _get_vcs():
+    """
+    imports vcs utils only when they are needed so that bundles can be deployed without vcs libraries
+    :return: pgpm.lib.utils.vcs module
+    """
+    import pgpm.lib.utils.vcs
+    return pgpm.lib.utils.vcs
+
+
 def _send_mail(arguments, global_config, target_string, config_object, deploy_result):
     if global_config.global_config_dict['email']['type'] == "SMTP":
         logger.info('Sending an email about deployment')
@@ -496,13 +961,14 @@ def _send_mail(arguments, global_config, target_string, config_object, deploy_re
 
         _git_commit_row = ''
         _git_repo_row = ''
-        if pgpm.lib.utils.vcs.is_git_directory(os.path.abspath('.')):
+        # bundles are deployed without sources and vcs libraries
+        if not arguments['--bundle'] and _get_vcs().is_git_directory(os.path.abspath('.')):
             _git_repo_row += '<tr><th>GIT repo</th><td>'
-            _git_repo_row += pgpm.lib.utils.vcs.get_git_remote_url(os.path.abspath('.'))
+            _git_repo_row += _get_vcs().get_git_remote_url(os.path.abspath('.'))
             _git_repo_row += '</td></tr>'
             if not arguments['--vcs-ref']:
                 _git_commit_row += '<tr><th>GIT commit</th><td>'
-                _git_commit_row += pgpm.lib.utils.vcs.get_git_revision_hash(os.path.abspath('.'))
+                _git_commit_row += _get_vcs().get_git_revision_hash(os.path.abspath('.'))
                 _git_commit_row += '</td></tr>'
         pkg_desc_text = """
         <table>
@@ -574,13 +1040,14 @@ def _comment_issue_tracker(arguments, global_config, target_string, config_objec
 
         _git_commit_row = ''
         _git_repo_row = ''
-        if pgpm.lib.utils.vcs.is_git_directory(os.path.abspath('.')):
+        # bundles are deployed without sources and vcs libraries
+        if not arguments['--bundle'] and _get_vcs().is_git_directory(os.path.abspath('.')):
             _git_repo_row += '\n||GIT repo|'
-            _git_repo_row += pgpm.lib.utils.vcs.get_git_remote_url(os.path.abspath('.'))
+            _git_repo_row += _get_vcs().get_git_remote_url(os.path.abspath('.'))
             _git_repo_row += '|'
             if not arguments['--vcs-ref']:
                 _git_commit_row += '\n||GIT commit|'
-                _git_commit_row += pgpm.lib.utils.vcs.get_git_revision_hash(os.path.abspath('.'))
+                _git_commit_row += _get_vcs().get_git_revision_hash(os.path.abspath('.'))
                 _git_commit_row += '|'
 
         comment_body = global_config.global_config_dict['issue-tracker']['comment-body']\
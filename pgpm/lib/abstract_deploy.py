@@ -1,11 +1,28 @@
+import distutils.version
+import functools
 import logging
-import psycopg2
+import sys
 
+import pgpm.lib.catalog
 import pgpm.lib.utils
 import pgpm.lib.utils.db
 import pgpm.lib.version
 import pgpm.lib.utils.config
-import pgpm.lib.utils.vcs
+
+
+def release_connection_on_error(method):
+    """
+    Decorates methods of managers that use the connection, so that the connection is given back to the pool
+    (and transaction in progress is rolled back) if method fails instead of being kept open by the manager
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        try:
+            return method(self, *args, **kwargs)
+        except BaseException:
+            self._release_connection()
+            raise
+    return wrapper
 
 
 class AbstractDeploymentManager(object):
@@ -13,20 +30,113 @@ class AbstractDeploymentManager(object):
     "Abstract" class (not intended to be called directly) that sets basic configuration and interface for classes
     that manage deployments within db
     """
-    def __init__(self, connection_string, pgpm_schema_name='_pgpm', logger=None):
+    def __init__(self, connection_string, pgpm_schema_name='_pgpm', logger=None, transaction_pooling=False,
+                 connection_pool=None):
         """
-        initialises the manager and connects to the DB
+        initialises the manager. DB is connected on first use
         :param connection_string: connection string consumable by DBAPI 2.0
         :param pgpm_schema_name: name of pgpm schema (default '_pgpm')
         :param logger: logger object
+        :param transaction_pooling: if True, no session state is kept between transactions
+        (settings are applied with SET LOCAL) so that DB can be connected through transaction-mode poolers
+        :param connection_pool: ConnectionPool to take connections from. Pool shared within the process by default
         """
         self._logger = logger or logging.getLogger(__name__)
         self._connection_string = connection_string
-        self._conn = psycopg2.connect(connection_string, connection_factory=pgpm.lib.utils.db.MegaConnection)
-        self._conn.init(logger)
+        self._transaction_pooling = transaction_pooling
+        self._connection_pool = connection_pool or pgpm.lib.utils.db.default_connection_pool
+        self._connection = None
+        self._catalog = None
+        self._instrumentation_hooks = []
         self._pgpm_schema_name = pgpm_schema_name
         self._pgpm_version = pgpm.lib.utils.config.Version(pgpm.lib.version.__version__,
                                                            pgpm.lib.utils.config.VersionTypes.python)
 
+    @property
+    def _conn(self):
+        """
+        Connection to the DB. Taken from the pool when used first time or after it was released or closed
+        :return: MegaConnection
+        """
+        if self._connection is None or self._connection.closed:
+            self._connection = self._connection_pool.get_connection(self._connection_string)
+            self._connection.init(self._logger)
+            self._connection.transaction_pooling = self._transaction_pooling
+            self._connection.instrumentation_hooks = list(self._instrumentation_hooks)
+        return self._connection
+
+    def add_instrumentation_hook(self, hook):
+        """
+        Registers hook called around every statement the manager executes
+        :param hook: InstrumentationHook (e.g. LatencyHistogram or SlowestStatements)
+        """
+        self._instrumentation_hooks.append(hook)
+        if self._connection is not None:
+            self._connection.add_instrumentation_hook(hook)
+
+    def _get_catalog(self):
+        """
+        Snapshot of DB catalog loaded once per connection use
+        :return: CatalogSnapshot
+        """
+        if self._catalog is None:
+            self._catalog = pgpm.lib.catalog.CatalogSnapshot(self._conn.cursor(), self._pgpm_schema_name,
+                                                             self._logger)
+        return self._catalog
+
+    def _release_connection(self):
+        """
+        Gives connection back to the pool so that it can be reused by other managers
+        """
+        self._catalog = None
+        if self._connection is not None:
+            self._connection_pool.release_connection(self._connection_string, self._connection)
+            self._connection = None
+
+    def _get_pgpm_schema_error(self, catalog, action='deploy schemas to'):
+        """
+        :param catalog: CatalogSnapshot
+        :param action: what can't be done in the DB, used in the error message
+        :return: error message if pgpm is not installed in the DB or its version differs from the version
+        of the script, otherwise None
+        """
+        # Check if DB is pgpm enabled
+        if not catalog.is_pgpm_installed:
+            return 'Can\'t {0} DB where pgpm was not installed. First install pgpm by running pgpm install' \
+                .format(action)
+
+        # check installed version of _pgpm schema.
+        pgpm_v_db = distutils.version.StrictVersion(".".join(catalog.pgpm_version))
+        pgpm_v_script = distutils.version.StrictVersion(pgpm.lib.version.__version__)
+        if pgpm_v_script > pgpm_v_db:
+            return '{0} schema version is outdated. Please run pgpm install --upgrade first.' \
+                .format(self._pgpm_schema_name)
+        elif pgpm_v_script < pgpm_v_db:
+            return 'Deployment script\'s version is lower than the version of {0} schema installed in DB. ' \
+                   'Update pgpm script first.'.format(self._pgpm_schema_name)
+        return None
+
+    def _check_pgpm_schema(self, catalog, action='deploy schemas to'):
+        """
+        Exits if pgpm is not installed in the DB or its version differs from the version of the script
+        :param catalog: CatalogSnapshot
+        :param action: what can't be done in the DB, used in the error message
+        """
+        error = self._get_pgpm_schema_error(catalog, action)
+        if error:
+            self._logger.error(error)
+            self._release_connection()
+            sys.exit(1)
+
+    def _prepare_settings_script(self, script):
+        """
+        Prepares script that applies settings (e.g. deployment preamble) to be executed
+        :param script: SQL script with SET statements
+        :return: script as it is or with settings made local to transaction in transaction pooling mode
+        """
+        if self._transaction_pooling:
+            return pgpm.lib.utils.db.SqlScriptsHelper.make_settings_local(script)
+        return script
+
     DEPLOYMENT_OUTPUT_CODE_OK = 0
     DEPLOYMENT_OUTPUT_CODE_NOT_ALL_DEPLOYED = 1
@@ -0,0 +1,191 @@
+import json
+import logging
+import os
+
+import pgpm.lib.plan
+import pgpm.lib.utils.config
+import pgpm.lib.utils.misc
+import pgpm.lib.version
+
+BUNDLE_MAGIC = b'PGPMBUNDLE'
+BUNDLE_FORMAT_VERSION = 1
+
+# sections with scripts stored as (key, script) pairs
+_SCRIPT_SECTIONS = pgpm.lib.plan.DeploymentPlan.SCRIPT_TYPES
+# sections with ordered type statements
+_STATEMENT_SECTIONS = ('type_drop', 'type_ordered', 'type_unordered')
+
+
+class BundleError(Exception):
+    """
+    Raised when bundle file is malformed or its content doesn't match stored hashes
+    """
+    pass
+
+
+class BundleScript(object):
+    """
+    Script in a bundle that is read from the bundle file only when it's needed (see FileScript)
+    """
+    def __init__(self, bundle_path, offset, length, content_hash=None, key=None):
+        """
+        :param bundle_path: path to a bundle file
+        :param offset: offset of the script in the file
+        :param length: length of the script in bytes
+        :param content_hash: hash of the script to verify content with. Not verified if omitted
+        :param key: key of the script in the bundle
+        """
+        self.bundle_path = bundle_path
+        self.offset = offset
+        self.length = length
+        self.content_hash = content_hash
+        self.key = key
+
+    def read(self):
+        """
+        :return: content of the script
+        """
+        with open(self.bundle_path, 'rb') as bundle_file:
+            bundle_file.seek(self.offset)
+            script = bundle_file.read(self.length).decode('utf-8')
+        if self.content_hash and pgpm.lib.utils.misc.get_content_hash(script) != self.content_hash:
+            raise BundleError('Content of {0} in bundle {1} doesn\'t match its hash'
+                              .format(self.key, self.bundle_path))
+        return script
+
+
+def write_bundle(plan, bundle_path, logger=None):
+    """
+    Writes precompiled deployment plan to a single bundle file.
+    File consists of a magic line, a line with size of the header, JSON header with configuration and index of scripts
+    (offsets, lengths and hashes) and a body with all scripts concatenated in execution order.
+    Same plan always produces byte identical bundle
+    :param plan: DeploymentPlan
+    :param bundle_path: path to a bundle file
+    :param logger: logger object
+    :return: header of the bundle
+    """
+    logger = logger or logging.getLogger(__name__)
+    body_chunks = []
+    body_size = [0]
+
+    def _add_to_body(key, script):
+        script_bytes = script.encode('utf-8')
+        entry = {
+            'key': key,
+            'offset': body_size[0],
+            'length': len(script_bytes),
+            'hash': pgpm.lib.utils.misc.get_content_hash(script)
+        }
+        body_chunks.append(script_bytes)
+        body_size[0] += len(script_bytes)
+        return entry
+
+    sections = {}
+    for script_type in _SCRIPT_SECTIONS:
+        if script_type == 'table':
+            sections[script_type] = [_add_to_body(key, script_source.read())
+                                     for key, script_source in plan.get_scripts(script_type)]
+        else:
+            sections[script_type] = [_add_to_body(key, script) for key, script in plan.get_scripts(script_type)]
+    sections['type_drop'] = [_add_to_body(None, statement) for statement in plan.type_drop_statements]
+    sections['type_ordered'] = [_add_to_body(None, statement) for statement in plan.type_ordered_statements]
+    sections['type_unordered'] = [_add_to_body(None, statement) for statement in plan.type_unordered_statements]
+
+    header = {
+        'format': BUNDLE_FORMAT_VERSION,
+        'pgpm_version': pgpm.lib.version.__version__,
+        'config': plan.config.to_dict(),
+        'files_deployment': plan.files_deployment,
+        'vcs_ref': plan.vcs_ref,
+        'sections': sections
+    }
+    header_bytes = json.dumps(header, sort_keys=True, separators=(',', ':')).encode('utf-8')
+
+    # write to a temporary file first so that bundle is never left half written
+    bundle_tmp_path = bundle_path + '.tmp'
+    with open(bundle_tmp_path, 'wb') as bundle_file:
+        bundle_file.write(BUNDLE_MAGIC + ' {0}\n'.format(BUNDLE_FORMAT_VERSION).encode('ascii'))
+        bundle_file.write('{0}\n'.format(len(header_bytes)).encode('ascii'))
+        bundle_file.write(header_bytes)
+        for chunk in body_chunks:
+            bundle_file.write(chunk)
+    if os.path.exists(bundle_path):
+        os.remove(bundle_path)
+    os.rename(bundle_tmp_path, bundle_path)
+
+    logger.debug('Bundle {0} written. Header size: {1} bytes, body size: {2} bytes'
+                 .format(bundle_path, len(header_bytes), body_size[0]))
+    return header
+
+
+def read_bundle(bundle_path, config_dict=None, verify=True, logger=None):
+    """
+    Reads bundle file into a deployment plan. Scripts are read from the file by offsets
+    so neither parsing of scripts nor access to package sources is needed. Table scripts are read
+    from the file when they are executed
+    :param bundle_path: path to a bundle file
+    :param config_dict: dictionary with config overriding the one stored in the bundle (e.g. owner_role)
+    :param verify: check that content of scripts matches stored hashes
+    :param logger: logger object
+    :return: DeploymentPlan
+    """
+    logger = logger or logging.getLogger(__name__)
+    with open(bundle_path, 'rb') as bundle_file:
+        magic_line = bundle_file.readline().rstrip(b'\n').split(b' ')
+        if magic_line[0] != BUNDLE_MAGIC:
+            raise BundleError('{0} is not a pgpm bundle'.format(bundle_path))
+        if int(magic_line[1]) != BUNDLE_FORMAT_VERSION:
+            raise BundleError('Bundle format {0} is not supported. Supported format is {1}'
+                              .format(int(magic_line[1]), BUNDLE_FORMAT_VERSION))
+        header_size = int(bundle_file.readline())
+        header = json.loads(bundle_file.read(header_size).decode('utf-8'))
+        body_start = bundle_file.tell()
+
+        def _read_entry(entry):
+            bundle_file.seek(body_start + entry['offset'])
+            script = bundle_file.read(entry['length']).decode('utf-8')
+            if verify and pgpm.lib.utils.misc.get_content_hash(script) != entry['hash']:
+                raise BundleError('Content of {0} in bundle {1} doesn\'t match its hash'
+                                  .format(entry['key'] or 'type statement', bundle_path))
+            return script
+
+        sections = header['sections']
+        scripts = {}
+        for script_type in _SCRIPT_SECTIONS:
+            if script_type == 'table':
+                # table scripts are read only if they are executed
+                scripts[script_type] = [(entry['key'], BundleScript(bundle_path, body_start + entry['offset'],
+                                                                    entry['length'],
+                                                                    entry['hash'] if verify else None,
+                                                                    entry['key']))
+                                        for entry in sections[script_type]]
+            else:
+                scripts[script_type] = [(entry['key'], _read_entry(entry)) for entry in sections[script_type]]
+        statements = {}
+        for section in _STATEMENT_SECTIONS:
+            statements[section] = [_read_entry(entry) for entry in sections[section]]
+
+    if header['pgpm_version'] != pgpm.lib.version.__version__:
+        logger.warning('Bundle {0} was built with pgpm {1}, current version is {2}'
+                       .format(bundle_path, header['pgpm_version'], pgpm.lib.version.__version__))
+
+    bundle_config_dict = header['config']
+    if config_dict:
+        bundle_config_dict = dict(bundle_config_dict, **config_dict)
+    config = pgpm.lib.utils.config.SchemaConfiguration(config_dict=bundle_config_dict)
+    logger.debug('Bundle {0} with package {1} of version {2} loaded'
+                 .format(bundle_path, config.name, config.version.raw))
+
+    return pgpm.lib.plan.DeploymentPlan(
+        config,
+        type_scripts=scripts['type'],
+        type_drop_statements=statements['type_drop'],
+        type_ordered_statements=statements['type_ordered'],
+        type_unordered_statements=statements['type_unordered'],
+        table_scripts=scripts['table'],
+        function_scripts=scripts['function'],
+        view_scripts=scripts['view'],
+        trigger_scripts=scripts['trigger'],
+        files_deployment=header['files_deployment'],
+        vcs_ref=header['vcs_ref'])
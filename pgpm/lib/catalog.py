@@ -0,0 +1,93 @@
+import collections
+import logging
+
+# record of a package registered in pgpm schema
+PackageInfo = collections.namedtuple('PackageInfo', ['pkg_id', 'name', 'major', 'minor', 'patch', 'pre', 'old_rev'])
+
+
+class CatalogSnapshot(object):
+    """
+    Snapshot of DB catalog that pre-deployment checks are answered from: existing schemas, version of pgpm schema
+    and registered packages. Loaded with two queries and kept in sync with DDL issued by pgpm itself
+    (see add_schema, rename_schema and drop_schema). After scripts that may change schemas are executed
+    snapshot has to be invalidated and it's reloaded on next access
+    """
+    def __init__(self, cur, pgpm_schema_name='_pgpm', logger=None):
+        """
+        :param cur: cursor snapshot is loaded with
+        :param pgpm_schema_name: name of pgpm schema
+        :param logger: logger object
+        """
+        self._cur = cur
+        self._pgpm_schema_name = pgpm_schema_name
+        self._logger = logger or logging.getLogger(__name__)
+        self._schemas = None
+        self._packages = None  # package name -> list of PackageInfo ordered from the latest version
+
+    def refresh(self):
+        """
+        Loads snapshot from the DB
+        """
+        self._cur.execute('SELECT nspname FROM pg_catalog.pg_namespace;')
+        self._schemas = set(row[0] for row in self._cur.fetchall())
+        self._packages = {}
+        if self._pgpm_schema_name in self._schemas:
+            self._cur.execute('SELECT pkg_id, pkg_name, pkg_v_major, pkg_v_minor, pkg_v_patch, pkg_v_pre, pkg_old_rev '
+                              'FROM {0}.packages '
+                              'ORDER BY pkg_name, pkg_v_major DESC, pkg_v_minor DESC, pkg_v_patch DESC, '
+                              'pkg_old_rev DESC NULLS FIRST;'.format(self._pgpm_schema_name))
+            for row in self._cur.fetchall():
+                self._packages.setdefault(row[1], []).append(PackageInfo(*row))
+        self._logger.debug('Catalog snapshot loaded: {0} schemas, {1} packages'
+                           .format(len(self._schemas), len(self._packages)))
+
+    def invalidate(self):
+        """
+        Marks snapshot as outdated so that it's reloaded on next access
+        """
+        self._schemas = None
+        self._packages = None
+
+    def _ensure_loaded(self):
+        if self._schemas is None:
+            self.refresh()
+
+    def schema_exists(self, schema_name):
+        self._ensure_loaded()
+        return schema_name in self._schemas
+
+    def add_schema(self, schema_name):
+        self._ensure_loaded()
+        self._schemas.add(schema_name)
+
+    def rename_schema(self, schema_name, new_schema_name):
+        self._ensure_loaded()
+        self._schemas.discard(schema_name)
+        self._schemas.add(new_schema_name)
+
+    def drop_schema(self, schema_name):
+        self._ensure_loaded()
+        self._schemas.discard(schema_name)
+
+    @property
+    def is_pgpm_installed(self):
+        return self.schema_exists(self._pgpm_schema_name)
+
+    @property
+    def pgpm_version(self):
+        """
+        version of pgpm schema installed in DB
+        :return: tuple of major, minor and patch components of version (strings) or None if pgpm is not installed
+        """
+        packages = self.get_packages(self._pgpm_schema_name)
+        if not packages:
+            return None
+        return str(packages[0].major), str(packages[0].minor), str(packages[0].patch)
+
+    def get_packages(self, name):
+        """
+        :param name: package name
+        :return: list of PackageInfo registered with the name ordered from the latest version
+        """
+        self._ensure_loaded()
+        return list(self._packages.get(name, []))
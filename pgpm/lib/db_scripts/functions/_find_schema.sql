@@ -14,6 +14,9 @@ $BODY$
 -- - x notation like 01_02_XX or 01_02_xx or 1_2_X or 1_2_x
 -- - comparison operators like >01_02_03 or <2
 -- - x for any latest version of package
+-- Missing components (x or omitted) match any value, so comparison is done on the given components only
+-- (e.g. <1_2 is any version lower than 1.2.0 and <=1_2 includes all 1.2 versions).
+-- The latest version satisfying requirement is returned
 -- Package name must comply with naming conventions of postgres, exist as schema and be trackable by pgpm in order to satisfy dependency
 --
 -- @returns
@@ -21,140 +24,78 @@ $BODY$
 -- pkg_name TEXT, pkg_v_major INTEGER, pkg_v_minor INTEGER, pkg_v_patch INTEGER
 ---
 DECLARE
-    c_re_version TEXT = '^(<=|>=|<|>{0,2})(\d*|x*)_?(\d*|x*)_?(\d*|x*)';
-    l_v_matches  TEXT [];
+    c_re_version      TEXT = '^(<=|>=|<|>{0,2})(\d*|x*)_?(\d*|x*)_?(\d*|x*)';
+    c_v_max           BIGINT = 2147483647;
+    l_v_matches       TEXT [];
 
-    l_v_major    INTEGER;
-    l_v_minor    INTEGER;
-    l_v_patch    INTEGER;
+    -- version with missing components as low and as high as possible
+    l_v_low           BIGINT [];
+    l_v_high          BIGINT [];
+    l_i               INTEGER;
 
-    return_value RECORD;
+    -- versions are searched strictly between lower and upper bounds
+    l_v_lower_bound   BIGINT [];
+    l_v_upper_bound   BIGINT [];
+
+    return_value      RECORD;
 BEGIN
 
     SELECT regexp_matches(p_v_req, c_re_version, 'gi')
     INTO l_v_matches;
 
-    IF l_v_matches [2] ~* '^x+|^$'
-    THEN
-        SELECT max(pkg_v_major)
-        FROM packages
-        WHERE pkg_name = p_schema_name
-        INTO l_v_major;
-    ELSE
-        l_v_major := l_v_matches [2] :: INTEGER;
-    END IF;
-
-    IF l_v_matches [3] ~* '^x+|^$'
-    THEN
-        SELECT max(pkg_v_minor)
-        FROM packages
-        WHERE pkg_name = p_schema_name
-              AND pkg_v_major = l_v_major
-        INTO l_v_minor;
-    ELSE
-        l_v_minor := l_v_matches [3] :: INTEGER;
-    END IF;
-
-    IF l_v_matches [4] ~* '^x+|^$'
-    THEN
-        SELECT max(pkg_v_patch)
-        FROM packages
-        WHERE pkg_name = p_schema_name
-              AND pkg_v_major = l_v_major
-              AND pkg_v_minor = l_v_minor
-        INTO l_v_patch;
-    ELSE
-        l_v_patch := l_v_matches [4] :: INTEGER;
-    END IF;
+    l_v_low := ARRAY [0, 0, 0];
+    l_v_high := ARRAY [c_v_max, c_v_max, c_v_max];
+    FOR l_i IN 1..3 LOOP
+        IF l_v_matches [l_i + 1] !~* '^x+|^$'
+        THEN
+            l_v_low [l_i] := l_v_matches [l_i + 1] :: BIGINT;
+            l_v_high [l_i] := l_v_matches [l_i + 1] :: BIGINT;
+        END IF;
+    END LOOP;
 
     CASE l_v_matches [1]
         WHEN '=', ''
         THEN
-            SELECT DISTINCT
-                pkg_id,
-                pkg_name,
-                pkg_v_major,
-                pkg_v_minor,
-                pkg_v_patch
-            FROM packages
-            WHERE pkg_name = p_schema_name
-                  AND pkg_v_major = l_v_major
-                  AND pkg_v_minor = l_v_minor
-                  AND pkg_v_patch = l_v_patch
-            INTO return_value;
+            l_v_lower_bound := ARRAY [l_v_low [1], l_v_low [2], l_v_low [3] - 1];
+            l_v_upper_bound := ARRAY [l_v_high [1], l_v_high [2], l_v_high [3] + 1];
         WHEN '<'
         THEN
-            SELECT DISTINCT
-                pkg_id,
-                pkg_name,
-                pkg_v_major,
-                pkg_v_minor,
-                pkg_v_patch
-            FROM packages
-            WHERE pkg_name = p_schema_name
-                  AND (pkg_v_major < l_v_major
-                       OR (pkg_v_major = l_v_major
-                           AND pkg_v_minor < l_v_minor)
-                       OR (pkg_v_major = l_v_major
-                           AND pkg_v_minor = l_v_minor
-                           AND pkg_v_patch < l_v_patch))
-            INTO return_value;
+            l_v_lower_bound := ARRAY [-1, -1, -1];
+            l_v_upper_bound := l_v_low;
         WHEN '>'
         THEN
-            SELECT DISTINCT
-                pkg_id,
-                pkg_name,
-                pkg_v_major,
-                pkg_v_minor,
-                pkg_v_patch
-            FROM packages
-            WHERE pkg_name = p_schema_name
-                  AND (pkg_v_major > l_v_major
-                       OR (pkg_v_major = l_v_major
-                           AND pkg_v_minor > l_v_minor)
-                       OR (pkg_v_major = l_v_major
-                           AND pkg_v_minor = l_v_minor
-                           AND pkg_v_patch > l_v_patch))
-            INTO return_value;
+            l_v_lower_bound := l_v_high;
+            l_v_upper_bound := ARRAY [c_v_max + 1, c_v_max + 1, c_v_max + 1];
         WHEN '<='
         THEN
-            SELECT DISTINCT
-                pkg_id,
-                pkg_name,
-                pkg_v_major,
-                pkg_v_minor,
-                pkg_v_patch
-            FROM packages
-            WHERE pkg_name = p_schema_name
-                  AND (pkg_v_major <= l_v_major
-                       OR (pkg_v_major = l_v_major
-                           AND pkg_v_minor <= l_v_minor)
-                       OR (pkg_v_major = l_v_major
-                           AND pkg_v_minor = l_v_minor
-                           AND pkg_v_patch <= l_v_patch))
-            INTO return_value;
+            l_v_lower_bound := ARRAY [-1, -1, -1];
+            l_v_upper_bound := ARRAY [l_v_high [1], l_v_high [2], l_v_high [3] + 1];
         WHEN '>='
         THEN
-            SELECT DISTINCT
-                pkg_id,
-                pkg_name,
-                pkg_v_major,
-                pkg_v_minor,
-                pkg_v_patch
-            FROM packages
-            WHERE pkg_name = p_schema_name
-                  AND (pkg_v_major >= l_v_major
-                       OR (pkg_v_major = l_v_major
-                           AND pkg_v_minor >= l_v_minor)
-                       OR (pkg_v_major = l_v_major
-                           AND pkg_v_minor = l_v_minor
-                           AND pkg_v_patch >= l_v_patch))
-            INTO return_value;
+            l_v_lower_bound := ARRAY [l_v_low [1], l_v_low [2], l_v_low [3] - 1];
+            l_v_upper_bound := ARRAY [c_v_max + 1, c_v_max + 1, c_v_max + 1];
     ELSE
         RAISE EXCEPTION 'Invalid logical operand. Only <, >, =, <=, >=, = or no operand are allowed.'
         USING ERRCODE = '20000';
     END CASE;
 
+    -- the latest version within bounds. Row comparison is answered by index on name and version
+    SELECT
+        pkg_id,
+        pkg_name :: TEXT,
+        pkg_v_major,
+        pkg_v_minor,
+        pkg_v_patch
+    FROM packages
+    WHERE pkg_name = p_schema_name
+          AND (pkg_v_major, pkg_v_minor, pkg_v_patch) >
+              (l_v_lower_bound [1], l_v_lower_bound [2], l_v_lower_bound [3])
+          AND (pkg_v_major, pkg_v_minor, pkg_v_patch) <
+              (l_v_upper_bound [1], l_v_upper_bound [2], l_v_upper_bound [3])
+    ORDER BY pkg_v_major DESC, pkg_v_minor DESC, pkg_v_patch DESC
+    LIMIT 1
+    INTO return_value;
+
     RETURN return_value;
 
 END;
@@ -0,0 +1,60 @@
+CREATE OR REPLACE FUNCTION _get_executed_table_ddl(p_pkg_name          TEXT,
+                                                   p_pkg_subclass_name TEXT,
+                                                   p_pkg_v_major       INTEGER,
+                                                   p_pkg_v_minor       INTEGER DEFAULT 0,
+                                                   p_pkg_v_patch       INTEGER DEFAULT 0,
+                                                   p_pkg_v_pre         TEXT DEFAULT NULL)
+    RETURNS SETOF TEXT AS
+$BODY$
+---
+-- @description
+-- Returns names of all files with table ddl that have already been executed for a package
+--
+-- @param p_pkg_name
+-- package name
+--
+-- @param p_pkg_subclass_name
+-- package type: either version (with version suffix at the end of the name) or basic (without)
+--
+-- @returns
+-- Set of file names. Empty if package is not found
+---
+DECLARE
+    l_existing_pkg_id INTEGER;
+BEGIN
+
+    IF p_pkg_subclass_name = 'basic'
+    THEN
+        SELECT pkg_id
+        INTO l_existing_pkg_id
+        FROM packages
+        WHERE pkg_name = p_pkg_name
+              AND pkg_subclass IN (SELECT pkg_sc_id
+                                   FROM package_subclasses
+                                   WHERE pkg_sc_name = p_pkg_subclass_name);
+    ELSE
+        SELECT pkg_id
+        INTO l_existing_pkg_id
+        FROM packages
+        WHERE pkg_name = p_pkg_name
+              AND pkg_subclass IN (SELECT pkg_sc_id
+                                   FROM package_subclasses
+                                   WHERE pkg_sc_name = p_pkg_subclass_name)
+              AND pkg_v_major = p_pkg_v_major
+              AND (pkg_v_minor IS NULL OR pkg_v_minor = p_pkg_v_minor)
+              AND (pkg_v_patch IS NULL OR pkg_v_patch = p_pkg_v_patch)
+              AND (pkg_v_pre IS NULL OR pkg_v_pre = p_pkg_v_pre)
+              AND pkg_old_rev IS NULL;
+    END IF;
+
+    IF FOUND
+    THEN
+        RETURN QUERY
+        SELECT DISTINCT t_evo_file_name
+        FROM table_evolutions_log
+        WHERE t_evo_package = l_existing_pkg_id;
+    END IF;
+
+END;
+$BODY$
+LANGUAGE 'plpgsql' STABLE SECURITY DEFINER;
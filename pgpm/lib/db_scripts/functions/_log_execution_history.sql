@@ -0,0 +1,59 @@
+CREATE OR REPLACE FUNCTION _log_execution_history(p_dpl_ev_id          INTEGER,
+                                                  p_duration           DOUBLE PRECISION,
+                                                  p_script_types       TEXT [],
+                                                  p_file_names         TEXT [],
+                                                  p_durations          DOUBLE PRECISION [],
+                                                  p_bytes              BIGINT [],
+                                                  p_statements_counts  INTEGER [])
+    RETURNS VOID AS
+$BODY$
+---
+-- @description
+-- Stores duration and size of a deployment and of every script executed within it.
+-- Arrays are of the same length, n-th elements describe one script
+--
+-- @param p_dpl_ev_id
+-- Id of deployment event of the deployment
+--
+-- @param p_duration
+-- Duration of deployment in seconds
+--
+-- @param p_script_types
+-- Types of scripts (table, function, view, trigger)
+--
+-- @param p_file_names
+-- Keys of scripts (paths relative to the package for function, view and trigger scripts, file names otherwise)
+--
+-- @param p_durations
+-- Durations of execution of scripts in seconds
+--
+-- @param p_bytes
+-- Sizes of scripts in bytes
+--
+-- @param p_statements_counts
+-- Numbers of statements in scripts
+---
+BEGIN
+
+    INSERT INTO execution_history (exec_hist_dpl_ev_id, exec_hist_duration, exec_hist_scripts_count,
+                                   exec_hist_bytes, exec_hist_statements_count)
+        SELECT
+            p_dpl_ev_id,
+            p_duration,
+            coalesce(array_length(p_file_names, 1), 0),
+            (SELECT sum(l_bytes) FROM unnest(p_bytes) AS l_bytes),
+            (SELECT sum(l_statements_count) FROM unnest(p_statements_counts) AS l_statements_count);
+
+    INSERT INTO script_execution_history (sc_exec_hist_dpl_ev_id, sc_exec_hist_script_type, sc_exec_hist_file_name,
+                                          sc_exec_hist_duration, sc_exec_hist_bytes, sc_exec_hist_statements_count)
+        SELECT
+            p_dpl_ev_id,
+            p_script_types [l_i],
+            p_file_names [l_i],
+            p_durations [l_i],
+            p_bytes [l_i],
+            p_statements_counts [l_i]
+        FROM generate_subscripts(p_file_names, 1) AS l_i;
+END;
+$BODY$
+LANGUAGE 'plpgsql' VOLATILE SECURITY DEFINER;
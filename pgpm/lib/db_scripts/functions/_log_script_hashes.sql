@@ -0,0 +1,59 @@
+CREATE OR REPLACE FUNCTION _log_script_hashes(p_pkg_id       INTEGER,
+                                              p_script_types TEXT [],
+                                              p_file_names   TEXT [],
+                                              p_hashes       TEXT [],
+                                              p_reset        BOOLEAN DEFAULT FALSE)
+    RETURNS VOID AS
+$BODY$
+---
+-- @description
+-- Stores content hashes of deployed scripts of a package. Arrays are of the same length, n-th elements describe
+-- one script
+--
+-- @param p_pkg_id
+-- Related package id
+--
+-- @param p_script_types
+-- Types of scripts (function, view, trigger)
+--
+-- @param p_file_names
+-- Paths of scripts relative to the package
+--
+-- @param p_hashes
+-- Content hashes of scripts
+--
+-- @param p_reset
+-- If true, all hashes stored before for the package are removed (e.g. when schema was recreated)
+---
+BEGIN
+
+    IF p_reset
+    THEN
+        DELETE FROM script_hashes
+        WHERE s_hash_package = p_pkg_id;
+    END IF;
+
+    WITH scripts AS (
+        SELECT unnest(p_script_types) AS script_type,
+               unnest(p_file_names) AS file_name,
+               unnest(p_hashes) AS script_hash
+    ), updated_scripts AS (
+        UPDATE script_hashes
+        SET s_hash_value    = scripts.script_hash,
+            s_hash_modified = NOW()
+        FROM scripts
+        WHERE s_hash_package = p_pkg_id
+              AND s_hash_script_type = scripts.script_type
+              AND s_hash_file_name = scripts.file_name
+        RETURNING s_hash_script_type, s_hash_file_name
+    )
+    INSERT INTO script_hashes (s_hash_package, s_hash_script_type, s_hash_file_name, s_hash_value)
+    SELECT p_pkg_id, scripts.script_type, scripts.file_name, scripts.script_hash
+    FROM scripts
+    WHERE NOT EXISTS (SELECT 1
+                      FROM updated_scripts
+                      WHERE updated_scripts.s_hash_script_type = scripts.script_type
+                            AND updated_scripts.s_hash_file_name = scripts.file_name);
+END;
+$BODY$
+LANGUAGE 'plpgsql' VOLATILE SECURITY DEFINER;
@@ -0,0 +1,24 @@
+CREATE OR REPLACE FUNCTION _log_table_evolutions(p_t_evo_file_names TEXT [], p_t_evo_package INTEGER)
+    RETURNS VOID AS
+$BODY$
+---
+-- @description
+-- Adds information about executed table evolution scripts to log table in one statement
+--
+-- @param p_t_evo_file_names
+-- File names with executed statements.
+--
+-- @param p_t_evo_package
+-- Related package id
+---
+BEGIN
+
+    INSERT INTO table_evolutions_log (t_evo_file_name, t_evo_package)
+    SELECT
+        t_evo_file_name,
+        p_t_evo_package
+    FROM unnest(p_t_evo_file_names) WITH ORDINALITY AS file_names(t_evo_file_name, t_evo_order)
+    ORDER BY t_evo_order;
+END;
+$BODY$
+LANGUAGE 'plpgsql' VOLATILE SECURITY DEFINER;
@@ -0,0 +1,52 @@
+CREATE OR REPLACE FUNCTION _prune_ddl_changes_log(p_older_than INTERVAL,
+                                                  p_batch_size INTEGER DEFAULT 10000,
+                                                  p_archive    BOOLEAN DEFAULT TRUE)
+    RETURNS INTEGER AS
+$BODY$
+---
+-- @description
+-- Removes one batch of old changes from DDL changes log. To be called until it returns 0,
+-- committing after every call so that locks and WAL of every batch stay small
+--
+-- @param p_older_than
+-- changes created earlier than that long ago are removed
+--
+-- @param p_batch_size
+-- max number of changes removed in one call
+--
+-- @param p_archive
+-- whether removed changes are moved to ddl_changes_log_archive table
+--
+-- @returns
+-- number of removed changes
+---
+DECLARE
+    return_value INTEGER;
+BEGIN
+
+    WITH pruned_changes AS (
+        DELETE FROM ddl_changes_log
+        WHERE ddl_change_id IN (
+            SELECT ddl_change_id
+            FROM ddl_changes_log
+            WHERE ddl_change_created < now() - p_older_than
+            ORDER BY ddl_change_created
+            LIMIT p_batch_size
+        )
+        RETURNING ddl_change_id, ddl_change_user, ddl_change, ddl_change_txid, ddl_change_created
+    ), archived_changes AS (
+        INSERT INTO ddl_changes_log_archive (ddl_change_id, ddl_change_user, ddl_change, ddl_change_txid,
+                                             ddl_change_created)
+        SELECT ddl_change_id, ddl_change_user, ddl_change, ddl_change_txid, ddl_change_created
+        FROM pruned_changes
+        WHERE p_archive
+    )
+    SELECT count(*)
+    FROM pruned_changes
+    INTO return_value;
+
+    RETURN return_value;
+
+END;
+$BODY$
+LANGUAGE 'plpgsql' VOLATILE SECURITY DEFINER;
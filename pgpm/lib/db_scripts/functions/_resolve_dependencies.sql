@@ -0,0 +1,83 @@
+CREATE OR REPLACE FUNCTION _resolve_dependencies(p_pkg_names TEXT [], p_pkg_v_reqs TEXT [])
+    RETURNS TABLE(pkg_name    TEXT,
+                  pkg_v_req   TEXT,
+                  pkg_id      INTEGER,
+                  dep_level   INTEGER,
+                  is_conflict BOOLEAN) AS
+$BODY$
+---
+-- @description
+-- Resolves all requirements of a package at once: finds packages satisfying direct requirements
+-- (see _find_schema for version notation) and walks their dependencies recursively
+--
+-- @param p_pkg_names
+-- Names of required packages
+--
+-- @param p_pkg_v_reqs
+-- Version requirements, one per package name
+--
+-- @returns
+-- Direct requirements (dep_level 0, pkg_id is NULL if requirement is not satisfied) followed by
+-- transitive dependencies (dep_level > 0, pkg_v_req is NULL).
+-- is_conflict is true if different versions of the same package are required (old revisions are not counted)
+---
+WITH RECURSIVE requirements AS (
+    SELECT
+        r.pkg_name,
+        r.pkg_v_req,
+        f.pkg_id
+    FROM unnest(p_pkg_names, p_pkg_v_reqs) AS r(pkg_name, pkg_v_req),
+        LATERAL _find_schema(r.pkg_name, r.pkg_v_req)
+            AS f(pkg_id INTEGER, pkg_name TEXT, pkg_v_major INTEGER, pkg_v_minor INTEGER, pkg_v_patch INTEGER)
+), dependencies_closure(pkg_id, dep_level, dep_path) AS (
+    SELECT
+        requirements.pkg_id,
+        0,
+        ARRAY [requirements.pkg_id]
+    FROM requirements
+    WHERE requirements.pkg_id IS NOT NULL
+    UNION ALL
+    SELECT
+        package_dependencies.pkg_link_dep_id,
+        dependencies_closure.dep_level + 1,
+        dependencies_closure.dep_path || package_dependencies.pkg_link_dep_id
+    FROM dependencies_closure
+        JOIN package_dependencies ON package_dependencies.pkg_link_core_id = dependencies_closure.pkg_id
+    WHERE NOT package_dependencies.pkg_link_dep_id = ANY (dependencies_closure.dep_path)
+), resolved_packages AS (
+    SELECT
+        packages.pkg_id,
+        packages.pkg_name :: TEXT AS pkg_name,
+        packages.pkg_old_rev IS NOT NULL AS is_old_rev,
+        min(dependencies_closure.dep_level) AS dep_level
+    FROM dependencies_closure
+        JOIN packages ON packages.pkg_id = dependencies_closure.pkg_id
+    GROUP BY packages.pkg_id, packages.pkg_name, packages.pkg_old_rev
+), conflicting_packages AS (
+    -- schemas renamed in moderate mode keep their package ids, so packages deployed before still depend on them
+    -- while the same version is required directly. Such old revisions are not considered conflicting
+    SELECT resolved_packages.pkg_name
+    FROM resolved_packages
+    WHERE NOT resolved_packages.is_old_rev
+    GROUP BY resolved_packages.pkg_name
+    HAVING count(*) > 1
+)
+SELECT
+    requirements.pkg_name,
+    requirements.pkg_v_req,
+    requirements.pkg_id,
+    0,
+    requirements.pkg_name IN (SELECT conflicting_packages.pkg_name FROM conflicting_packages)
+FROM requirements
+UNION ALL
+SELECT
+    resolved_packages.pkg_name,
+    NULL,
+    resolved_packages.pkg_id,
+    resolved_packages.dep_level,
+    resolved_packages.pkg_name IN (SELECT conflicting_packages.pkg_name FROM conflicting_packages)
+FROM resolved_packages
+WHERE resolved_packages.dep_level > 0
+ORDER BY 4, 1;
+$BODY$
+LANGUAGE sql STABLE SECURITY DEFINER;
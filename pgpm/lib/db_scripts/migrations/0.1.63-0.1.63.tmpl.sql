@@ -0,0 +1,20 @@
+/*
+    Migration script from version 0.1.63 to 0.1.63 (or higher if tool doesn't find other migration scripts)
+ */
+CREATE TABLE IF NOT EXISTS {schema_name}.script_hashes
+(
+    s_hash_id SERIAL NOT NULL,
+    s_hash_package INTEGER NOT NULL,
+    s_hash_script_type TEXT NOT NULL,
+    s_hash_file_name TEXT NOT NULL,
+    s_hash_value TEXT NOT NULL,
+    s_hash_modified TIMESTAMP DEFAULT NOW(),
+    CONSTRAINT script_hashes_pkey PRIMARY KEY (s_hash_id),
+    CONSTRAINT script_hashes_package_fkey FOREIGN KEY (s_hash_package) REFERENCES {schema_name}.packages (pkg_id),
+    CONSTRAINT script_hashes_ukey UNIQUE (s_hash_package, s_hash_script_type, s_hash_file_name)
+);
+COMMENT ON TABLE {schema_name}.script_hashes IS
+    'Content hashes of function, view and trigger scripts last deployed for a package.
+     Scripts with unchanged hashes are not redeployed to an existing schema';
+COMMENT ON COLUMN {schema_name}.script_hashes.s_hash_file_name IS
+    'Path of the script relative to the package acts as a key together with package and script type';
@@ -0,0 +1,12 @@
+/*
+    Migration script from version 0.1.67 to 0.1.67 (or higher if tool doesn't find other migration scripts)
+ */
+DO
+$$BEGIN
+    -- package versions are looked up by name and version (see _find_schema)
+    IF to_regclass('{schema_name}.packages_name_version_idx') IS NULL
+    THEN
+        CREATE INDEX packages_name_version_idx
+            ON {schema_name}.packages (pkg_name, pkg_v_major, pkg_v_minor, pkg_v_patch);
+    END IF;
+END$$;
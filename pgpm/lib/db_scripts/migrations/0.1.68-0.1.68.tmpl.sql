@@ -0,0 +1,28 @@
+/*
+    Migration script from version 0.1.68 to 0.1.68 (or higher if tool doesn't find other migration scripts)
+ */
+-- Indexes are built within the upgrade transaction, which blocks inserts into ddl_changes_log and so every DDL
+-- statement in the DB until the build is over. With a big log, build them CONCURRENTLY before upgrading
+-- (see README), existing indexes are not built again
+DO
+$$BEGIN
+    -- every DDL statement looks up whether it's already logged in the transaction (see _log_ddl_change)
+    IF to_regclass('{schema_name}.ddl_changes_log_txid_md5_idx') IS NULL
+    THEN
+        CREATE INDEX ddl_changes_log_txid_md5_idx
+            ON {schema_name}.ddl_changes_log (ddl_change_txid, md5(ddl_change));
+    END IF;
+    -- old changes are pruned by creation time (see _prune_ddl_changes_log)
+    IF to_regclass('{schema_name}.ddl_changes_log_created_idx') IS NULL
+    THEN
+        CREATE INDEX ddl_changes_log_created_idx
+            ON {schema_name}.ddl_changes_log (ddl_change_created);
+    END IF;
+END$$;
+
+CREATE TABLE IF NOT EXISTS {schema_name}.ddl_changes_log_archive
+(
+    LIKE {schema_name}.ddl_changes_log
+);
+COMMENT ON TABLE {schema_name}.ddl_changes_log_archive IS
+    'Changes of DDL pruned from ddl_changes_log';
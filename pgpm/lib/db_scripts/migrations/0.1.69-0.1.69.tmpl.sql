@@ -0,0 +1,18 @@
+/*
+    Migration script from version 0.1.69 to 0.1.69 (or higher if tool doesn't find other migration scripts)
+ */
+CREATE TABLE IF NOT EXISTS {schema_name}.ddl_change_notifications
+(
+    ddl_ntf_txid BIGINT NOT NULL DEFAULT txid_current(),
+    CONSTRAINT ddl_change_notifications_pkey PRIMARY KEY (ddl_ntf_txid)
+);
+COMMENT ON TABLE {schema_name}.ddl_change_notifications IS
+    'Transactions with DDL changes to be notified about on commit when pgpm.ddl_change_notify is set to transaction.
+     Rows are removed once notification is sent';
+
+DROP TRIGGER IF EXISTS ddl_change_notify_trigger ON {schema_name}.ddl_change_notifications;
+CREATE CONSTRAINT TRIGGER ddl_change_notify_trigger
+AFTER INSERT ON {schema_name}.ddl_change_notifications
+DEFERRABLE INITIALLY DEFERRED
+FOR EACH ROW
+EXECUTE PROCEDURE {schema_name}._notify_ddl_changes();
@@ -0,0 +1,54 @@
+/*
+    Migration script from version 0.1.70 to 0.1.70 (or higher if tool doesn't find other migration scripts)
+ */
+CREATE TABLE IF NOT EXISTS {schema_name}.execution_history
+(
+    exec_hist_dpl_ev_id INTEGER NOT NULL,
+    exec_hist_duration DOUBLE PRECISION NOT NULL,
+    exec_hist_scripts_count INTEGER NOT NULL,
+    exec_hist_bytes BIGINT,
+    exec_hist_statements_count INTEGER,
+    exec_hist_created TIMESTAMP DEFAULT NOW(),
+    CONSTRAINT execution_history_pkey PRIMARY KEY (exec_hist_dpl_ev_id),
+    CONSTRAINT execution_history_dpl_ev_fkey FOREIGN KEY (exec_hist_dpl_ev_id)
+        REFERENCES {schema_name}.deployment_events (dpl_ev_id)
+);
+COMMENT ON TABLE {schema_name}.execution_history IS
+    'Duration and size of deployments. One row per deployment event';
+COMMENT ON COLUMN {schema_name}.execution_history.exec_hist_duration IS
+    'Duration of deployment in seconds (up to commit)';
+
+CREATE TABLE IF NOT EXISTS {schema_name}.script_execution_history
+(
+    sc_exec_hist_id SERIAL NOT NULL,
+    sc_exec_hist_dpl_ev_id INTEGER NOT NULL,
+    sc_exec_hist_script_type TEXT NOT NULL,
+    sc_exec_hist_file_name TEXT NOT NULL,
+    sc_exec_hist_duration DOUBLE PRECISION NOT NULL,
+    sc_exec_hist_bytes BIGINT,
+    sc_exec_hist_statements_count INTEGER,
+    CONSTRAINT script_execution_history_pkey PRIMARY KEY (sc_exec_hist_id),
+    CONSTRAINT script_execution_history_dpl_ev_fkey FOREIGN KEY (sc_exec_hist_dpl_ev_id)
+        REFERENCES {schema_name}.execution_history (exec_hist_dpl_ev_id)
+);
+COMMENT ON TABLE {schema_name}.script_execution_history IS
+    'Duration and size of every script executed within a deployment';
+COMMENT ON COLUMN {schema_name}.script_execution_history.sc_exec_hist_file_name IS
+    'File name relative to package sources. Scripts executed in one batch are recorded one row per file';
+COMMENT ON COLUMN {schema_name}.script_execution_history.sc_exec_hist_duration IS
+    'Duration of execution in seconds';
+
+DO
+$$BEGIN
+    IF to_regclass('{schema_name}.script_execution_history_dpl_ev_idx') IS NULL
+    THEN
+        CREATE INDEX script_execution_history_dpl_ev_idx
+            ON {schema_name}.script_execution_history (sc_exec_hist_dpl_ev_id);
+    END IF;
+    -- history of a script is looked up to trend its duration over time
+    IF to_regclass('{schema_name}.script_execution_history_file_name_idx') IS NULL
+    THEN
+        CREATE INDEX script_execution_history_file_name_idx
+            ON {schema_name}.script_execution_history (sc_exec_hist_script_type, sc_exec_hist_file_name);
+    END IF;
+END$$;
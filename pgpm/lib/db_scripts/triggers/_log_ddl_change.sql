@@ -4,11 +4,15 @@ $BODY$
 ---
 -- @description
 -- Logs any DDL changes to the DB
+-- and notifies external channels either on every change (default) or once per transaction
+-- if pgpm.ddl_change_notify setting is set to transaction (see _notify_ddl_changes)
 --
 ---
 DECLARE
     l_current_query TEXT;
     l_txid BIGINT;
+    l_notify_mode TEXT;
+    l_change_count INTEGER;
 BEGIN
 
     SELECT current_query() INTO l_current_query;
@@ -18,12 +22,32 @@ BEGIN
     WHERE
         NOT EXISTS (
             SELECT ddl_change_txid, ddl_change FROM _pgpm.ddl_changes_log
-            WHERE ddl_change_txid = l_txid AND ddl_change = l_current_query
+            WHERE ddl_change_txid = l_txid AND md5(ddl_change) = md5(l_current_query)
+                  AND ddl_change = l_current_query
         );
 
-    -- Notify external channels of ddl change
-    PERFORM pg_notify('ddl_change', "session_user"());
+    -- custom settings that were never set don't exist. They are looked up in pg_settings
+    -- as current_setting would raise an error and catching it costs a subtransaction per DDL statement
+    SELECT coalesce(min(setting), 'statement') INTO l_notify_mode
+    FROM pg_settings
+    WHERE name = 'pgpm.ddl_change_notify';
+
+    IF l_notify_mode = 'transaction'
+    THEN
+        -- count is local to transaction
+        SELECT coalesce(nullif(min(setting), ''), '0') :: INTEGER + 1 INTO l_change_count
+        FROM pg_settings
+        WHERE name = 'pgpm.ddl_change_count';
+        PERFORM set_config('pgpm.ddl_change_count', l_change_count :: TEXT, TRUE);
+        IF l_change_count = 1
+        THEN
+            INSERT INTO _pgpm.ddl_change_notifications (ddl_ntf_txid) VALUES (l_txid);
+        END IF;
+    ELSE
+        -- Notify external channels of ddl change
+        PERFORM pg_notify('ddl_change', "session_user"());
+    END IF;
 
 END;
 $BODY$
-LANGUAGE 'plpgsql' VOLATILE SECURITY DEFINER;
\ No newline at end of file
+LANGUAGE 'plpgsql' VOLATILE SECURITY DEFINER;
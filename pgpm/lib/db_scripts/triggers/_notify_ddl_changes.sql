@@ -0,0 +1,25 @@
+CREATE OR REPLACE FUNCTION _notify_ddl_changes()
+    RETURNS TRIGGER AS
+$BODY$
+---
+-- @description
+-- Notifies external channels of all DDL changes of a transaction at once. Called on commit
+-- for transactions where DDL changes were logged with pgpm.ddl_change_notify set to transaction
+--
+---
+BEGIN
+
+    PERFORM pg_notify('ddl_change', json_build_object(
+        'user', "session_user"(),
+        'txid', NEW.ddl_ntf_txid,
+        'count', current_setting('pgpm.ddl_change_count') :: INTEGER
+    ) :: TEXT);
+
+    DELETE FROM _pgpm.ddl_change_notifications
+    WHERE ddl_ntf_txid = NEW.ddl_ntf_txid;
+
+    RETURN NULL;
+
+END;
+$BODY$
+LANGUAGE 'plpgsql' VOLATILE SECURITY DEFINER;
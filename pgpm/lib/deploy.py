@@ -1,41 +1,45 @@
-import json
 import logging
 import pkgutil
-import distutils.version
 import sys
-import collections
 
 import os
 import psycopg2
-import re
-import sqlparse
 
 import pgpm.lib.abstract_deploy
+import pgpm.lib.estimate
+import pgpm.lib.locks
+import pgpm.lib.plan
 import pgpm.lib.utils
 import pgpm.lib.utils.db
 import pgpm.lib.utils.misc
-import pgpm.lib.version
+import pgpm.lib.utils.sql
+import pgpm.lib.utils.timing
 import pgpm.lib.utils.config
-import pgpm.lib.utils.vcs
 
 
 class DeploymentManager(pgpm.lib.abstract_deploy.AbstractDeploymentManager):
     """
     Class that will manage db code deployments
     """
+    PLAN_OUTPUT_CODE_WOULD_FAIL = 2
+
     def __init__(self, connection_string, source_code_path=None, config_path=None, config_dict=None, config_object=None,
-                 pgpm_schema_name='_pgpm', logger=None):
+                 pgpm_schema_name='_pgpm', logger=None, transaction_pooling=False, connection_pool=None):
         """
-        initialises the manager and connects to the DB
+        initialises the manager
         :param connection_string: connection string consumable by DBAPI 2.0
         :param source_code_path: path to where package is
         :param config_path: string or array to where config/configs are
         :param config_dict: dictionary with config
         :param config_object: SchemaConfiguration object
         :param logger: logger object
+        :param transaction_pooling: DB is connected through transaction-mode pooler. Auto commit deployments
+        are not possible then
+        :param connection_pool: ConnectionPool to take connections from
         """
 
-        super(DeploymentManager, self).__init__(connection_string, pgpm_schema_name, logger)
+        super(DeploymentManager, self).__init__(connection_string, pgpm_schema_name, logger, transaction_pooling,
+                                                connection_pool)
         if source_code_path:
             self._source_code_path = source_code_path
         elif config_path:
@@ -47,10 +51,13 @@ class DeploymentManager(pgpm.lib.abstract_deploy.AbstractDeploymentManager):
             self._config = pgpm.lib.utils.config.SchemaConfiguration(config_path, config_dict, self._source_code_path)
         self._logger.debug('Loading project configuration...')
 
+    @pgpm.lib.abstract_deploy.release_connection_on_error
     def deploy_schema_to_db(self, mode='safe', files_deployment=None, vcs_ref=None, vcs_link=None,
                             issue_ref=None, issue_link=None, compare_table_scripts_as_int=False,
                             config_path=None, config_dict=None, config_object=None, source_code_path=None,
-                            auto_commit=False):
+                            auto_commit=False, plan=None, force=False, vcs_diff=False, batch_size=0,
+                            block_lock_risks=False, big_table_rows=pgpm.lib.locks.DEFAULT_BIG_TABLE_ROWS,
+                            notify_ddl_per_transaction=False):
         """
         Deploys schema
         :param files_deployment: if specific script to be deployed, only find them
@@ -65,6 +72,18 @@ class DeploymentManager(pgpm.lib.abstract_deploy.AbstractDeploymentManager):
         :param config_object:
         :param source_code_path:
         :param auto_commit:
+        :param plan: precompiled DeploymentPlan. If set, scripts are not collected from sources again
+        and files_deployment, compare_table_scripts_as_int and config parameters are ignored
+        :param force: deploy function, view and trigger scripts even if they haven't changed since last deployment
+        :param vcs_diff: deploy only files changed in git between commit last deployed to the DB and HEAD.
+        files_deployment is ignored then
+        :param batch_size: if set, function, view and trigger scripts are joined into batches of up to this size
+        (in characters) and every batch is sent to the DB at once. Ignored in auto commit mode
+        :param block_lock_risks: don't deploy if table scripts to execute have statements of high lock risk
+        (see pgpm.lib.locks.get_risk). Otherwise they are only warned about
+        :param big_table_rows: number of rows from which a table is considered big by lock analysis
+        :param notify_ddl_per_transaction: DDL changes of the deployment are notified about once on commit
+        (with JSON payload of user, txid and count of changes) instead of once per statement with user name as payload
         :return: dictionary of the following format:
             {
                 code: 0 if all fine, otherwise something else,
@@ -77,21 +96,90 @@ class DeploymentManager(pgpm.lib.abstract_deploy.AbstractDeploymentManager):
                 view_scripts_deployed: list of view files deployed
                 trigger_scripts_requested: list of trigger files requested for deployment
                 trigger_scripts_deployed: list of trigger files deployed
+                function_scripts_skipped: list of function files not deployed as they haven't changed
+                view_scripts_skipped: list of view files not deployed as they haven't changed
+                trigger_scripts_skipped: list of trigger files not deployed as they haven't changed
                 table_scripts_requested: list of table files requested for deployment
                 table_scripts_deployed: list of table files deployed
                 requested_files_count: count of requested files to deploy
                 deployed_files_count: count of deployed files
+                skipped_files_count: count of files not deployed as they haven't changed
+                lock_risks_count: count of statements of table scripts with medium or high lock risk
+                timings: durations of deployment phases and of executed scripts in seconds
+                (see Timings.to_dict). Durations of deployment and scripts are stored in execution history as well.
+                Phases of plan compilation are included only if plan was compiled by this call (e.g. with vcs_diff)
             }
         :rtype: dict
         """
 
+        if not plan:
+            # set source code path if exists
+            self._source_code_path = self._source_code_path or source_code_path
+
+            # set configuration if either of config_path, config_dict, config_object are set.
+            # Otherwise use configuration from class initialisation
+            if config_object:
+                self._config = config_object
+            elif config_path or config_dict:
+                self._config = pgpm.lib.utils.config.SchemaConfiguration(config_path, config_dict,
+                                                                         self._source_code_path)
+
+            if vcs_diff:
+                files_deployment = self._get_vcs_changed_files()
+                if not files_deployment:
+                    self._release_connection()
+                    return self._get_empty_deploy_result()
+
+            plan = self.compile_plan(files_deployment, compare_table_scripts_as_int, vcs_ref)
+            compile_timings = plan.timings
+        else:
+            # precompiled plan may be deployed to many DBs so its compilation is reported by the caller once
+            compile_timings = None
+
+        deploy_result = self.deploy_plan_to_db(plan, mode=mode, vcs_ref=vcs_ref, vcs_link=vcs_link,
+                                               issue_ref=issue_ref, issue_link=issue_link, auto_commit=auto_commit,
+                                               force=force, batch_size=batch_size, block_lock_risks=block_lock_risks,
+                                               big_table_rows=big_table_rows,
+                                               notify_ddl_per_transaction=notify_ddl_per_transaction)
+        if compile_timings:
+            timings = pgpm.lib.utils.timing.Timings()
+            timings.update(compile_timings)
+            for name, seconds in deploy_result['timings']['phases'].items():
+                timings.add_phase(name, seconds)
+            deploy_result['timings']['phases'] = timings.phases
+            deploy_result['timings']['total'] = timings.total
+        return deploy_result
+
+    def compile_plan(self, files_deployment=None, compare_table_scripts_as_int=False, vcs_ref=None):
+        """
+        Collects scripts of the package the manager was initialised with and puts them in execution order
+        :param files_deployment: if specific script to be deployed, only find them
+        :param compare_table_scripts_as_int:
+        :param vcs_ref:
+        :return: DeploymentPlan
+        """
+        return pgpm.lib.plan.DeploymentPlan.compile(self._config, self._source_code_path, files_deployment,
+                                                    compare_table_scripts_as_int, vcs_ref, self._logger)
+
+    @pgpm.lib.abstract_deploy.release_connection_on_error
+    def deploy_plan_to_db(self, plan, mode='safe', vcs_ref=None, vcs_link=None, issue_ref=None, issue_link=None,
+                          auto_commit=False, force=False, batch_size=0, block_lock_risks=False,
+                          big_table_rows=pgpm.lib.locks.DEFAULT_BIG_TABLE_ROWS, notify_ddl_per_transaction=False):
+        """
+        Deploys precompiled plan to the DB. See deploy_schema_to_db for parameters and return value
+        :param plan: DeploymentPlan
+        :rtype: dict
+        """
+        self._config = plan.config
+        files_deployment = plan.files_deployment
+        vcs_ref = vcs_ref or plan.vcs_ref
+
+        deployment_start = pgpm.lib.utils.timing.clock()
+        timings = pgpm.lib.utils.timing.Timings()
+
         return_value = {}
-        if files_deployment:
-            return_value['function_scripts_requested'] = files_deployment
-            return_value['type_scripts_requested'] = []
-            return_value['view_scripts_requested'] = []
-            return_value['trigger_scripts_requested'] = []
-            return_value['table_scripts_requested'] = []
+        for script_type in pgpm.lib.plan.DeploymentPlan.SCRIPT_TYPES:
+            return_value['{0}_scripts_requested'.format(script_type)] = plan.get_requested_files(script_type)
 
         if auto_commit:
             if mode == 'safe' and files_deployment:
@@ -101,89 +189,24 @@ class DeploymentManager(pgpm.lib.abstract_deploy.AbstractDeploymentManager):
                                    "deployments and in safe mode for security reasons")
                 raise ValueError("Auto commit deployment can only be done with file "
                                  "deployments and in safe mode for security reasons")
+            if self._transaction_pooling:
+                self._logger.error("Auto commit deployment can't be done in transaction pooling mode "
+                                   "as settings of deployment are applied within one transaction")
+                raise ValueError("Auto commit deployment can't be done in transaction pooling mode "
+                                 "as settings of deployment are applied within one transaction")
 
-        # set source code path if exists
-        self._source_code_path = self._source_code_path or source_code_path
-
-        # set configuration if either of config_path, config_dict, config_object are set.
-        # Otherwise use configuration from class initialisation
-        if config_object:
-            self._config = config_object
-        elif config_path or config_dict:
-            self._config = pgpm.lib.utils.config.SchemaConfiguration(config_path, config_dict, self._source_code_path)
-
-        # Check if in git repo
-        if not vcs_ref:
-            if pgpm.lib.utils.vcs.is_git_directory(self._source_code_path):
-                vcs_ref = pgpm.lib.utils.vcs.get_git_revision_hash(self._source_code_path)
-                self._logger.debug('commit reference to be deployed is {0}'.format(vcs_ref))
-            else:
-                self._logger.debug('Folder is not a known vcs repository')
-
-        self._logger.debug('Configuration of package {0} of version {1} loaded successfully.'
-                           .format(self._config.name, self._config.version.raw))  # TODO: change to to_string once discussed
-        # .format(self._config.name, self._config.version.to_string()))
-
-        # Get scripts
-        type_scripts_dict = self._get_scripts(self._config.types_path, files_deployment,
-                                              "types", self._source_code_path)
-        if not files_deployment:
-            return_value['type_scripts_requested'] = [key for key in type_scripts_dict]
-
-        function_scripts_dict = self._get_scripts(self._config.functions_path, files_deployment,
-                                                  "functions", self._source_code_path)
-        if not files_deployment:
-            return_value['function_scripts_requested'] = [key for key in function_scripts_dict]
-
-        view_scripts_dict = self._get_scripts(self._config.views_path, files_deployment,
-                                              "views", self._source_code_path)
-        if not files_deployment:
-            return_value['view_scripts_requested'] = [key for key in view_scripts_dict]
-
-        trigger_scripts_dict = self._get_scripts(self._config.triggers_path, files_deployment,
-                                                 "triggers", self._source_code_path)
-        if not files_deployment:
-            return_value['trigger_scripts_requested'] = [key for key in trigger_scripts_dict]
-
-        # before with table scripts only file name was an identifier. Now whole relative path the file
-        # (relative to config.json)
-        # table_scripts_dict_denormalised = self._get_scripts(self._config.tables_path, files_deployment,
-        #                                                     "tables", self._source_code_path)
-        # table_scripts_dict = {os.path.split(k)[1]: v for k, v in table_scripts_dict_denormalised.items()}
-        table_scripts_dict = self._get_scripts(self._config.tables_path, files_deployment,
-                                               "tables", self._source_code_path)
-        if not files_deployment:
-            return_value['table_scripts_requested'] = [key for key in table_scripts_dict]
-
-        if self._conn.closed:
-            self._conn = psycopg2.connect(self._connection_string, connection_factory=pgpm.lib.utils.db.MegaConnection)
+        timings.start_phase('connect')
         cur = self._conn.cursor()
 
         # be cautious, dangerous thing
         if auto_commit:
             self._conn.autocommit = True
 
-        # Check if DB is pgpm enabled
-        if not pgpm.lib.utils.db.SqlScriptsHelper.schema_exists(cur, self._pgpm_schema_name):
-            self._logger.error('Can\'t deploy schemas to DB where pgpm was not installed. '
-                               'First install pgpm by running pgpm install')
-            self._conn.close()
-            sys.exit(1)
+        # Pre-deployment checks are answered from catalog snapshot
+        timings.start_phase('pre_checks')
+        catalog = self._get_catalog()
 
-        # check installed version of _pgpm schema.
-        pgpm_v_db_tuple = pgpm.lib.utils.db.SqlScriptsHelper.get_pgpm_db_version(cur, self._pgpm_schema_name)
-        pgpm_v_db = distutils.version.StrictVersion(".".join(pgpm_v_db_tuple))
-        pgpm_v_script = distutils.version.StrictVersion(pgpm.lib.version.__version__)
-        if pgpm_v_script > pgpm_v_db:
-            self._logger.error('{0} schema version is outdated. Please run pgpm install --upgrade first.'
-                               .format(self._pgpm_schema_name))
-            self._conn.close()
-            sys.exit(1)
-        elif pgpm_v_script < pgpm_v_db:
-            self._logger.error('Deployment script\'s version is lower than the version of {0} schema '
-                               'installed in DB. Update pgpm script first.'.format(self._pgpm_schema_name))
-            self._conn.close()
-            sys.exit(1)
+        self._check_pgpm_schema(catalog)
 
         # Resolve dependencies
         list_of_deps_ids = []
@@ -194,64 +217,90 @@ class DeploymentManager(pgpm.lib.abstract_deploy.AbstractDeploymentManager):
                 self._logger.error('There are unresolved dependencies. Deploy the following package(s) and try again:')
                 for unresolved_pkg in _list_of_unresolved_deps:
                     self._logger.error('{0}'.format(unresolved_pkg))
-                self._conn.close()
+                self._release_connection()
                 sys.exit(1)
 
+        # Table scripts are analysed for locks they take before anything is changed.
+        # statement_timeout is off during deployment so heavy locks on big tables could block traffic for long
+        timings.start_phase('lock_analysis')
+        schema_name = self._get_schema_name()
+        table_scripts = []
+        executed_table_ddl = set()
+        if plan.get_scripts('table'):
+            if mode != 'unsafe':
+                executed_table_ddl = self._get_executed_table_ddl(cur)
+            table_scripts = [(key, script_source.read()) for key, script_source in plan.get_scripts('table')
+                             if key not in executed_table_ddl]
+        is_schema_recreated = self._config.scope == pgpm.lib.utils.config.SchemaConfiguration.SCHEMA_SCOPE and \
+            not files_deployment and (mode in ('moderate', 'unsafe') or not catalog.schema_exists(schema_name))
+        lock_risks = [lock_risk for lock_risk in
+                      self._analyze_table_locks(cur, table_scripts, schema_name, is_schema_recreated, big_table_rows)
+                      if lock_risk['risk'] != pgpm.lib.locks.RISK_LOW]
+        for lock_risk in lock_risks:
+            self._logger.warning(pgpm.lib.locks.format_lock_risk(lock_risk))
+        high_lock_risks_count = len([lock_risk for lock_risk in lock_risks
+                                     if lock_risk['risk'] == pgpm.lib.locks.RISK_HIGH])
+        if block_lock_risks and high_lock_risks_count:
+            self._logger.error('Deployment is blocked as {0} statement(s) of table scripts have high lock risk. '
+                               'Change the scripts or rerun without blocking on lock risks'
+                               .format(high_lock_risks_count))
+            self._release_connection()
+            sys.exit(1)
+        return_value['lock_risks_count'] = len(lock_risks)
+
         # Prepare and execute preamble
+        timings.start_phase('preamble')
         _deployment_script_preamble = pkgutil.get_data('pgpm', 'lib/db_scripts/deploy_prepare_config.sql')
+        if notify_ddl_per_transaction:
+            # DDL changes of the deployment are notified about once on commit instead of once per statement
+            _deployment_script_preamble += b'\nSET pgpm.ddl_change_notify = transaction;'
         self._logger.debug('Executing a preamble to deployment statement')
-        cur.execute(_deployment_script_preamble)
+        cur.execute(self._prepare_settings_script(_deployment_script_preamble))
 
         # Get schema name from project configuration
-        schema_name = ''
+        timings.start_phase('schema')
         if self._config.scope == pgpm.lib.utils.config.SchemaConfiguration.SCHEMA_SCOPE:
-            if self._config.subclass == 'versioned':
-                schema_name = '{0}_{1}'.format(self._config.name, self._config.version.raw)
-
+            if self._config.subclass == 'versioned' or files_deployment:
                 self._logger.debug('Schema {0} will be updated'.format(schema_name))
-            elif self._config.subclass == 'basic':
-                schema_name = '{0}'.format(self._config.name)
-                if not files_deployment:
-                    self._logger.debug('Schema {0} will be created/replaced'.format(schema_name))
-                else:
-                    self._logger.debug('Schema {0} will be updated'.format(schema_name))
+            else:
+                self._logger.debug('Schema {0} will be created/replaced'.format(schema_name))
 
-        # Create schema or update it if exists (if not in production mode) and set search path
+        # Create schema or update it if exists (if not in production mode) and set search path.
+        # Scripts unchanged since last deployment are skipped only if existing schema is updated
+        is_schema_reused = True
         if files_deployment:  # if specific scripts to be deployed
             if self._config.scope == pgpm.lib.utils.config.SchemaConfiguration.SCHEMA_SCOPE:
-                if not pgpm.lib.utils.db.SqlScriptsHelper.schema_exists(cur, schema_name):
+                if not catalog.schema_exists(schema_name):
                     self._logger.error('Can\'t deploy scripts to schema {0}. Schema doesn\'t exist in database'
                                        .format(schema_name))
-                    self._conn.close()
+                    self._release_connection()
                     sys.exit(1)
                 else:
                     pgpm.lib.utils.db.SqlScriptsHelper.set_search_path(cur, schema_name)
                     self._logger.debug('Search_path was changed to schema {0}'.format(schema_name))
         else:
             if self._config.scope == pgpm.lib.utils.config.SchemaConfiguration.SCHEMA_SCOPE:
-                if not pgpm.lib.utils.db.SqlScriptsHelper.schema_exists(cur, schema_name):
+                if not catalog.schema_exists(schema_name):
                     pgpm.lib.utils.db.SqlScriptsHelper.create_db_schema(cur, schema_name)
+                    catalog.add_schema(schema_name)
+                    is_schema_reused = False
                 elif mode == 'safe':
                     self._logger.error('Schema already exists. It won\'t be overriden in safe mode. '
                                        'Rerun your script with "-m moderate", "-m overwrite" or "-m unsafe" flags')
-                    self._conn.close()
+                    self._release_connection()
                     sys.exit(1)
                 elif mode == 'moderate':
-                    old_schema_exists = True
                     old_schema_rev = 0
-                    while old_schema_exists:
-                        old_schema_exists = pgpm.lib.utils.db.SqlScriptsHelper.schema_exists(
-                            cur, schema_name + '_' + str(old_schema_rev))
-                        if old_schema_exists:
-                            old_schema_rev += 1
+                    while catalog.schema_exists(schema_name + '_' + str(old_schema_rev)):
+                        old_schema_rev += 1
                     old_schema_name = schema_name + '_' + str(old_schema_rev)
                     self._logger.debug('Schema already exists. It will be renamed to {0} in moderate mode. Renaming...'
                                        .format(old_schema_name))
                     _rename_schema_script = "ALTER SCHEMA {0} RENAME TO {1};\n".format(schema_name, old_schema_name)
                     cur.execute(_rename_schema_script)
+                    catalog.rename_schema(schema_name, old_schema_name)
                     # Add metadata to pgpm schema
-                    pgpm.lib.utils.db.SqlScriptsHelper.set_search_path(cur, self._pgpm_schema_name)
-                    cur.callproc('_set_revision_package'.format(self._pgpm_schema_name),
+                    cur.callproc('{0}._set_revision_package'.format(self._pgpm_schema_name),
                                  [self._config.name,
                                   self._config.subclass,
                                   old_schema_rev,
@@ -262,143 +311,134 @@ class DeploymentManager(pgpm.lib.abstract_deploy.AbstractDeploymentManager):
                     self._logger.debug('Schema {0} was renamed to {1}. Meta info was added to {2} schema'
                                        .format(schema_name, old_schema_name, self._pgpm_schema_name))
                     pgpm.lib.utils.db.SqlScriptsHelper.create_db_schema(cur, schema_name)
+                    # packages were changed
+                    catalog.invalidate()
+                    is_schema_reused = False
                 elif mode == 'unsafe':
                     _drop_schema_script = "DROP SCHEMA {0} CASCADE;\n".format(schema_name)
                     cur.execute(_drop_schema_script)
                     self._logger.debug('Dropping old schema {0}'.format(schema_name))
                     pgpm.lib.utils.db.SqlScriptsHelper.create_db_schema(cur, schema_name)
+                    is_schema_reused = False
+
+        # Get hashes of scripts deployed last time.
+        # Drop statements in types and executed table scripts may cascade to or change objects
+        # that functions, views and triggers depend on so nothing is skipped then
+        deployed_script_hashes = {}
+        if is_schema_reused and not force and not plan.type_drop_statements and not table_scripts:
+            deployed_script_hashes = self._get_deployed_script_hashes(cur)
 
         if self._config.scope == pgpm.lib.utils.config.SchemaConfiguration.SCHEMA_SCOPE:
             pgpm.lib.utils.db.SqlScriptsHelper.set_search_path(cur, schema_name)
 
         # Reordering and executing types
+        timings.start_phase('types')
         return_value['type_scripts_deployed'] = []
-        if len(type_scripts_dict) > 0:
-            types_script = '\n'.join([''.join(value) for key, value in type_scripts_dict.items()])
-            type_drop_scripts, type_ordered_scripts, type_unordered_scripts = self._reorder_types(types_script)
-            if type_drop_scripts:
-                for statement in type_drop_scripts:
-                    if statement:
-                        cur.execute(statement)
-            if type_ordered_scripts:
-                for statement in type_ordered_scripts:
-                    if statement:
-                        cur.execute(statement)
-            if type_unordered_scripts:
-                for statement in type_unordered_scripts:
-                    if statement:
-                        cur.execute(statement)
+        type_scripts = plan.get_scripts('type')
+        if len(type_scripts) > 0:
+            self._logger.debug('Running types definitions scripts')
+            for statement in plan.type_drop_statements:
+                if statement:
+                    cur.execute(statement)
+            for statement in plan.type_ordered_statements:
+                if statement:
+                    cur.execute(statement)
+            for statement in plan.type_unordered_statements:
+                if statement:
+                    cur.execute(statement)
             self._logger.debug('Types loaded to schema {0}'.format(schema_name))
-            return_value['type_scripts_deployed'] = [key for key in type_scripts_dict]
+            return_value['type_scripts_deployed'] = [key for key, value in type_scripts]
         else:
             self._logger.debug('No type scripts to deploy')
 
         # Executing Table DDL scripts
+        timings.start_phase('tables')
         executed_table_scripts = []
         return_value['table_scripts_deployed'] = []
-        if len(table_scripts_dict) > 0:
-            if compare_table_scripts_as_int:
-                sorted_table_scripts_dict = collections.OrderedDict(sorted(table_scripts_dict.items(),
-                                                                           key=lambda t: int(t[0].rsplit('.', 1)[0])))
-            else:
-                sorted_table_scripts_dict = collections.OrderedDict(sorted(table_scripts_dict.items(),
-                                                                           key=lambda t: t[0].rsplit('.', 1)[0]))
-
+        if len(plan.get_scripts('table')) > 0:
             self._logger.debug('Running Table DDL scripts')
-            for key, value in sorted_table_scripts_dict.items():
-                pgpm.lib.utils.db.SqlScriptsHelper.set_search_path(cur, self._pgpm_schema_name)
-                cur.callproc('_is_table_ddl_executed'.format(self._pgpm_schema_name), [
-                    key,
-                    self._config.name,
-                    self._config.subclass,
-                    self._config.version.major,
-                    self._config.version.minor,
-                    self._config.version.patch,
-                    self._config.version.pre
-                ])
-                is_table_executed = cur.fetchone()[0]
-                if self._config.scope == pgpm.lib.utils.config.SchemaConfiguration.SCHEMA_SCOPE:
-                    pgpm.lib.utils.db.SqlScriptsHelper.set_search_path(cur, schema_name)
-                elif self._config.scope == pgpm.lib.utils.config.SchemaConfiguration.DATABASE_SCOPE:
-                    cur.execute("SET search_path TO DEFAULT ;")
-                if (not is_table_executed) or (mode == 'unsafe'):
-                    # if auto commit mode than every statement is called separately.
-                    # this is done this way as auto commit is normally used when non transaction statements are called
-                    # then this is needed to avoid "cannot be executed from a function or multi-command string" errors
-                    if auto_commit:
-                        for statement in sqlparse.split(value):
-                            if statement:
-                                cur.execute(statement)
-                    else:
-                        cur.execute(value)
-                    self._logger.debug(value)
-                    self._logger.debug('{0} executed for schema {1}'.format(key, schema_name))
-                    executed_table_scripts.append(key)
-                    return_value['table_scripts_deployed'].append(key)
-                else:
+            for key, script_source in plan.get_scripts('table'):
+                if key in executed_table_ddl:
                     self._logger.debug('{0} is not executed for schema {1} as it has already been executed before. '
                                        .format(key, schema_name))
+            for key, value in table_scripts:
+                self._execute_scripts(cur, [(key, value)], auto_commit, timings=timings, script_type='table')
+                self._logger.debug(value)
+                self._logger.debug('{0} executed for schema {1}'.format(key, schema_name))
+                executed_table_scripts.append(key)
+                return_value['table_scripts_deployed'].append(key)
         else:
             self._logger.debug('No Table DDL scripts to execute')
 
         # Executing functions
+        timings.start_phase('functions')
+        executed_script_hashes = []
         return_value['function_scripts_deployed'] = []
-        if len(function_scripts_dict) > 0:
+        return_value['function_scripts_skipped'] = []
+        function_scripts = plan.get_scripts('function')
+        if len(function_scripts) > 0:
             self._logger.debug('Running functions definitions scripts')
-            for key, value in function_scripts_dict.items():
-                # if auto commit mode than every statement is called separately.
-                # this is done this way as auto commit is normally used when non transaction statements are called
-                # then this is needed to avoid "cannot be executed from a function or multi-command string" errors
-                if auto_commit:
-                    for statement in sqlparse.split(value):
-                        if statement:
-                            cur.execute(statement)
-                else:
-                    cur.execute(value)
-                return_value['function_scripts_deployed'].append(key)
+            scripts_to_execute = []
+            for key, value in function_scripts:
+                script_hash = pgpm.lib.utils.misc.get_content_hash(value)
+                if deployed_script_hashes.get(('function', key)) == script_hash:
+                    self._logger.debug('{0} is not executed as it hasn\'t changed since last deployment'.format(key))
+                    return_value['function_scripts_skipped'].append(key)
+                    continue
+                scripts_to_execute.append((key, value))
+                executed_script_hashes.append(('function', key, script_hash))
+            self._execute_scripts(cur, scripts_to_execute, auto_commit, batch_size, timings, 'function')
+            return_value['function_scripts_deployed'] = [key for key, value in scripts_to_execute]
             self._logger.debug('Functions loaded to schema {0}'.format(schema_name))
         else:
             self._logger.debug('No function scripts to deploy')
 
         # Executing views
+        timings.start_phase('views')
         return_value['view_scripts_deployed'] = []
-        if len(view_scripts_dict) > 0:
+        return_value['view_scripts_skipped'] = []
+        view_scripts = plan.get_scripts('view')
+        if len(view_scripts) > 0:
             self._logger.debug('Running views definitions scripts')
-            for key, value in view_scripts_dict.items():
-                # if auto commit mode than every statement is called separately.
-                # this is done this way as auto commit is normally used when non transaction statements are called
-                # then this is needed to avoid "cannot be executed from a function or multi-command string" errors
-                if auto_commit:
-                    for statement in sqlparse.split(value):
-                        if statement:
-                            cur.execute(statement)
-                else:
-                    cur.execute(value)
-                return_value['view_scripts_deployed'].append(key)
+            scripts_to_execute = []
+            for key, value in view_scripts:
+                script_hash = pgpm.lib.utils.misc.get_content_hash(value)
+                if deployed_script_hashes.get(('view', key)) == script_hash:
+                    self._logger.debug('{0} is not executed as it hasn\'t changed since last deployment'.format(key))
+                    return_value['view_scripts_skipped'].append(key)
+                    continue
+                scripts_to_execute.append((key, value))
+                executed_script_hashes.append(('view', key, script_hash))
+            self._execute_scripts(cur, scripts_to_execute, auto_commit, batch_size, timings, 'view')
+            return_value['view_scripts_deployed'] = [key for key, value in scripts_to_execute]
             self._logger.debug('Views loaded to schema {0}'.format(schema_name))
         else:
             self._logger.debug('No view scripts to deploy')
 
         # Executing triggers
+        timings.start_phase('triggers')
         return_value['trigger_scripts_deployed'] = []
-        if len(trigger_scripts_dict) > 0:
+        return_value['trigger_scripts_skipped'] = []
+        trigger_scripts = plan.get_scripts('trigger')
+        if len(trigger_scripts) > 0:
             self._logger.debug('Running trigger definitions scripts')
-            for key, value in trigger_scripts_dict.items():
-                # if auto commit mode than every statement is called separately.
-                # this is done this way as auto commit is normally used when non transaction statements are called
-                # then this is needed to avoid "cannot be executed from a function or multi-command string" errors
-                if auto_commit:
-                    for statement in sqlparse.split(value):
-                        if statement:
-                            cur.execute(statement)
-                else:
-                    cur.execute(value)
-                return_value['trigger_scripts_deployed'].append(key)
+            scripts_to_execute = []
+            for key, value in trigger_scripts:
+                script_hash = pgpm.lib.utils.misc.get_content_hash(value)
+                if deployed_script_hashes.get(('trigger', key)) == script_hash:
+                    self._logger.debug('{0} is not executed as it hasn\'t changed since last deployment'.format(key))
+                    return_value['trigger_scripts_skipped'].append(key)
+                    continue
+                scripts_to_execute.append((key, value))
+                executed_script_hashes.append(('trigger', key, script_hash))
+            self._execute_scripts(cur, scripts_to_execute, auto_commit, batch_size, timings, 'trigger')
+            return_value['trigger_scripts_deployed'] = [key for key, value in scripts_to_execute]
             self._logger.debug('Triggers loaded to schema {0}'.format(schema_name))
         else:
             self._logger.debug('No trigger scripts to deploy')
 
         # alter schema privileges if needed
+        timings.start_phase('grants')
         if (not files_deployment) and mode != 'overwrite' \
                 and self._config.scope == pgpm.lib.utils.config.SchemaConfiguration.SCHEMA_SCOPE:
             pgpm.lib.utils.db.SqlScriptsHelper.revoke_all(cur, schema_name, 'public')
@@ -408,14 +448,15 @@ class DeploymentManager(pgpm.lib.abstract_deploy.AbstractDeploymentManager):
                 self._logger.debug('User(s) {0} was (were) granted usage permissions on schema {1}.'
                                    .format(", ".join(self._config.usage_roles), schema_name))
             if self._config.owner_role:
-                pgpm.lib.utils.db.SqlScriptsHelper.set_search_path(cur, self._pgpm_schema_name)
-                cur.callproc('_alter_schema_owner', [schema_name, self._config.owner_role])
+                timings.start_phase('alter_schema_owner')
+                cur.callproc('{0}._alter_schema_owner'.format(self._pgpm_schema_name),
+                             [schema_name, self._config.owner_role])
                 self._logger.debug('Ownership of schema {0} and all its objects was changed and granted to user {1}.'
                                    .format(schema_name, self._config.owner_role))
 
         # Add metadata to pgpm schema
-        pgpm.lib.utils.db.SqlScriptsHelper.set_search_path(cur, self._pgpm_schema_name)
-        cur.callproc('_upsert_package_info'.format(self._pgpm_schema_name),
+        timings.start_phase('metadata')
+        cur.callproc('{0}._upsert_package_info'.format(self._pgpm_schema_name),
                      [self._config.name,
                       self._config.subclass,
                       self._config.version.major,
@@ -433,14 +474,39 @@ class DeploymentManager(pgpm.lib.abstract_deploy.AbstractDeploymentManager):
         self._logger.debug('Meta info about deployment was added to schema {0}'
                            .format(self._pgpm_schema_name))
         pgpm_package_id = cur.fetchone()[0]
-        if len(table_scripts_dict) > 0:
-            for key in executed_table_scripts:
-                cur.callproc('_log_table_evolution'.format(self._pgpm_schema_name), [key, pgpm_package_id])
+        # deployment event was just added in this session, so it's found by the sequence even in auto commit mode
+        cur.execute("SELECT currval(pg_get_serial_sequence('{0}.deployment_events', 'dpl_ev_id'));"
+                    .format(self._pgpm_schema_name))
+        deployment_event_id = cur.fetchone()[0]
+        if executed_table_scripts:
+            cur.callproc('{0}._log_table_evolutions'.format(self._pgpm_schema_name),
+                         [executed_table_scripts, pgpm_package_id])
+        if executed_script_hashes or not is_schema_reused:
+            cur.callproc('{0}._log_script_hashes'.format(self._pgpm_schema_name),
+                         [pgpm_package_id,
+                          [item[0] for item in executed_script_hashes],
+                          [item[1] for item in executed_script_hashes],
+                          [item[2] for item in executed_script_hashes],
+                          not is_schema_reused])
+
+        # Store durations and sizes of the deployment and its scripts in bulk
+        timings.start_phase('execution_history')
+        executed_scripts = timings.scripts
+        cur.callproc('{0}._log_execution_history'.format(self._pgpm_schema_name),
+                     [deployment_event_id,
+                      pgpm.lib.utils.timing.clock() - deployment_start,
+                      [script.script_type for script in executed_scripts],
+                      [script.key for script in executed_scripts],
+                      [script.seconds for script in executed_scripts],
+                      [script.size for script in executed_scripts],
+                      [script.statements_count for script in executed_scripts]])
 
         # Commit transaction
+        timings.start_phase('commit')
         self._conn.commit()
+        timings.end_phase()
 
-        self._conn.close()
+        self._release_connection()
 
         deployed_files_count = len(return_value['function_scripts_deployed']) + \
                                len(return_value['type_scripts_deployed']) + \
@@ -454,116 +520,503 @@ class DeploymentManager(pgpm.lib.abstract_deploy.AbstractDeploymentManager):
                                 len(return_value['trigger_scripts_requested']) + \
                                 len(return_value['table_scripts_requested'])
 
+        skipped_files_count = len(return_value['function_scripts_skipped']) + \
+                              len(return_value['view_scripts_skipped']) + \
+                              len(return_value['trigger_scripts_skipped'])
+
         return_value['deployed_files_count'] = deployed_files_count
         return_value['requested_files_count'] = requested_files_count
-        if deployed_files_count == requested_files_count:
+        return_value['skipped_files_count'] = skipped_files_count
+        if deployed_files_count + skipped_files_count == requested_files_count:
             return_value['code'] = self.DEPLOYMENT_OUTPUT_CODE_OK
             return_value['message'] = 'OK'
         else:
             return_value['code'] = self.DEPLOYMENT_OUTPUT_CODE_NOT_ALL_DEPLOYED
             return_value['message'] = 'Not all requested files were deployed'
+        return_value['timings'] = timings.to_dict()
         return return_value
 
-    def _get_scripts(self, scripts_path_rel, files_deployment, script_type, project_path):
+    @pgpm.lib.abstract_deploy.release_connection_on_error
+    def plan_deployment(self, plan, mode='safe', force=False,
+                        rows_per_second=pgpm.lib.estimate.DEFAULT_ROWS_PER_SECOND, block_lock_risks=False,
+                        big_table_rows=pgpm.lib.locks.DEFAULT_BIG_TABLE_ROWS):
         """
-        Gets scripts from specified folders
+        Dry run of deploy_plan_to_db. Finds out what deployment of precompiled plan would do in the DB without
+        executing anything and estimates its duration from execution history of the package in the DB
+        and from statistics of tables altered by table scripts
+        :param plan: DeploymentPlan
+        :param mode: deployment mode (see deploy_schema_to_db)
+        :param force: deploy function, view and trigger scripts even if they haven't changed since last deployment
+        :param rows_per_second: speed of processing of altered tables for table scripts never executed before
+        :param block_lock_risks: consider deployment failing if table scripts to execute have statements
+        of high lock risk (see deploy_schema_to_db)
+        :param big_table_rows: number of rows from which a table is considered big by lock analysis
+        :return: dictionary of the following format:
+            {
+                code: 0 if deployment would succeed, otherwise something else,
+                message: message on the output
+                schema_name: name of schema of the package (empty if package is not of schema scope)
+                schema_action: create, rename, recreate, update or None if schema is not touched
+                old_schema_name: name existing schema would be renamed to (moderate mode)
+                scripts: list of dicts with type, file, action (execute or skip), reason of skipping,
+                estimated_seconds and estimate_source (see pgpm.lib.estimate) of every script in execution order.
+                For table scripts tables lists altered tables with their schema, name, rows and pages
+                and locks lists statements locking tables with their lock level, rewrite, scan, rows and risk
+                (see pgpm.lib.locks)
+                overhead_seconds: estimated duration of deployment spent outside of scripts
+                estimated_seconds: estimated duration of deployment. Scripts that can't be estimated are not counted
+                not_estimated_count: count of scripts to execute that can't be estimated
+                lock_risks_count: count of statements of table scripts with medium or high lock risk
+            }
+        :rtype: dict
         """
+        self._config = plan.config
+        files_deployment = plan.files_deployment
+        return_value = {
+            'code': self.DEPLOYMENT_OUTPUT_CODE_OK,
+            'message': 'OK',
+            'schema_name': self._get_schema_name(),
+            'schema_action': None,
+            'old_schema_name': None,
+            'scripts': []
+        }
+        schema_name = return_value['schema_name']
 
-        scripts_dict = {}
-        if scripts_path_rel:
+        cur = self._conn.cursor()
+        catalog = self._get_catalog()
+        pgpm_schema_error = self._get_pgpm_schema_error(catalog)
+        if pgpm_schema_error:
+            self._release_connection()
+            return_value.update({
+                'code': self.PLAN_OUTPUT_CODE_WOULD_FAIL,
+                'message': pgpm_schema_error,
+                'overhead_seconds': 0,
+                'estimated_seconds': 0,
+                'not_estimated_count': 0,
+                'lock_risks_count': 0
+            })
+            return return_value
 
-            self._logger.debug('Getting scripts with {0} definitions'.format(script_type))
-            scripts_dict = pgpm.lib.utils.misc.collect_scripts_from_sources(scripts_path_rel, files_deployment,
-                                                                            project_path, False, self._logger)
-            if len(scripts_dict) == 0:
-                self._logger.debug('No {0} definitions were found in {1} folder'.format(script_type, scripts_path_rel))
-        else:
-            self._logger.debug('No {0} folder was specified'.format(script_type))
+        if self._config.dependencies:
+            _is_deps_resolved, _list_of_deps_ids, _list_of_unresolved_deps = \
+                self._resolve_dependencies(cur, self._config.dependencies)
+            if not _is_deps_resolved:
+                return_value['code'] = self.PLAN_OUTPUT_CODE_WOULD_FAIL
+                return_value['message'] = 'Unresolved dependencies: {0}'.format(', '.join(_list_of_unresolved_deps))
 
-        return scripts_dict
+        # what would be done with the schema (see deploy_plan_to_db)
+        is_schema_reused = True
+        if self._config.scope == pgpm.lib.utils.config.SchemaConfiguration.SCHEMA_SCOPE:
+            if files_deployment:
+                if catalog.schema_exists(schema_name):
+                    return_value['schema_action'] = 'update'
+                else:
+                    return_value['code'] = self.PLAN_OUTPUT_CODE_WOULD_FAIL
+                    return_value['message'] = 'Schema {0} doesn\'t exist in database'.format(schema_name)
+            elif not catalog.schema_exists(schema_name):
+                return_value['schema_action'] = 'create'
+                is_schema_reused = False
+            elif mode == 'safe':
+                return_value['code'] = self.PLAN_OUTPUT_CODE_WOULD_FAIL
+                return_value['message'] = 'Schema {0} already exists. It won\'t be overriden in safe mode' \
+                    .format(schema_name)
+            elif mode == 'moderate':
+                old_schema_rev = 0
+                while catalog.schema_exists(schema_name + '_' + str(old_schema_rev)):
+                    old_schema_rev += 1
+                return_value['schema_action'] = 'rename'
+                return_value['old_schema_name'] = schema_name + '_' + str(old_schema_rev)
+                is_schema_reused = False
+            elif mode == 'unsafe':
+                return_value['schema_action'] = 'recreate'
+                is_schema_reused = False
+            else:
+                return_value['schema_action'] = 'update'
+
+        executed_table_ddl = set()
+        if mode != 'unsafe':
+            executed_table_ddl = self._get_executed_table_ddl(cur)
+        deployed_script_hashes = {}
+        if is_schema_reused and not force and not plan.type_drop_statements and \
+                all(key in executed_table_ddl for key, script_source in plan.get_scripts('table')):
+            deployed_script_hashes = self._get_deployed_script_hashes(cur)
+        estimator = pgpm.lib.estimate.DurationEstimator.load(cur, self._pgpm_schema_name, self._config.name,
+                                                             rows_per_second, self._logger)
+
+        planned_scripts = []
+        for key, value in plan.get_scripts('type'):
+            planned_scripts.append({'type': 'type', 'file': key, 'action': 'execute', 'reason': None})
+
+        altered_tables = set()
+        table_scripts = []
+        for key, script_source in plan.get_scripts('table'):
+            if key in executed_table_ddl:
+                planned_scripts.append({'type': 'table', 'file': key, 'action': 'skip',
+                                        'reason': 'executed before'})
+                continue
+            script_tables = []
+            value = script_source.read()
+            table_scripts.append((key, value))
+            for statement in pgpm.lib.utils.sql.iter_statements(value):
+                altered_table = pgpm.lib.utils.sql.get_altered_table(statement)
+                if altered_table:
+                    altered_table = (altered_table[0] or schema_name or None, altered_table[1])
+                    if altered_table not in script_tables:
+                        script_tables.append(altered_table)
+            altered_tables.update(script_tables)
+            planned_scripts.append({'type': 'table', 'file': key, 'action': 'execute', 'reason': None,
+                                    'tables': script_tables})
+
+        for script_type in ('function', 'view', 'trigger'):
+            for key, value in plan.get_scripts(script_type):
+                script_hash = pgpm.lib.utils.misc.get_content_hash(value)
+                if deployed_script_hashes.get((script_type, key)) == script_hash:
+                    planned_scripts.append({'type': script_type, 'file': key, 'action': 'skip',
+                                            'reason': 'unchanged'})
+                else:
+                    planned_scripts.append({'type': script_type, 'file': key, 'action': 'execute', 'reason': None})
+
+        tables_stats = self._get_tables_stats(cur, altered_tables)
+        is_schema_recreated = return_value['schema_action'] in ('create', 'rename', 'recreate')
+        lock_risks = self._analyze_table_locks(cur, table_scripts, schema_name, is_schema_recreated, big_table_rows)
+        self._release_connection()
+
+        for planned_script in planned_scripts:
+            if 'tables' in planned_script:
+                planned_script['locks'] = [lock_risk for lock_risk in lock_risks
+                                           if lock_risk['file'] == planned_script['file']]
+        lock_risks = [lock_risk for lock_risk in lock_risks if lock_risk['risk'] != pgpm.lib.locks.RISK_LOW]
+        return_value['lock_risks_count'] = len(lock_risks)
+        high_lock_risks_count = len([lock_risk for lock_risk in lock_risks
+                                     if lock_risk['risk'] == pgpm.lib.locks.RISK_HIGH])
+        if block_lock_risks and high_lock_risks_count and return_value['code'] == self.DEPLOYMENT_OUTPUT_CODE_OK:
+            return_value['code'] = self.PLAN_OUTPUT_CODE_WOULD_FAIL
+            return_value['message'] = 'Deployment would be blocked as {0} statement(s) of table scripts ' \
+                                      'have high lock risk'.format(high_lock_risks_count)
+
+        estimated_seconds = estimator.estimate_overhead()
+        return_value['overhead_seconds'] = estimated_seconds
+        not_estimated_count = 0
+        for planned_script in planned_scripts:
+            planned_script['estimated_seconds'] = None
+            planned_script['estimate_source'] = None
+            if 'tables' in planned_script:
+                planned_script['tables'] = [
+                    dict(schema=table_schema, name=table_name,
+                         **tables_stats.get((table_schema, table_name), {'rows': None, 'pages': None}))
+                    for table_schema, table_name in planned_script['tables']]
+            if planned_script['action'] != 'execute':
+                continue
+            altered_tables_rows = sum(table['rows'] or 0 for table in planned_script.get('tables', []))
+            planned_script['estimated_seconds'], planned_script['estimate_source'] = \
+                estimator.estimate_script(planned_script['type'], planned_script['file'], altered_tables_rows)
+            if planned_script['estimated_seconds'] is None:
+                not_estimated_count += 1
+            else:
+                estimated_seconds += planned_script['estimated_seconds']
+        return_value['scripts'] = planned_scripts
+        return_value['estimated_seconds'] = estimated_seconds
+        return_value['not_estimated_count'] = not_estimated_count
+        return return_value
+
+    def _get_schema_name(self):
+        """
+        :return: name of schema the package is deployed to or empty string if package is not of schema scope
+        """
+        if self._config.scope == pgpm.lib.utils.config.SchemaConfiguration.SCHEMA_SCOPE:
+            if self._config.subclass == 'versioned':
+                return '{0}_{1}'.format(self._config.name, self._config.version.raw)
+            elif self._config.subclass == 'basic':
+                return '{0}'.format(self._config.name)
+        return ''
+
+    def _get_executed_table_ddl(self, cur):
+        """
+        Gets table scripts executed before for the package
+        :return: set of keys of table scripts
+        """
+        cur.callproc('{0}._get_executed_table_ddl'.format(self._pgpm_schema_name), [
+            self._config.name,
+            self._config.subclass,
+            self._config.version.major,
+            self._config.version.minor,
+            self._config.version.patch,
+            self._config.version.pre
+        ])
+        return set(row[0] for row in cur.fetchall())
+
+    def _get_tables_stats(self, cur, tables):
+        """
+        Gets planner statistics of tables
+        :param tables: iterable of tuples (schema name or None for current schema, table name)
+        :return: dictionary with tuples (schema name, table name) as keys and dicts with rows and pages as values
+        """
+        tables = list(tables)
+        if not tables:
+            return {}
+        cur.execute('SELECT t.table_schema, t.table_name, greatest(c.reltuples, 0)::BIGINT, c.relpages '
+                    'FROM (SELECT unnest(%s::TEXT[]) AS table_schema, unnest(%s::TEXT[]) AS table_name) AS t '
+                    'JOIN pg_catalog.pg_namespace n ON n.nspname = coalesce(t.table_schema, current_schema()) '
+                    'JOIN pg_catalog.pg_class c ON c.relnamespace = n.oid AND c.relname = t.table_name;',
+                    [[table_schema for table_schema, table_name in tables],
+                     [table_name for table_schema, table_name in tables]])
+        return dict(((table_schema, table_name), {'rows': rows, 'pages': pages})
+                    for table_schema, table_name, rows, pages in cur.fetchall())
+
+    def _analyze_table_locks(self, cur, table_scripts, schema_name, is_schema_recreated,
+                             big_table_rows=pgpm.lib.locks.DEFAULT_BIG_TABLE_ROWS):
+        """
+        Finds locks statements of table scripts take on tables and rates their risk with planner statistics
+        of the tables and server version of the DB. See pgpm.lib.locks
+        :param table_scripts: list of tuples (key, script) of table scripts to execute
+        :param schema_name: name of schema of the package (see _get_schema_name)
+        :param is_schema_recreated: whether schema of the package is created anew by deployment so its tables
+        don't exist yet
+        :param big_table_rows: number of rows from which a table is considered big
+        :return: list of dicts with file, statement, statement_type, schema, table, lock_level, rewrite, scan,
+        notes, rows (None if unknown) and risk of every table locked by a statement, in execution order
+        """
+        statement_locks = []
+        for key, script in table_scripts:
+            for statement in pgpm.lib.utils.sql.iter_statements(script):
+                for statement_lock in pgpm.lib.locks.analyze_statement_locks(statement, self._conn.server_version):
+                    table = (statement_lock.table[0] or schema_name or None, statement_lock.table[1])
+                    is_new_table = is_schema_recreated and table[0] == schema_name
+                    statement_locks.append((key, statement, statement_lock, table, is_new_table))
+
+        tables_stats = self._get_tables_stats(cur, set(table for key, statement, statement_lock, table, is_new_table
+                                                       in statement_locks if not is_new_table))
+        lock_risks = []
+        for key, statement, statement_lock, table, is_new_table in statement_locks:
+            rows = None if is_new_table else tables_stats.get(table, {}).get('rows')
+            lock_risks.append({
+                'file': key,
+                'statement': ' '.join(statement.split()),
+                'statement_type': statement_lock.statement_type,
+                'schema': table[0],
+                'table': table[1],
+                'lock_level': statement_lock.lock_level,
+                'rewrite': statement_lock.rewrite,
+                'scan': statement_lock.scan,
+                'notes': statement_lock.notes,
+                'rows': rows,
+                'risk': pgpm.lib.locks.get_risk(statement_lock, rows, big_table_rows)
+            })
+        return lock_risks
 
     def _resolve_dependencies(self, cur, dependencies):
         """
-        Function checks if dependant packages are installed in DB
+        Function checks if dependant packages are installed in DB. All requirements and their dependencies
+        are resolved in one call
+        :return: tuple of flag if all dependencies are resolved, list of ids of directly required packages
+        and list of unresolved or conflicting requirements
         """
         list_of_deps_ids = []
         _list_of_deps_unresolved = []
         _is_deps_resolved = True
-        for k, v in dependencies.items():
-            pgpm.lib.utils.db.SqlScriptsHelper.set_search_path(cur, self._pgpm_schema_name)
-            cur.execute("SELECT _find_schema('{0}', '{1}')"
-                        .format(k, v))
-            pgpm_v_ext = tuple(cur.fetchone()[0][1:-1].split(','))
-            try:
-                list_of_deps_ids.append(int(pgpm_v_ext[0]))
-            except:
-                pass
-            if not pgpm_v_ext[0]:
+        dependencies_items = list(dependencies.items())
+        cur.callproc('{0}._resolve_dependencies'.format(self._pgpm_schema_name),
+                     [[k for k, v in dependencies_items], [v for k, v in dependencies_items]])
+        for pkg_name, pkg_v_req, pkg_id, dep_level, is_conflict in cur.fetchall():
+            if dep_level == 0:
+                if pkg_id is not None:
+                    list_of_deps_ids.append(pkg_id)
+                else:
+                    _is_deps_resolved = False
+                    _list_of_deps_unresolved.append("{0}: {1}".format(pkg_name, pkg_v_req))
+            if is_conflict and pkg_id is not None:
                 _is_deps_resolved = False
-                _list_of_deps_unresolved.append("{0}: {1}".format(k, v))
+                _list_of_deps_unresolved.append("{0}: conflicting version required{1}".format(
+                    pkg_name, ' by dependencies' if dep_level > 0 else ' ({0})'.format(pkg_v_req)))
 
         return _is_deps_resolved, list_of_deps_ids, _list_of_deps_unresolved
 
+    def _execute_scripts(self, cur, scripts, auto_commit=False, batch_size=0, timings=None, script_type=None):
+        """
+        Executes scripts in the given order
+        :param cur: cursor
+        :param scripts: list of tuples (key, script)
+        :param auto_commit: execute every statement of scripts separately
+        :param batch_size: max size of a batch of scripts sent to the DB at once. 0 to send scripts one by one
+        :param timings: Timings execution of every script (or batch of scripts) is recorded to
+        :param script_type: type of scripts recorded to timings
+        """
+        if auto_commit:
+            # if auto commit mode than every statement is called separately.
+            # this is done this way as auto commit is normally used when non transaction statements are called
+            # then this is needed to avoid "cannot be executed from a function or multi-command string" errors
+            for key, value in scripts:
+                start = pgpm.lib.utils.timing.clock()
+                cur.connection.script_key = key
+                statements_count = 0
+                for statement in pgpm.lib.utils.sql.iter_statements(value):
+                    cur.execute(statement)
+                    statements_count += 1
+                if timings:
+                    timings.add_script(script_type, key, pgpm.lib.utils.timing.clock() - start,
+                                       len(value.encode('utf-8')), statements_count)
+        elif batch_size:
+            batch = []
+            batch_length = 0
+            is_savepoint_set = False
+            for key, value in scripts:
+                if batch and batch_length + len(value) > batch_size:
+                    self._execute_batch(cur, batch, is_savepoint_set, timings, script_type)
+                    is_savepoint_set = True
+                    batch = []
+                    batch_length = 0
+                batch.append((key, value))
+                batch_length += len(value)
+            if batch:
+                self._execute_batch(cur, batch, is_savepoint_set, timings, script_type)
+                is_savepoint_set = True
+            if is_savepoint_set:
+                cur.execute('RELEASE SAVEPOINT pgpm_batch;')
+        else:
+            for key, value in scripts:
+                start = pgpm.lib.utils.timing.clock()
+                cur.connection.script_key = key
+                cur.execute(value)
+                if timings:
+                    timings.add_script(script_type, key, pgpm.lib.utils.timing.clock() - start,
+                                       len(value.encode('utf-8')), pgpm.lib.utils.sql.count_statements(value))
+        cur.connection.script_key = None
+
+    def _execute_batch(self, cur, batch, is_savepoint_set=False, timings=None, script_type=None):
+        """
+        Executes a batch of scripts in one round trip. Batch starts with a savepoint so that if it fails,
+        scripts are rolled back and executed one by one to find out which file the error comes from.
+        If all of them succeed one by one, deployment goes on. Savepoint is left set for the next batch
+        and has to be released after the last one
+        :param cur: cursor
+        :param batch: list of tuples (key, script)
+        :param is_savepoint_set: savepoint was set by the previous batch and has to be released first
+        :param timings: Timings execution of the batch is recorded to. Every script of the batch is recorded
+        under its own key with duration of the batch split evenly between them
+        :param script_type: type of scripts recorded to timings
+        """
+        batch_script = '\n;\n'.join(value for key, value in batch)
+        savepoint_script = 'SAVEPOINT pgpm_batch;\n'
+        if is_savepoint_set:
+            savepoint_script = 'RELEASE SAVEPOINT pgpm_batch;\n' + savepoint_script
+        self._logger.debug('Executing batch of {0} scripts: {1}'.format(len(batch), ', '.join(key for key, value
+                                                                                              in batch)))
+        start = pgpm.lib.utils.timing.clock()
+        cur.connection.script_key = ', '.join(key for key, value in batch)
+        try:
+            cur.execute(savepoint_script + batch_script)
+            if timings:
+                seconds = (pgpm.lib.utils.timing.clock() - start) / len(batch)
+                for key, value in batch:
+                    timings.add_script(script_type, key, seconds, len(value.encode('utf-8')),
+                                       pgpm.lib.utils.sql.count_statements(value))
+        except psycopg2.Error as e:
+            self._logger.debug('Batch failed, executing its scripts one by one: {0}'.format(e))
+            cur.execute('ROLLBACK TO SAVEPOINT pgpm_batch;')
+            for key, value in batch:
+                start = pgpm.lib.utils.timing.clock()
+                cur.connection.script_key = key
+                try:
+                    cur.execute(value)
+                except psycopg2.Error as e:
+                    self._logger.error('Error while executing {0}: {1}'.format(key, e))
+                    raise
+                if timings:
+                    timings.add_script(script_type, key, pgpm.lib.utils.timing.clock() - start,
+                                       len(value.encode('utf-8')), pgpm.lib.utils.sql.count_statements(value))
+
+    def _get_vcs_changed_files(self):
+        """
+        Gets script files of the package changed in git since the commit last deployed to the DB.
+        Commit last deployed is compared with HEAD, so changes that are not committed are not deployed.
+        Only files in directories with scripts from the configuration are taken
+        :return: list of paths relative to the package sources
+        """
+        # imported here so that plans loaded from bundles can be deployed without vcs libraries
+        import pgpm.lib.utils.vcs
+
+        if not pgpm.lib.utils.vcs.is_git_directory(self._source_code_path):
+            self._logger.error('Can\'t find changed files as {0} is not a git repository'
+                               .format(self._source_code_path))
+            self._release_connection()
+            sys.exit(1)
+
+        cur = self._conn.cursor()
+        if not self._get_catalog().is_pgpm_installed:
+            self._logger.error('Can\'t deploy schemas to DB where pgpm was not installed. '
+                               'First install pgpm by running pgpm install')
+            self._release_connection()
+            sys.exit(1)
+        cur.execute("SELECT dpl_ev_vcs_ref "
+                    "FROM {0}.deployment_events "
+                    "JOIN {0}.packages ON dpl_ev_pkg_id = pkg_id "
+                    "JOIN {0}.package_subclasses ON pkg_subclass = pkg_sc_id "
+                    "WHERE pkg_name = %s AND pkg_sc_name = %s "
+                    "AND (pkg_sc_name = 'basic' OR (pkg_v_major = %s AND pkg_v_minor = %s AND pkg_v_patch = %s "
+                    "AND pkg_old_rev IS NULL)) "
+                    "AND dpl_ev_vcs_ref IS NOT NULL "
+                    "ORDER BY dpl_ev_time DESC LIMIT 1;".format(self._pgpm_schema_name),
+                    [self._config.name, self._config.subclass, self._config.version.major,
+                     self._config.version.minor, self._config.version.patch])
+        row = cur.fetchone()
+        if not row:
+            self._logger.error('Package {0} was never deployed to the DB from a git repository. '
+                               'Deploy it without diff first'.format(self._config.name))
+            self._release_connection()
+            sys.exit(1)
+        last_vcs_ref = row[0]
+
+        try:
+            script_paths = (self._config.types_path or []) + (self._config.functions_path or []) + \
+                (self._config.views_path or []) + (self._config.triggers_path or []) + (self._config.tables_path or [])
+            changed_files = pgpm.lib.utils.vcs.get_changed_files(self._source_code_path, last_vcs_ref,
+                                                                 script_paths=script_paths)
+        except KeyError:
+            self._logger.error('Commit {0} last deployed to the DB is not found in the repository'
+                               .format(last_vcs_ref))
+            self._release_connection()
+            sys.exit(1)
+        if changed_files:
+            self._logger.debug('Files changed since commit {0}: {1}'.format(last_vcs_ref, ', '.join(changed_files)))
+        else:
+            self._logger.info('No files changed since commit {0}. Nothing to deploy'.format(last_vcs_ref))
+        return changed_files
+
+    def _get_empty_deploy_result(self):
+        """
+        Result of a deployment when nothing was requested. See deploy_schema_to_db for the format
+        """
+        return_value = {}
+        for script_type in pgpm.lib.plan.DeploymentPlan.SCRIPT_TYPES:
+            return_value['{0}_scripts_requested'.format(script_type)] = []
+            return_value['{0}_scripts_deployed'.format(script_type)] = []
+        for script_type in ('function', 'view', 'trigger'):
+            return_value['{0}_scripts_skipped'.format(script_type)] = []
+        return_value['deployed_files_count'] = 0
+        return_value['requested_files_count'] = 0
+        return_value['skipped_files_count'] = 0
+        return_value['lock_risks_count'] = 0
+        return_value['timings'] = pgpm.lib.utils.timing.Timings().to_dict()
+        return_value['code'] = self.DEPLOYMENT_OUTPUT_CODE_OK
+        return_value['message'] = 'OK'
+        return return_value
+
+    def _get_deployed_script_hashes(self, cur):
+        """
+        Gets content hashes of scripts deployed last time for the package
+        :return: dictionary with tuples (script type, file name) as keys and hashes as values
+        """
+        cur.callproc('{0}._get_script_hashes'.format(self._pgpm_schema_name),
+                     [self._config.name,
+                      self._config.subclass,
+                      self._config.version.major,
+                      self._config.version.minor,
+                      self._config.version.patch,
+                      self._config.version.pre])
+        return dict(((script_type, file_name), script_hash) for script_type, file_name, script_hash in cur.fetchall())
+
     def _reorder_types(self, types_script):
         """
         Takes type scripts and reorders them to avoid Type doesn't exist exception
         """
-        self._logger.debug('Running types definitions scripts')
-        self._logger.debug('Reordering types definitions scripts to avoid "type does not exist" exceptions')
-        _type_statements = sqlparse.split(types_script)
-        # TODO: move up to classes
-        _type_statements_dict = {}  # dictionary that store statements with type and order.
-        type_unordered_scripts = []  # scripts to execute without order
-        type_drop_scripts = []  # drop scripts to execute first
-        for _type_statement in _type_statements:
-            _type_statement_parsed = sqlparse.parse(_type_statement)
-            if len(_type_statement_parsed) > 0:  # can be empty parsed object so need to check
-                # we need only type declarations to be ordered
-                if _type_statement_parsed[0].get_type() == 'CREATE':
-                    _type_body_r = r'\bcreate\s+\b(?:type|domain)\s+\b(\w+\.\w+|\w+)\b'
-                    _type_name = re.compile(_type_body_r, flags=re.IGNORECASE).findall(_type_statement)[0]
-                    _type_statements_dict[str(_type_name)] = \
-                        {'script': _type_statement, 'deps': []}
-                elif _type_statement_parsed[0].get_type() == 'DROP':
-                    type_drop_scripts.append(_type_statement)
-                else:
-                    type_unordered_scripts.append(_type_statement)
-        # now let's add dependant types to dictionary with types
-        # _type_statements_list = []  # list of statements to be ordered
-        for _type_key in _type_statements_dict.keys():
-            for _type_key_sub, _type_value in _type_statements_dict.items():
-                if _type_key != _type_key_sub:
-                    if pgpm.lib.utils.misc.find_whole_word(_type_key)(_type_value['script']):
-                        _type_value['deps'].append(_type_key)
-        # now let's add order to type scripts and put them ordered to list
-        _deps_unresolved = True
-        _type_script_order = 0
-        _type_names = []
-        type_ordered_scripts = []  # ordered list with scripts to execute
-        while _deps_unresolved:
-            for k, v in _type_statements_dict.items():
-                if not v['deps']:
-                    _type_names.append(k)
-                    v['order'] = _type_script_order
-                    _type_script_order += 1
-                    if not v['script'] in type_ordered_scripts:
-                        type_ordered_scripts.append(v['script'])
-                else:
-                    _dep_exists = True
-                    for _dep in v['deps']:
-                        if _dep not in _type_names:
-                            _dep_exists = False
-                    if _dep_exists:
-                        _type_names.append(k)
-                        v['order'] = _type_script_order
-                        _type_script_order += 1
-                        if not v['script'] in type_ordered_scripts:
-                            type_ordered_scripts.append(v['script'])
-                    else:
-                        v['order'] = -1
-            _deps_unresolved = False
-            for k, v in _type_statements_dict.items():
-                if v['order'] == -1:
-                    _deps_unresolved = True
-        return type_drop_scripts, type_ordered_scripts, type_unordered_scripts
-
+        return pgpm.lib.plan.reorder_types(types_script, self._logger)
@@ -0,0 +1,106 @@
+import logging
+
+# number of the last executions of a script its duration is estimated from
+HISTORY_DEPTH = 5
+# rough speed of rewriting or scanning a table altered by table scripts that were never executed before
+DEFAULT_ROWS_PER_SECOND = 100000
+
+ESTIMATE_SOURCE_HISTORY = 'history'
+ESTIMATE_SOURCE_TABLE_STATS = 'table_stats'
+ESTIMATE_SOURCE_TYPE_AVERAGE = 'type_average'
+
+
+def _median(values):
+    sorted_values = sorted(values)
+    middle = len(sorted_values) // 2
+    if len(sorted_values) % 2:
+        return sorted_values[middle]
+    return (sorted_values[middle - 1] + sorted_values[middle]) / 2.0
+
+
+class DurationEstimator(object):
+    """
+    Estimates durations of scripts of a package from execution history of the package in a DB.
+    Duration of a script is the median of its last executions. Scripts never executed before are estimated
+    from the size of tables they alter or from the average duration of scripts of the same type
+    """
+    def __init__(self, script_durations=None, overhead_durations=None, rows_per_second=DEFAULT_ROWS_PER_SECOND):
+        """
+        :param script_durations: list of tuples (script type, key, duration) from the latest execution.
+        Scripts executed in one batch are recorded one by one with duration of the batch split between them
+        :param overhead_durations: list of durations of deployments spent outside of scripts from the latest one
+        :param rows_per_second: speed of processing of altered tables
+        """
+        self._rows_per_second = rows_per_second
+        self._script_durations = {}  # (script type, key) -> durations of the last executions
+        self._type_durations = {}  # script type -> durations of all scripts of the type
+        for script_type, key, duration in script_durations or []:
+            durations = self._script_durations.setdefault((script_type, key), [])
+            if len(durations) < HISTORY_DEPTH:
+                durations.append(duration)
+            self._type_durations.setdefault(script_type, []).append(duration)
+        self._overhead_durations = list(overhead_durations or [])[:HISTORY_DEPTH]
+
+    @classmethod
+    def load(cls, cur, pgpm_schema_name, package_name, rows_per_second=DEFAULT_ROWS_PER_SECOND, logger=None):
+        """
+        Loads execution history of a package
+        :param cur: cursor
+        :param pgpm_schema_name: name of pgpm schema
+        :param package_name: package name
+        :param rows_per_second: speed of processing of altered tables
+        :param logger: logger object
+        :return: DurationEstimator
+        """
+        logger = logger or logging.getLogger(__name__)
+        # only the last executions of every script are taken
+        cur.execute('SELECT sc_exec_hist_script_type, sc_exec_hist_file_name, sc_exec_hist_duration '
+                    'FROM (SELECT sc_exec_hist_id, sc_exec_hist_script_type, sc_exec_hist_file_name, '
+                    'sc_exec_hist_duration, row_number() OVER (PARTITION BY sc_exec_hist_script_type, '
+                    'sc_exec_hist_file_name ORDER BY sc_exec_hist_id DESC) AS execution_number '
+                    'FROM {0}.script_execution_history '
+                    'JOIN {0}.deployment_events ON sc_exec_hist_dpl_ev_id = dpl_ev_id '
+                    'JOIN {0}.packages ON dpl_ev_pkg_id = pkg_id '
+                    'WHERE pkg_name = %s) AS executions '
+                    'WHERE execution_number <= %s '
+                    'ORDER BY sc_exec_hist_id DESC;'.format(pgpm_schema_name), [package_name, HISTORY_DEPTH])
+        script_durations = cur.fetchall()
+        cur.execute('SELECT exec_hist_duration - coalesce((SELECT sum(sc_exec_hist_duration) '
+                    'FROM {0}.script_execution_history '
+                    'WHERE sc_exec_hist_dpl_ev_id = exec_hist_dpl_ev_id), 0) '
+                    'FROM {0}.execution_history '
+                    'JOIN {0}.deployment_events ON exec_hist_dpl_ev_id = dpl_ev_id '
+                    'JOIN {0}.packages ON dpl_ev_pkg_id = pkg_id '
+                    'WHERE pkg_name = %s '
+                    'ORDER BY exec_hist_dpl_ev_id DESC LIMIT %s;'.format(pgpm_schema_name),
+                    [package_name, HISTORY_DEPTH])
+        overhead_durations = [row[0] for row in cur.fetchall()]
+        logger.debug('Execution history of package {0} loaded: {1} script executions, {2} deployments'
+                     .format(package_name, len(script_durations), len(overhead_durations)))
+        return cls(script_durations, overhead_durations, rows_per_second)
+
+    def estimate_overhead(self):
+        """
+        :return: estimated duration of deployment spent outside of scripts (checks, metadata, commit) or 0
+        if there is no history
+        """
+        if not self._overhead_durations:
+            return 0
+        return max(_median(self._overhead_durations), 0)
+
+    def estimate_script(self, script_type, key, altered_tables_rows=0):
+        """
+        :param script_type: type of the script
+        :param key: script key as recorded in history
+        :param altered_tables_rows: number of rows in tables altered by the script
+        :return: tuple (estimated duration, source of estimate) or (None, None) if it can't be estimated
+        """
+        durations = self._script_durations.get((script_type, key))
+        if durations:
+            return _median(durations), ESTIMATE_SOURCE_HISTORY
+        if altered_tables_rows:
+            return altered_tables_rows / float(self._rows_per_second), ESTIMATE_SOURCE_TABLE_STATS
+        type_durations = self._type_durations.get(script_type)
+        if type_durations:
+            return sum(type_durations) / len(type_durations), ESTIMATE_SOURCE_TYPE_AVERAGE
+        return None, None
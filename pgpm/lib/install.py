@@ -4,7 +4,6 @@ import distutils.version
 import sys
 
 import pkg_resources
-import psycopg2
 import re
 
 import pgpm.lib.abstract_deploy
@@ -19,24 +18,26 @@ class InstallationManager(pgpm.lib.abstract_deploy.AbstractDeploymentManager):
     """
     Class that will manage pgpm installation
     """
-    def __init__(self, connection_string, pgpm_schema_name='_pgpm', pgpm_schema_subclass='basic', logger=None):
+    def __init__(self, connection_string, pgpm_schema_name='_pgpm', pgpm_schema_subclass='basic', logger=None,
+                 transaction_pooling=False, connection_pool=None):
         """
-        initialises the manager and connects to the DB
+        initialises the manager
         :param connection_string: connection string consumable by DBAPI 2.0
         :param logger: logger object
+        :param transaction_pooling: DB is connected through transaction-mode pooler
+        :param connection_pool: ConnectionPool to take connections from
         """
-        super(InstallationManager, self).__init__(connection_string, pgpm_schema_name, logger)
+        super(InstallationManager, self).__init__(connection_string, pgpm_schema_name, logger, transaction_pooling,
+                                                  connection_pool)
         self._main_module_name = 'pgpm'
         self._pgpm_schema_subclass = pgpm_schema_subclass
 
+    @pgpm.lib.abstract_deploy.release_connection_on_error
     def install_pgpm_to_db(self, user_roles, upgrade=False):
         """
         Installs package manager
 
         """
-        if self._conn.closed:
-            self._conn = psycopg2.connect(self._connection_string, connection_factory=pgpm.lib.utils.db.MegaConnection)
-
         cur = self._conn.cursor()
 
         # get pgpm functions
@@ -83,11 +84,11 @@ class InstallationManager(pgpm.lib.abstract_deploy.AbstractDeploymentManager):
             elif pgpm_v_script < pgpm_v_db:
                 self._logger.error('Deployment script\'s version is lower than the version of {0} schema '
                                    'installed in DB. Update pgpm script first.'.format(self._pgpm_schema_name))
-                self._conn.close()
+                self._release_connection()
                 sys.exit(1)
             else:
                 self._logger.error('Can\'t install pgpm as schema {0} already exists'.format(self._pgpm_schema_name))
-                self._conn.close()
+                self._release_connection()
                 sys.exit(1)
 
             # Executing pgpm functions
@@ -106,12 +107,12 @@ class InstallationManager(pgpm.lib.abstract_deploy.AbstractDeploymentManager):
             # Prepare and execute preamble
             deployment_script_preamble = pkgutil.get_data(self._main_module_name, 'lib/db_scripts/deploy_prepare_config.sql')
             self._logger.info('Executing a preamble to install statement')
-            cur.execute(deployment_script_preamble)
+            cur.execute(self._prepare_settings_script(deployment_script_preamble))
 
             # Python 3.x doesn't have format for byte strings so we have to convert
             install_script = pkgutil.get_data(self._main_module_name, 'lib/db_scripts/install.tmpl.sql').decode('utf-8')
             self._logger.info('Installing package manager')
-            cur.execute(install_script.format(schema_name=self._pgpm_schema_name))
+            cur.execute(self._prepare_settings_script(install_script.format(schema_name=self._pgpm_schema_name)))
             migration_files_list = sorted(pkg_resources.resource_listdir(self._main_module_name, 'lib/db_scripts/migrations/'),
                                           key=lambda filename: distutils.version.StrictVersion(filename.split('-')[0]))
 
@@ -134,7 +135,7 @@ class InstallationManager(pgpm.lib.abstract_deploy.AbstractDeploymentManager):
                     .decode('utf-8').format(schema_name=self._pgpm_schema_name)
                 self._logger.debug('Running version upgrade script {0}'.format(file_info))
                 self._logger.debug(migration_script)
-                cur.execute(migration_script)
+                cur.execute(self._prepare_settings_script(migration_script))
 
             # Executing pgpm functions
             if len(functions_dict) > 0:
@@ -153,6 +154,9 @@ class InstallationManager(pgpm.lib.abstract_deploy.AbstractDeploymentManager):
             # to be refactored
             cur.callproc('_add_migration_info', ['0.0.7', pgpm.lib.version.__version__])
 
+        # pin search_path of pgpm functions so that they are called schema-qualified without switching search_path
+        pgpm.lib.utils.db.SqlScriptsHelper.pin_functions_search_path(cur, self._pgpm_schema_name)
+
         # check if users of pgpm are specified
         pgpm.lib.utils.db.SqlScriptsHelper.revoke_all(cur, self._pgpm_schema_name, 'public')
         if not user_roles:
@@ -166,8 +170,7 @@ class InstallationManager(pgpm.lib.abstract_deploy.AbstractDeploymentManager):
             pgpm.lib.utils.db.SqlScriptsHelper.grant_usage_install_privileges(
                 cur, self._pgpm_schema_name, ', '.join(user_roles))
 
-        pgpm.lib.utils.db.SqlScriptsHelper.set_search_path(cur, self._pgpm_schema_name)
-        cur.callproc('_upsert_package_info',
+        cur.callproc('{0}._upsert_package_info'.format(self._pgpm_schema_name),
                      [self._pgpm_schema_name, self._pgpm_schema_subclass,
                       self._pgpm_version.major, self._pgpm_version.minor, self._pgpm_version.patch,
                       self._pgpm_version.pre, self._pgpm_version.metadata,
@@ -175,10 +178,11 @@ class InstallationManager(pgpm.lib.abstract_deploy.AbstractDeploymentManager):
         # Commit transaction
         self._conn.commit()
 
-        self._conn.close()
+        self._release_connection()
 
         return 0
 
+    @pgpm.lib.abstract_deploy.release_connection_on_error
     def uninstall_pgpm_from_db(self):
         """
         Removes pgpm from db and all related metadata (_pgpm schema). Install packages are left as they are
@@ -186,8 +190,6 @@ class InstallationManager(pgpm.lib.abstract_deploy.AbstractDeploymentManager):
         """
         drop_schema_cascade_script = 'DROP SCHEMA {schema_name} CASCADE;'
 
-        if self._conn.closed:
-            self._conn = psycopg2.connect(self._connection_string, connection_factory=pgpm.lib.utils.db.MegaConnection)
 
         cur = self._conn.cursor()
 
@@ -209,7 +211,7 @@ class InstallationManager(pgpm.lib.abstract_deploy.AbstractDeploymentManager):
         # Commit transaction
         self._conn.commit()
 
-        self._conn.close()
+        self._release_connection()
 
         return 0
 
@@ -234,7 +236,7 @@ class InstallationManager(pgpm.lib.abstract_deploy.AbstractDeploymentManager):
                 if migrate_or_leave:
                     self._logger.debug('Running version upgrade script {0}'.format(file_info))
                     self._logger.debug(migration_script)
-                    cur.execute(migration_script)
+                    cur.execute(self._prepare_settings_script(migration_script))
                     self._conn.commit()
                     pgpm.lib.utils.db.SqlScriptsHelper.set_search_path(cur, self._pgpm_schema_name)
                     cur.callproc('_add_migration_info', [versions_list[0][0], versions_list[0][1]])
@@ -244,5 +246,5 @@ class InstallationManager(pgpm.lib.abstract_deploy.AbstractDeploymentManager):
         if not migrate_or_leave:
             self._logger.error('{0} schema version is outdated. Please run pgpm install --upgrade first.'
                                .format(self._pgpm_schema_name))
-            self._conn.close()
+            self._release_connection()
             sys.exit(1)
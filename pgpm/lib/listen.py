@@ -0,0 +1,207 @@
+import collections
+import json
+import logging
+import select
+import time
+
+import psycopg2
+import psycopg2.extensions
+
+import pgpm.lib.utils.db
+
+# channels pgpm notifies on. Package deployments are notified on a channel per package
+DEPLOYMENT_EVENTS_CHANNEL_PREFIX = 'deployment_events$$'
+DDL_CHANGE_CHANNEL = 'ddl_change'
+
+
+def get_package_channel(package_name):
+    """
+    :param package_name: package name
+    :return: channel deployments of the package are notified on
+    """
+    return DEPLOYMENT_EVENTS_CHANNEL_PREFIX + package_name
+
+
+class Notification(collections.namedtuple('Notification', ['channel', 'payload', 'pid', 'received'])):
+    """
+    Notification received from the DB
+    """
+    __slots__ = ()
+
+    @property
+    def package_name(self):
+        """
+        :return: name of deployed package if it's a deployment notification, otherwise None
+        """
+        if self.channel.startswith(DEPLOYMENT_EVENTS_CHANNEL_PREFIX):
+            return self.channel[len(DEPLOYMENT_EVENTS_CHANNEL_PREFIX):]
+        return None
+
+    def to_dict(self):
+        return {
+            'channel': self.channel,
+            'package': self.package_name,
+            'payload': self.payload,
+            'pid': self.pid,
+            'received': self.received
+        }
+
+
+class NotificationBatcher(object):
+    """
+    Collects notifications and releases them in batches. Batch is released when no new notification
+    came for debounce interval, when it's been collecting for max delay or when it reaches max size.
+    Same notifications (channel and payload) within a batch are collapsed to the last one if requested
+    """
+    def __init__(self, debounce_interval=0.5, max_delay=5.0, max_batch_size=1000, collapse=False):
+        """
+        :param debounce_interval: seconds of quiet after which batch is released
+        :param max_delay: max seconds since the first notification of a batch after which batch is released
+        :param max_batch_size: max number of notifications in a batch
+        :param collapse: whether to collapse same notifications within a batch
+        """
+        self.debounce_interval = debounce_interval
+        self.max_delay = max_delay
+        self.max_batch_size = max_batch_size
+        self.collapse = collapse
+        self._notifications = collections.OrderedDict() if collapse else []
+        self._first_received = None
+        self._last_received = None
+
+    def __len__(self):
+        return len(self._notifications)
+
+    def add(self, notification):
+        """
+        :param notification: Notification
+        """
+        if self.collapse:
+            key = (notification.channel, notification.payload)
+            self._notifications.pop(key, None)
+            self._notifications[key] = notification
+        else:
+            self._notifications.append(notification)
+        if self._first_received is None:
+            self._first_received = notification.received
+        self._last_received = notification.received
+
+    def get_timeout(self, now):
+        """
+        :param now: current time
+        :return: seconds until current batch is due or None if there is nothing to release
+        """
+        if not self._notifications:
+            return None
+        if len(self._notifications) >= self.max_batch_size:
+            return 0
+        due = self._last_received + self.debounce_interval
+        if self.max_delay is not None:
+            due = min(due, self._first_received + self.max_delay)
+        return max(due - now, 0)
+
+    def pop_batch(self, now, force=False):
+        """
+        Releases current batch if it's due
+        :param now: current time
+        :param force: release batch even if it's not due
+        :return: list of notifications in the order of receiving. Empty if batch is not due
+        """
+        timeout = self.get_timeout(now)
+        if timeout is None or (timeout > 0 and not force):
+            return []
+        batch = list(self._notifications.values()) if self.collapse else self._notifications
+        self._notifications = collections.OrderedDict() if self.collapse else []
+        self._first_received = None
+        self._last_received = None
+        return batch
+
+
+class Listener(object):
+    """
+    Listens to pgpm notifications and delivers them in batches to a callback. Waits for notifications
+    with select() so that no CPU is used while there are none. Needs its own session connection,
+    so DB can't be connected through transaction-mode poolers
+    """
+    def __init__(self, connection_string, channels, batcher=None, logger=None):
+        """
+        :param connection_string: connection string consumable by DBAPI 2.0
+        :param channels: list of channels to listen on (see get_package_channel and DDL_CHANGE_CHANNEL)
+        :param batcher: NotificationBatcher. Default one if omitted
+        :param logger: logger object
+        """
+        self._connection_string = connection_string
+        self._channels = list(channels)
+        self._batcher = batcher or NotificationBatcher()
+        self._logger = logger or logging.getLogger(__name__)
+        self._is_stopped = False
+
+    def stop(self):
+        """
+        Makes listen return after current batch is delivered. Can be called from another thread
+        """
+        self._is_stopped = True
+
+    def listen(self, callback, timeout=None, poll_interval=1.0):
+        """
+        Listens until stopped or timed out. Pending notifications are delivered before returning
+        (but not if listening fails or is interrupted, so that callback isn't called while an exception propagates)
+        :param callback: callable taking list of Notification objects
+        :param timeout: seconds to listen for. Forever if omitted
+        :param poll_interval: max seconds between checks whether listener was stopped
+        :return: number of delivered notifications
+        """
+        delivered_count = 0
+        deadline = time.time() + timeout if timeout is not None else None
+        conn = psycopg2.connect(self._connection_string, connection_factory=pgpm.lib.utils.db.MegaConnection)
+        conn.init(self._logger)
+        try:
+            conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            cur = conn.cursor()
+            for channel in self._channels:
+                cur.execute('LISTEN "{0}";'.format(channel.replace('"', '""')))
+            self._logger.debug('Listening on channels {0}'.format(', '.join(self._channels)))
+
+            while not self._is_stopped:
+                now = time.time()
+                if deadline is not None and now >= deadline:
+                    break
+                wait_time = poll_interval
+                batch_timeout = self._batcher.get_timeout(now)
+                if batch_timeout is not None:
+                    wait_time = min(wait_time, batch_timeout)
+                if deadline is not None:
+                    wait_time = min(wait_time, deadline - now)
+
+                if select.select([conn], [], [], wait_time)[0]:
+                    conn.poll()
+                    received = time.time()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        self._batcher.add(Notification(notify.channel, notify.payload, notify.pid, received))
+
+                batch = self._batcher.pop_batch(time.time())
+                if batch:
+                    callback(batch)
+                    delivered_count += len(batch)
+
+            batch = self._batcher.pop_batch(time.time(), force=True)
+            if batch:
+                callback(batch)
+                delivered_count += len(batch)
+        finally:
+            conn.close()
+
+        return delivered_count
+
+
+def get_jsonl_writer(stream):
+    """
+    :param stream: file-like object
+    :return: callback for Listener that writes every notification as a JSON line
+    """
+    def write_batch(batch):
+        for notification in batch:
+            # JSON is ASCII only, so the line is text on Python 2 as well and can be written to text streams
+            stream.write(u'{0}\n'.format(json.dumps(notification.to_dict(), sort_keys=True)))
+        stream.flush()
+    return write_batch
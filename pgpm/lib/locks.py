@@ -0,0 +1,252 @@
+import collections
+import re
+
+import pgpm.lib.utils.sql
+
+# table lock levels from the weakest to the strongest. Levels from SHARE up block writes to the table
+LOCK_LEVELS = ('ACCESS SHARE', 'ROW SHARE', 'ROW EXCLUSIVE', 'SHARE UPDATE EXCLUSIVE', 'SHARE',
+               'SHARE ROW EXCLUSIVE', 'EXCLUSIVE', 'ACCESS EXCLUSIVE')
+ACCESS_EXCLUSIVE = 'ACCESS EXCLUSIVE'
+SHARE_ROW_EXCLUSIVE = 'SHARE ROW EXCLUSIVE'
+SHARE = 'SHARE'
+SHARE_UPDATE_EXCLUSIVE = 'SHARE UPDATE EXCLUSIVE'
+ROW_EXCLUSIVE = 'ROW EXCLUSIVE'
+
+RISK_LOW = 'low'
+RISK_MEDIUM = 'medium'
+RISK_HIGH = 'high'
+RISKS = (RISK_LOW, RISK_MEDIUM, RISK_HIGH)
+
+# tables with at least this number of rows are considered big
+DEFAULT_BIG_TABLE_ROWS = 1000000
+# first version where ADD COLUMN with non volatile DEFAULT doesn't rewrite the table
+_FAST_DEFAULT_SERVER_VERSION = 110000
+
+_LITERAL_RE = re.compile(r"'(?:[^'\\]|\\.|'')*'|(\$(?:[^\W\d]\w*)?\$).*?\1", flags=re.DOTALL | re.UNICODE)
+_ADD_CONSTRAINT_RE = re.compile(r'^ADD (?:CONSTRAINT \S+ )?(CHECK|FOREIGN KEY|PRIMARY KEY|UNIQUE|EXCLUDE)\b')
+_ADD_COLUMN_RE = re.compile(r'^ADD (?:COLUMN )?(?:IF NOT EXISTS )?\S+ (.*)$')
+_ALTER_COLUMN_RE = re.compile(r'^ALTER (?:COLUMN )?\S+ (.*)$')
+_VOLATILE_DEFAULT_RE = re.compile(r'\b(?:RANDOM|CLOCK_TIMESTAMP|TIMEOFDAY|NEXTVAL|GEN_RANDOM_UUID|UUID_GENERATE_V\d\w*)'
+                                  r'\s*\(')
+_LOCK_MODE_RE = re.compile(r'\bIN ((?:\w+ )+)MODE\b')
+_QUOTED_IDENTIFIER_RE = re.compile(r'"(?:[^"]|"")*"')
+_WHERE_OR_PARENTHESIS_RE = re.compile(r'\(|\)|\bWHERE\b')
+
+# lock taken by a statement on a table. Rewrite means that the whole table is rewritten, scan that it's read
+# through (e.g. to validate a constraint or build an index) while the lock is held
+StatementLock = collections.namedtuple('StatementLock', ['statement_type', 'table', 'lock_level', 'rewrite', 'scan',
+                                                         'notes'])
+
+
+def _normalise(statement):
+    """
+    Strips comments, replaces literals with empty strings, collapses whitespaces and upper cases statement
+    so that keywords can be looked for with simple regular expressions
+    """
+    statement = _LITERAL_RE.sub("''", pgpm.lib.utils.sql.strip_comments(statement))
+    return ' '.join(statement.split()).upper()
+
+
+def _has_top_level_where(normalised_statement):
+    """
+    Checks if statement has WHERE clause of its own, not only within a subquery or CTE
+    :param normalised_statement: statement as returned by _normalise
+    """
+    depth = 0
+    for token_match in _WHERE_OR_PARENTHESIS_RE.finditer(_QUOTED_IDENTIFIER_RE.sub('""', normalised_statement)):
+        token = token_match.group(0)
+        if token == '(':
+            depth += 1
+        elif token == ')':
+            depth = max(depth - 1, 0)
+        elif depth == 0:
+            return True
+    return False
+
+
+def _get_stronger_lock(lock_level, other_lock_level):
+    return max(lock_level, other_lock_level, key=LOCK_LEVELS.index)
+
+
+def _analyze_alter_table_action(action, server_version):
+    """
+    :param action: normalised action of ALTER TABLE statement
+    :param server_version: Postgres server version as integer (e.g. 90605, 110002)
+    :return: tuple (lock level, rewrite, scan, note or None)
+    """
+    constraint_match = _ADD_CONSTRAINT_RE.match(action)
+    if constraint_match:
+        constraint_type = constraint_match.group(1)
+        if constraint_type in ('CHECK', 'FOREIGN KEY'):
+            lock_level = SHARE_ROW_EXCLUSIVE if constraint_type == 'FOREIGN KEY' else ACCESS_EXCLUSIVE
+            if ' NOT VALID' in action:
+                return lock_level, False, False, None
+            return lock_level, False, True, '{0} constraint is validated against all rows, add it NOT VALID ' \
+                                            'and VALIDATE CONSTRAINT separately'.format(constraint_type)
+        if ' USING INDEX ' in action:
+            return ACCESS_EXCLUSIVE, False, False, None
+        return ACCESS_EXCLUSIVE, False, True, '{0} constraint builds an index, ' \
+                                              'create the index CONCURRENTLY beforehand'.format(constraint_type)
+
+    column_match = _ADD_COLUMN_RE.match(action)
+    if column_match:
+        definition = ' ' + column_match.group(1)
+        if 'SERIAL' in definition.split(' ')[1]:
+            return ACCESS_EXCLUSIVE, True, False, 'serial column is filled with sequence values'
+        if ' GENERATED ALWAYS AS (' in definition and ' STORED' in definition:
+            return ACCESS_EXCLUSIVE, True, False, 'stored generated column is computed for all rows'
+        if ' DEFAULT ' in definition:
+            if server_version < _FAST_DEFAULT_SERVER_VERSION:
+                return ACCESS_EXCLUSIVE, True, False, 'column with DEFAULT rewrites the table before Postgres 11'
+            if _VOLATILE_DEFAULT_RE.search(definition):
+                return ACCESS_EXCLUSIVE, True, False, 'column with volatile DEFAULT rewrites the table'
+        return ACCESS_EXCLUSIVE, False, False, None
+
+    column_match = _ALTER_COLUMN_RE.match(action)
+    if column_match:
+        column_action = column_match.group(1)
+        if column_action.startswith('TYPE ') or column_action.startswith('SET DATA TYPE '):
+            return ACCESS_EXCLUSIVE, True, False, 'type change rewrites the table unless types are binary coercible'
+        if column_action.startswith('SET NOT NULL'):
+            return ACCESS_EXCLUSIVE, False, True, 'SET NOT NULL checks all rows'
+        if column_action.startswith('SET STATISTICS') or column_action.startswith('SET (') or \
+                column_action.startswith('RESET ('):
+            return SHARE_UPDATE_EXCLUSIVE, False, False, None
+        return ACCESS_EXCLUSIVE, False, False, None
+
+    if action.startswith('VALIDATE CONSTRAINT '):
+        return SHARE_UPDATE_EXCLUSIVE, False, True, None
+    if action.startswith('SET TABLESPACE ') or action in ('SET LOGGED', 'SET UNLOGGED', 'SET WITHOUT OIDS'):
+        return ACCESS_EXCLUSIVE, True, False, '{0} rewrites the table'.format(
+            'SET TABLESPACE' if action.startswith('SET TABLESPACE ') else action)
+    if action.startswith('SET (') or action.startswith('RESET (') or action.startswith('CLUSTER ON ') or \
+            action == 'SET WITHOUT CLUSTER':
+        return SHARE_UPDATE_EXCLUSIVE, False, False, None
+    if re.match(r'^(?:ENABLE|DISABLE) (?:ALWAYS |REPLICA )?TRIGGER\b', action):
+        return SHARE_ROW_EXCLUSIVE, False, False, None
+    return ACCESS_EXCLUSIVE, False, False, None
+
+
+def analyze_statement(statement, server_version):
+    """
+    Finds out which lock a statement takes on an existing table and whether it rewrites or scans the table
+    while holding the lock. Analysis is static and errs on the side of caution, e.g. any type change
+    is considered a rewrite
+    :param statement: SQL statement
+    :param server_version: Postgres server version as integer (e.g. 90605, 110002)
+    :return: StatementLock or None if statement doesn't lock an existing table (e.g. CREATE TABLE or CREATE FUNCTION)
+    """
+    table = pgpm.lib.utils.sql.get_statement_table(statement)
+    if not table:
+        return None
+    statement_type = pgpm.lib.utils.sql.get_statement_type(statement)
+    normalised_statement = _normalise(statement)
+    notes = []
+
+    if statement_type == 'ALTER':
+        lock_level = SHARE_UPDATE_EXCLUSIVE
+        rewrite = scan = False
+        for action in pgpm.lib.utils.sql.get_alter_table_actions(statement):
+            action_lock_level, action_rewrite, action_scan, note = \
+                _analyze_alter_table_action(_normalise(action), server_version)
+            lock_level = _get_stronger_lock(lock_level, action_lock_level)
+            rewrite = rewrite or action_rewrite
+            scan = scan or action_scan
+            if note:
+                notes.append(note)
+        return StatementLock(statement_type, table, lock_level, rewrite, scan, notes)
+
+    if statement_type == 'CREATE':
+        index_creation = pgpm.lib.utils.sql.get_index_creation(statement)
+        if not index_creation:
+            return None
+        if index_creation[1]:
+            notes.append('CREATE INDEX CONCURRENTLY cannot run inside the deployment transaction')
+            return StatementLock(statement_type, table, SHARE_UPDATE_EXCLUSIVE, False, True, notes)
+        notes.append('index build blocks writes, create the index CONCURRENTLY outside of deployment')
+        return StatementLock(statement_type, table, SHARE, False, True, notes)
+
+    if statement_type == 'LOCK':
+        lock_mode_match = _LOCK_MODE_RE.search(normalised_statement)
+        lock_level = lock_mode_match.group(1).strip() if lock_mode_match else ACCESS_EXCLUSIVE
+        if lock_level not in LOCK_LEVELS:
+            lock_level = ACCESS_EXCLUSIVE
+        return StatementLock(statement_type, table, lock_level, False, False, notes)
+
+    if statement_type == 'CLUSTER':
+        return StatementLock(statement_type, table, ACCESS_EXCLUSIVE, True, False, ['CLUSTER rewrites the table'])
+
+    if statement_type in ('UPDATE', 'DELETE'):
+        # row locks are held on all changed rows until the deployment is committed
+        scan = not _has_top_level_where(normalised_statement)
+        if scan:
+            notes.append('{0} without WHERE changes all rows'.format(statement_type))
+        return StatementLock(statement_type, table, ROW_EXCLUSIVE, False, scan, notes)
+
+    if statement_type == 'INSERT':
+        return StatementLock(statement_type, table, ROW_EXCLUSIVE, False, False, notes)
+
+    # DROP TABLE and TRUNCATE
+    return StatementLock(statement_type, table, ACCESS_EXCLUSIVE, False, False, notes)
+
+
+def analyze_statement_locks(statement, server_version):
+    """
+    Finds locks a statement takes on every table it works on, e.g. on all tables listed by TRUNCATE.
+    See analyze_statement
+    :param statement: SQL statement
+    :param server_version: Postgres server version as integer (e.g. 90605, 110002)
+    :return: list of StatementLock, one per table. Empty if statement doesn't lock an existing table
+    """
+    statement_lock = analyze_statement(statement, server_version)
+    if not statement_lock:
+        return []
+    return [statement_lock._replace(table=table) for table in pgpm.lib.utils.sql.get_statement_tables(statement)]
+
+
+def get_risk(statement_lock, table_rows, big_table_rows=DEFAULT_BIG_TABLE_ROWS):
+    """
+    Rates risk of a statement for concurrent traffic:
+    high for rewriting or scanning a big table while blocking writes and for statements that can't run
+    in the deployment transaction, medium for other write blocking locks and for rewrites or scans of big tables,
+    low otherwise (including tables with unknown size, e.g. created by the same deployment)
+    :param statement_lock: StatementLock
+    :param table_rows: estimated number of rows in the table or None if unknown. Negative estimates
+    (reltuples of never analyzed tables since Postgres 14) are treated as unknown
+    :param big_table_rows: number of rows from which a table is considered big
+    :return: one of RISKS
+    """
+    if statement_lock.statement_type == 'CREATE' and statement_lock.lock_level == SHARE_UPDATE_EXCLUSIVE:
+        return RISK_HIGH
+    if table_rows is not None and table_rows < 0:
+        table_rows = None
+    is_blocking_writes = LOCK_LEVELS.index(statement_lock.lock_level) >= LOCK_LEVELS.index(SHARE)
+    is_big_table = table_rows is not None and table_rows >= big_table_rows
+    is_heavy = statement_lock.rewrite or statement_lock.scan
+    if is_big_table and is_heavy:
+        return RISK_HIGH if is_blocking_writes else RISK_MEDIUM
+    if is_blocking_writes and table_rows:
+        return RISK_MEDIUM if is_big_table or is_heavy else RISK_LOW
+    return RISK_LOW
+
+
+def format_lock_risk(lock_risk):
+    """
+    :param lock_risk: dict with file, statement, statement_type, schema, table, lock_level, rewrite, scan, notes,
+    rows and risk of a statement as listed by DeploymentManager.plan_deployment
+    :return: one line description of the risk
+    """
+    table_name = '{0}.{1}'.format(lock_risk['schema'], lock_risk['table']) if lock_risk['schema'] \
+        else lock_risk['table']
+    rows = 'unknown number of' if lock_risk['rows'] is None else lock_risk['rows']
+    description = '{0} lock risk in {1}: {2} takes {3} lock on {4} ({5} rows)'.format(
+        lock_risk['risk'].capitalize(), lock_risk['file'], lock_risk['statement_type'], lock_risk['lock_level'],
+        table_name, rows)
+    if lock_risk['rewrite']:
+        description += ' and rewrites it'
+    elif lock_risk['scan']:
+        description += ' and scans it'
+    if lock_risk['notes']:
+        notes = '; '.join(lock_risk['notes'])
+        description += '. ' + notes[0].upper() + notes[1:]
+    return description
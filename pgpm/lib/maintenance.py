@@ -0,0 +1,49 @@
+import pgpm.lib.abstract_deploy
+
+
+class MaintenanceManager(pgpm.lib.abstract_deploy.AbstractDeploymentManager):
+    """
+    Class that will manage maintenance of pgpm schema (e.g. pruning of logs)
+    """
+    DEFAULT_PRUNE_BATCH_SIZE = 10000
+
+    def __init__(self, connection_string, pgpm_schema_name='_pgpm', logger=None, transaction_pooling=False,
+                 connection_pool=None):
+        """
+        initialises the manager
+        :param connection_string: connection string consumable by DBAPI 2.0
+        :param logger: logger object
+        :param transaction_pooling: DB is connected through transaction-mode pooler
+        :param connection_pool: ConnectionPool to take connections from
+        """
+        super(MaintenanceManager, self).__init__(connection_string, pgpm_schema_name, logger, transaction_pooling,
+                                                 connection_pool)
+
+    @pgpm.lib.abstract_deploy.release_connection_on_error
+    def prune_ddl_changes_log(self, older_than='90 days', batch_size=DEFAULT_PRUNE_BATCH_SIZE, archive=True):
+        """
+        Removes old changes from DDL changes log in batches. Every batch is committed separately
+        so that the log can be pruned while DDL is being logged
+        :param older_than: interval (in Postgres notation) changes older than which are removed
+        :param batch_size: max number of changes removed in one transaction
+        :param archive: whether removed changes are moved to archive table
+        :return: number of removed changes
+        """
+        cur = self._conn.cursor()
+
+        self._check_pgpm_schema(self._get_catalog(), 'prune logs in')
+
+        self._logger.debug('Pruning DDL changes older than {0} in batches of {1}'.format(older_than, batch_size))
+        pruned_count = 0
+        batch_pruned_count = None
+        while batch_pruned_count != 0:
+            cur.callproc('{0}._prune_ddl_changes_log'.format(self._pgpm_schema_name),
+                         [older_than, batch_size, archive])
+            batch_pruned_count = cur.fetchone()[0]
+            self._conn.commit()
+            pruned_count += batch_pruned_count
+            self._logger.debug('{0} DDL changes pruned'.format(pruned_count))
+
+        self._release_connection()
+
+        return pruned_count
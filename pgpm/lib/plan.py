@@ -0,0 +1,325 @@
+import collections
+import logging
+import os
+import re
+
+import pgpm.lib.utils
+import pgpm.lib.utils.misc
+import pgpm.lib.utils.sql
+import pgpm.lib.utils.timing
+
+
+class FileScript(object):
+    """
+    Script that is kept in memory only when it's needed. Used for table scripts as most of them are
+    normally skipped for being executed before. Only size and modification time of the file are taken when plan
+    is compiled. Content is hashed when the script is read first and verified when it's read again,
+    so that plan doesn't change if file is changed afterwards
+    """
+    def __init__(self, file_path, content_hash=None):
+        """
+        :param file_path: path to the file with the script
+        :param content_hash: hash of the script to verify content with. Taken when the script is read first if omitted
+        """
+        self.file_path = file_path
+        self.content_hash = content_hash
+        self._file_stat = self._get_file_stat()
+
+    def _get_file_stat(self):
+        file_stat = os.stat(self.file_path)
+        return file_stat.st_size, file_stat.st_mtime
+
+    def read(self):
+        """
+        :return: content of the script
+        """
+        if self._get_file_stat() != self._file_stat:
+            raise ValueError('File {0} was changed after deployment plan was compiled'.format(self.file_path))
+        script = pgpm.lib.utils.misc.read_script_file(self.file_path)
+        content_hash = pgpm.lib.utils.misc.get_content_hash(script)
+        if self.content_hash is None:
+            self.content_hash = content_hash
+        elif content_hash != self.content_hash:
+            raise ValueError('File {0} was changed after deployment plan was compiled'.format(self.file_path))
+        return script
+
+
+class DeploymentPlan(object):
+    """
+    Precompiled deployment of a package. Holds scripts collected from sources already put in execution order,
+    so that the same plan can be applied to any number of DBs without collecting or parsing scripts again.
+    Table scripts are read from their files when deployed and verified against their size and modification time
+    taken at compile time.
+    Plan is not supposed to be changed once compiled
+    """
+    SCRIPT_TYPES = ('type', 'table', 'function', 'view', 'trigger')
+
+    def __init__(self, config, type_scripts, type_drop_statements, type_ordered_statements, type_unordered_statements,
+                 table_scripts, function_scripts, view_scripts, trigger_scripts, files_deployment=None, vcs_ref=None,
+                 timings=None):
+        """
+        :param config: SchemaConfiguration object
+        :param type_scripts: list of tuples (key, script) with type scripts as collected from sources
+        :param type_drop_statements: list of DROP statements from type scripts
+        :param type_ordered_statements: list of CREATE statements from type scripts in dependency order
+        :param type_unordered_statements: list of the rest of statements from type scripts
+        :param table_scripts: list of tuples (key, script source) with table scripts in execution order.
+        Script source is any object with read() method returning content of the script (e.g. FileScript)
+        :param function_scripts: list of tuples (key, script) with function scripts
+        :param view_scripts: list of tuples (key, script) with view scripts
+        :param trigger_scripts: list of tuples (key, script) with trigger scripts
+        :param files_deployment: list of files if plan was compiled for specific files only
+        :param vcs_ref: vcs reference of the sources plan was compiled from
+        :param timings: Timings of plan compilation if plan was compiled from sources
+        """
+        self._config = config
+        self._scripts = {
+            'type': tuple(type_scripts),
+            'table': tuple(table_scripts),
+            'function': tuple(function_scripts),
+            'view': tuple(view_scripts),
+            'trigger': tuple(trigger_scripts)
+        }
+        self._type_drop_statements = tuple(type_drop_statements)
+        self._type_ordered_statements = tuple(type_ordered_statements)
+        self._type_unordered_statements = tuple(type_unordered_statements)
+        self._files_deployment = tuple(files_deployment) if files_deployment else None
+        self._vcs_ref = vcs_ref
+        self._timings = timings
+
+    @property
+    def config(self):
+        return self._config
+
+    @property
+    def files_deployment(self):
+        return list(self._files_deployment) if self._files_deployment else None
+
+    @property
+    def vcs_ref(self):
+        return self._vcs_ref
+
+    @property
+    def timings(self):
+        return self._timings
+
+    @property
+    def type_drop_statements(self):
+        return self._type_drop_statements
+
+    @property
+    def type_ordered_statements(self):
+        return self._type_ordered_statements
+
+    @property
+    def type_unordered_statements(self):
+        return self._type_unordered_statements
+
+    def get_scripts(self, script_type):
+        """
+        returns scripts of a specific type
+        :param script_type: one of SCRIPT_TYPES
+        :return: tuple of tuples (key, script) in execution order. For table scripts script source
+        is returned instead of script, content is taken with its read() method
+        """
+        return self._scripts[script_type]
+
+    def get_requested_files(self, script_type):
+        """
+        returns list of files requested for deployment for a specific type of scripts.
+        If plan was compiled for specific files then they are all reported as function scripts as before
+        :param script_type: one of SCRIPT_TYPES
+        :return: list of keys
+        """
+        if self._files_deployment:
+            if script_type == 'function':
+                return list(self._files_deployment)
+            return []
+        return [key for key, value in self._scripts[script_type]]
+
+    @classmethod
+    def compile(cls, config, source_code_path, files_deployment=None, compare_table_scripts_as_int=False,
+                vcs_ref=None, logger=None):
+        """
+        Collects scripts from sources of the package and puts them in execution order
+        :param config: SchemaConfiguration object
+        :param source_code_path: path to where package is
+        :param files_deployment: if specific script to be deployed, only find them
+        :param compare_table_scripts_as_int: order table scripts by names converted to int
+        :param vcs_ref: vcs reference. If omitted, taken from git repository sources are in (if any)
+        :param logger: logger object
+        :return: DeploymentPlan
+        """
+        logger = logger or logging.getLogger(__name__)
+        # imported here so that plans loaded from bundles can be deployed without vcs libraries
+        import pgpm.lib.utils.vcs
+        timings = pgpm.lib.utils.timing.Timings()
+
+        # Check if in git repo
+        if not vcs_ref:
+            if pgpm.lib.utils.vcs.is_git_directory(source_code_path):
+                vcs_ref = pgpm.lib.utils.vcs.get_git_revision_hash(source_code_path)
+                logger.debug('commit reference to be deployed is {0}'.format(vcs_ref))
+            else:
+                logger.debug('Folder is not a known vcs repository')
+
+        logger.debug('Configuration of package {0} of version {1} loaded successfully.'
+                     .format(config.name, config.version.raw))  # TODO: change to to_string once discussed
+
+        # Get scripts
+        with timings.phase('collect_files'):
+            type_scripts_dict = _get_scripts(config.types_path, files_deployment, "types", source_code_path, logger)
+            # function, view and trigger scripts are keyed by paths relative to the package as their content
+            # hashes are stored by keys
+            function_scripts_dict = _get_scripts(config.functions_path, files_deployment, "functions",
+                                                 source_code_path, logger, relative_keys=True)
+            view_scripts_dict = _get_scripts(config.views_path, files_deployment, "views", source_code_path, logger,
+                                             relative_keys=True)
+            trigger_scripts_dict = _get_scripts(config.triggers_path, files_deployment, "triggers",
+                                                source_code_path, logger, relative_keys=True)
+            # before with table scripts only file name was an identifier. Now whole relative path the file
+            # (relative to config.json)
+            # table scripts are read only if they are executed
+            table_scripts_dict = _get_script_sources(config.tables_path, files_deployment, "tables",
+                                                     source_code_path, logger)
+
+        # Reordering types
+        type_drop_statements, type_ordered_statements, type_unordered_statements = [], [], []
+        if len(type_scripts_dict) > 0:
+            with timings.phase('reorder_types'):
+                types_script = '\n'.join([''.join(value) for key, value in type_scripts_dict.items()])
+                type_drop_statements, type_ordered_statements, type_unordered_statements = \
+                    reorder_types(types_script, logger)
+
+        # Ordering table scripts
+        if compare_table_scripts_as_int:
+            table_scripts = sorted(table_scripts_dict.items(), key=lambda t: int(t[0].rsplit('.', 1)[0]))
+        else:
+            table_scripts = sorted(table_scripts_dict.items(), key=lambda t: t[0].rsplit('.', 1)[0])
+
+        return cls(config,
+                   type_scripts=type_scripts_dict.items(),
+                   type_drop_statements=type_drop_statements,
+                   type_ordered_statements=type_ordered_statements,
+                   type_unordered_statements=type_unordered_statements,
+                   table_scripts=table_scripts,
+                   function_scripts=function_scripts_dict.items(),
+                   view_scripts=view_scripts_dict.items(),
+                   trigger_scripts=trigger_scripts_dict.items(),
+                   files_deployment=files_deployment,
+                   vcs_ref=vcs_ref,
+                   timings=timings)
+
+
+def _get_scripts(scripts_path_rel, files_deployment, script_type, project_path, logger, relative_keys=False):
+    """
+    Gets scripts from specified folders
+    """
+
+    scripts_dict = {}
+    if scripts_path_rel:
+
+        logger.debug('Getting scripts with {0} definitions'.format(script_type))
+        scripts_dict = pgpm.lib.utils.misc.collect_scripts_from_sources(scripts_path_rel, files_deployment,
+                                                                        project_path, False, logger, relative_keys)
+        if len(scripts_dict) == 0:
+            logger.debug('No {0} definitions were found in {1} folder'.format(script_type, scripts_path_rel))
+    else:
+        logger.debug('No {0} folder was specified'.format(script_type))
+
+    return scripts_dict
+
+
+def _get_script_sources(scripts_path_rel, files_deployment, script_type, project_path, logger):
+    """
+    Gets scripts from specified folders as FileScript objects that are read only when deployed
+    """
+
+    scripts_dict = {}
+    if scripts_path_rel:
+
+        logger.debug('Getting paths to scripts with {0} definitions'.format(script_type))
+        paths_dict = pgpm.lib.utils.misc.collect_script_paths_from_sources(scripts_path_rel, files_deployment,
+                                                                           project_path, logger)
+        scripts_dict = dict((key, FileScript(value)) for key, value in paths_dict.items())
+        if len(scripts_dict) == 0:
+            logger.debug('No {0} definitions were found in {1} folder'.format(script_type, scripts_path_rel))
+    else:
+        logger.debug('No {0} folder was specified'.format(script_type))
+
+    return scripts_dict
+
+
+def reorder_types(types_script, logger=None):
+    """
+    Takes type scripts and reorders them to avoid Type doesn't exist exception.
+    Type is considered to depend on another type if name of the latter is found in its definition.
+    Names are looked up in an index of identifiers of every definition and definitions are then
+    topologically sorted so that the whole ordering is linear in size of scripts.
+    Definitions keep their original order unless a dependency requires otherwise
+    :param types_script: all type scripts joined together
+    :param logger: logger object
+    :return: tuple with lists of drop statements, ordered create statements and the rest of statements
+    """
+    logger = logger or logging.getLogger(__name__)
+    logger.debug('Reordering types definitions scripts to avoid "type does not exist" exceptions')
+    _type_name_re = re.compile(r'\bcreate\s+\b(?:type|domain)\s+\b(\w+\.\w+|\w+)\b', flags=re.IGNORECASE)
+    _type_statements_dict = collections.OrderedDict()  # type name -> create statement
+    type_unordered_scripts = []  # scripts to execute without order
+    type_drop_scripts = []  # drop scripts to execute first
+    for _type_statement in pgpm.lib.utils.sql.iter_statements(types_script):
+        _type_statement_type = pgpm.lib.utils.sql.get_statement_type(_type_statement)
+        # we need only type declarations to be ordered
+        if _type_statement_type == 'CREATE':
+            _type_name = _type_name_re.findall(_type_statement)[0]
+            _type_statements_dict[str(_type_name).lower()] = _type_statement
+        elif _type_statement_type == 'DROP':
+            type_drop_scripts.append(_type_statement)
+        else:
+            type_unordered_scripts.append(_type_statement)
+
+    # dependencies: every identifier of a definition that is a name of another type
+    _type_names = list(_type_statements_dict.keys())
+    _dependants = dict((_type_name, []) for _type_name in _type_names)
+    _deps_count = dict((_type_name, 0) for _type_name in _type_names)
+    for _type_name, _type_statement in _type_statements_dict.items():
+        for _dep_name in _get_identifiers(_type_statement):
+            if _dep_name != _type_name and _dep_name in _dependants:
+                _dependants[_dep_name].append(_type_name)
+                _deps_count[_type_name] += 1
+
+    # Kahn's algorithm
+    _ready = collections.deque(_type_name for _type_name in _type_names if _deps_count[_type_name] == 0)
+    type_ordered_scripts = []  # ordered list with scripts to execute
+    while _ready:
+        _type_name = _ready.popleft()
+        type_ordered_scripts.append(_type_statements_dict[_type_name])
+        for _dependant_name in _dependants[_type_name]:
+            _deps_count[_dependant_name] -= 1
+            if _deps_count[_dependant_name] == 0:
+                _ready.append(_dependant_name)
+
+    if len(type_ordered_scripts) < len(_type_names):
+        _unresolved_names = [_type_name for _type_name in _type_names if _deps_count[_type_name] > 0]
+        logger.error('Types have cyclic dependencies: {0}'.format(', '.join(_unresolved_names)))
+        raise ValueError('Types have cyclic dependencies: {0}'.format(', '.join(_unresolved_names)))
+
+    return type_drop_scripts, type_ordered_scripts, type_unordered_scripts
+
+
+_IDENTIFIER_RE = re.compile(r'\w+(?:\.\w+)?')
+
+
+def _get_identifiers(statement):
+    """
+    Collects identifiers used in a statement. For qualified names both full name and the name
+    without schema are collected. Identifiers are lower cased as type names are case insensitive
+    :param statement: SQL statement
+    :return: set of identifiers
+    """
+    identifiers = set()
+    for identifier in _IDENTIFIER_RE.findall(statement.lower()):
+        identifiers.add(identifier)
+        if '.' in identifier:
+            identifiers.update(identifier.split('.'))
+    return identifiers
@@ -111,6 +111,24 @@ class SchemaConfiguration(object):
         else:
             raise ValueError("Empty configuration")
 
+    def to_dict(self):
+        """
+        dictionary with configuration that doesn't depend on where package sources are (paths are omitted).
+        SchemaConfiguration can be initialised back from it
+        :return: dict
+        """
+        return {
+            "name": self.name,
+            "subclass": self.subclass,
+            "version": self.version.raw,
+            "description": self.description,
+            "license": self.license,
+            "owner_role": self.owner_role,
+            "usage_roles": self.usage_roles,
+            "dependencies": self.dependencies,
+            "scope": self.scope
+        }
+
 
 class VersionTypes(object):
     """
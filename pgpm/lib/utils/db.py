@@ -1,7 +1,13 @@
+import collections
 import psycopg2
 import psycopg2.extensions
 import logging
 import re
+import threading
+
+import pgpm.lib.utils.instrumentation
+import pgpm.lib.utils.sql
+import pgpm.lib.utils.timing
 try:
     from urlparse import urlparse
 except ImportError:
@@ -46,26 +52,145 @@ def parse_connection_string_psycopg2(connection_string):
     return conn_prepared
 
 
+# queries that may change search_path of a session (including rolling back earlier SET)
+_SEARCH_PATH_CHANGE_RE = re.compile(r'search_path|\breset\b|\bdiscard\b|\brollback\b', re.IGNORECASE)
+# SET keyword of a SET statement (after leading comments) that is not local already
+_SESSION_SET_RE = re.compile(r'^((?:\s+|--[^\n]*(?:\n|$)|/\*.*?\*/)*)SET\s+(?!LOCAL\b)(?:SESSION\s+)?',
+                             re.IGNORECASE | re.DOTALL)
+
+
+class NoticeStream(object):
+    """
+    Replaces `notices` list of a connection. psycopg2 appends notices to it as they come from the server
+    and they are forwarded to the logger and to callbacks right away. Only the last `maxlen` notices are kept
+    """
+    def __init__(self, logger=None, maxlen=50, level=logging.DEBUG):
+        """
+        :param logger: logger object notices are logged to
+        :param maxlen: max number of notices kept
+        :param level: logging level of notices
+        """
+        self.logger = logger or logging.getLogger(__name__)
+        self.level = level
+        self.callbacks = []
+        self._notices = collections.deque(maxlen=maxlen)
+
+    def append(self, notice):
+        self._notices.append(notice)
+        if self.logger.isEnabledFor(self.level):
+            self.logger.log(self.level, notice.rstrip())
+        for callback in self.callbacks:
+            callback(notice)
+
+    def clear(self):
+        self._notices.clear()
+
+    def __len__(self):
+        return len(self._notices)
+
+    def __iter__(self):
+        return iter(self._notices)
+
+    def __getitem__(self, index):
+        return self._notices[index]
+
+
 class MegaConnection(psycopg2.extensions.connection):
     """
     A connection that uses `MegaCursor` automatically.
+    Tracks search_path of the session so that it's not set again to the same value.
+    If `transaction_pooling` is set, session settings are applied with SET LOCAL so that no state is left
+    on server connection shared through transaction-mode poolers like pgBouncer.
+    Instrumentation hooks (see pgpm.lib.utils.instrumentation) are called around every statement executed
+    with its cursors. `script_key` is passed to them as the script statements come from
     """
     def __init__(self, dsn, *more):
         psycopg2.extensions.connection.__init__(self, dsn, *more)
-        self._last_notice_flushed_index = -1
         self.logger = logging.getLogger(__name__)
+        self.notices = NoticeStream(self.logger)
+        self.search_path = None  # current search_path of the session or None if unknown
+        self.transaction_pooling = False
+        self.instrumentation_hooks = []  # statements are not instrumented at all while it's empty
+        self.script_key = None
+
+    def commit(self):
+        # local settings end with transaction and next one may run on another server connection
+        if self.transaction_pooling:
+            self.search_path = None
+        return super(MegaConnection, self).commit()
+
+    def rollback(self):
+        # SET is transactional so search_path may be reverted
+        self.search_path = None
+        return super(MegaConnection, self).rollback()
+
+    def track_query(self, query, failed=False):
+        """
+        Forgets known search_path if query might have changed it
+        :param query: executed query
+        :param failed: whether query failed
+        """
+        if self.search_path is None:
+            return
+        if isinstance(query, bytes):
+            query = query.decode('utf-8', 'ignore')
+        if failed or _SEARCH_PATH_CHANGE_RE.search(query):
+            self.search_path = None
+
+    def add_instrumentation_hook(self, hook):
+        """
+        :param hook: InstrumentationHook
+        """
+        self.instrumentation_hooks = self.instrumentation_hooks + [hook]
+
+    def remove_instrumentation_hook(self, hook):
+        """
+        :param hook: InstrumentationHook
+        """
+        self.instrumentation_hooks = [item for item in self.instrumentation_hooks if item is not hook]
+
+    def start_statement(self, query, statement_class=None):
+        """
+        Calls before_statement of instrumentation hooks
+        :param query: statement or name of called procedure
+        :param statement_class: class of statement. Taken from the statement if omitted
+        :return: StatementEvent to be passed to end_statement
+        """
+        event = pgpm.lib.utils.instrumentation.StatementEvent(
+            query, statement_class or pgpm.lib.utils.instrumentation.get_statement_class(query), self.script_key,
+            pgpm.lib.utils.timing.clock())
+        for hook in self.instrumentation_hooks:
+            hook.before_statement(event)
+        return event
+
+    def end_statement(self, event, rowcount, failed):
+        """
+        Calls after_statement of instrumentation hooks
+        :param event: StatementEvent returned by start_statement
+        :param rowcount: rowcount of the cursor
+        :param failed: whether statement failed
+        """
+        event.duration = pgpm.lib.utils.timing.clock() - event.start
+        event.rowcount = rowcount
+        event.failed = failed
+        for hook in self.instrumentation_hooks:
+            hook.after_statement(event)
 
     def cursor(self, *args, **kwargs):
         kwargs.setdefault('cursor_factory', MegaCursor)
         return super(MegaConnection, self).cursor(*args, **kwargs)
 
-    def fetch_new_notices(self):
-        if len(self.notices) > self._last_notice_flushed_index + 1:
-            unflushed_notices = self.notices[self._last_notice_flushed_index + 1:len(self.notices)]
-            self._last_notice_flushed_index = len(self.notices) - 1
-            return unflushed_notices
-        else:
-            return None
+    def add_notice_callback(self, callback):
+        """
+        :param callback: callable taking notice text. Called as soon as notice comes from the server
+        """
+        self.notices.callbacks.append(callback)
+
+    def remove_notice_callback(self, callback):
+        """
+        :param callback: callable registered with add_notice_callback
+        """
+        self.notices.callbacks.remove(callback)
 
     def init(self, logger):
         """Initialize the connection to log to `!logger`.
@@ -73,6 +198,7 @@ class MegaConnection(psycopg2.extensions.connection):
         instance from the standard logging module.
         """
         self.logger = logger or self.logger
+        self.notices.logger = self.logger
 
     def close(self, rollback=True):
         # rollback or commit only if connection has transaction in progress
@@ -99,28 +225,36 @@ class MegaCursor(psycopg2.extensions.cursor):
                 'Reinitialise db connection with correct class'.format(self.connection.__class__.__name__))
 
     def execute(self, query, args=None):
+        connection = self.connection
+        event = connection.start_statement(query) if connection.instrumentation_hooks else None
+        failed = True
         try:
-            return super(MegaCursor, self).execute(query, args)
-        except Exception:
-            raise
+            r_value = super(MegaCursor, self).execute(query, args)
+            failed = False
+            return r_value
         finally:
-            self.connection.logger.debug('Executed query: {0}'.format(self.query))
-            noticies = self.connection.fetch_new_notices()
-            if noticies:
-                for notice in noticies:
-                    self.connection.logger.debug(notice)
+            connection.track_query(query, failed)
+            if event is not None:
+                connection.end_statement(event, self.rowcount, failed)
+            if connection.logger.isEnabledFor(logging.DEBUG):
+                connection.logger.debug('Executed query: {0}'.format(self.query))
 
     def callproc(self, procname, args=None):
+        connection = self.connection
+        event = None
+        if connection.instrumentation_hooks:
+            event = connection.start_statement(procname, pgpm.lib.utils.instrumentation.CALLPROC_STATEMENT_CLASS)
+        failed = True
         try:
-            return super(MegaCursor, self).callproc(procname, args)
-        except Exception:
-            raise
+            r_value = super(MegaCursor, self).callproc(procname, args)
+            failed = False
+            return r_value
         finally:
-            self.connection.logger.debug('Called stored procedure: {0}'.format(self.query.decode('utf-8')))
-            noticies = self.connection.fetch_new_notices()
-            if noticies:
-                for notice in noticies:
-                    self.connection.logger.debug(notice)
+            connection.track_query(procname, failed)
+            if event is not None:
+                connection.end_statement(event, self.rowcount, failed)
+            if connection.logger.isEnabledFor(logging.DEBUG) and self.query:
+                connection.logger.debug('Called stored procedure: {0}'.format(self.query.decode('utf-8')))
 
     def close(self):
         r_value = super(MegaCursor, self).close()
@@ -128,6 +262,77 @@ class MegaCursor(psycopg2.extensions.cursor):
         return r_value
 
 
+class ConnectionPool(object):
+    """
+    Pool of open connections keyed by connection string. Connections released to the pool are reused
+    by the next manager connecting to the same DB within the process. Thread safe
+    """
+    def __init__(self, connection_factory=MegaConnection):
+        """
+        :param connection_factory: connection class passed to psycopg2.connect
+        """
+        self._connection_factory = connection_factory
+        self._idle_connections = {}  # connection string -> list of idle connections
+        self._lock = threading.Lock()
+
+    def get_connection(self, connection_string):
+        """
+        Takes idle connection to the DB from the pool or opens new one if there is none
+        :param connection_string: connection string consumable by DBAPI 2.0
+        :return: connection
+        """
+        with self._lock:
+            idle_connections = self._idle_connections.get(connection_string, [])
+            while idle_connections:
+                conn = idle_connections.pop()
+                if not conn.closed:
+                    return conn
+        return psycopg2.connect(connection_string, connection_factory=self._connection_factory)
+
+    def release_connection(self, connection_string, conn):
+        """
+        Puts connection back to the pool. Transaction in progress is rolled back and session is reset
+        to the defaults. Connections that fail to be reset are closed
+        :param connection_string: connection string connection was opened with
+        :param conn: connection
+        """
+        if conn.closed:
+            return
+        try:
+            conn.rollback()
+            # nothing is left in session in transaction pooling mode and reset wouldn't reach the same session anyway.
+            # Otherwise temporary tables, prepared statements, advisory locks and LISTEN are dropped with settings
+            if not getattr(conn, 'transaction_pooling', False):
+                conn.autocommit = True
+                conn.cursor().execute('DISCARD ALL;')
+            conn.autocommit = False
+            conn.instrumentation_hooks = []
+            conn.script_key = None
+            if isinstance(getattr(conn, 'notices', None), NoticeStream):
+                conn.notices.callbacks = []
+                conn.notices.clear()
+        except psycopg2.Error:
+            conn.close()
+            return
+        with self._lock:
+            self._idle_connections.setdefault(connection_string, []).append(conn)
+
+    def close_all(self):
+        """
+        Closes all idle connections of the pool
+        """
+        with self._lock:
+            connections = [conn for idle_connections in self._idle_connections.values() for conn in idle_connections]
+            self._idle_connections = {}
+        for conn in connections:
+            if not conn.closed:
+                conn.close()
+
+
+# pool shared by managers unless they are given another one
+default_connection_pool = ConnectionPool()
+
+
 class SqlScriptsHelper:
     current_user_sql = 'select * from CURRENT_USER;'
     is_superuser_sql = 'select usesuper from pg_user where usename = CURRENT_USER;'
@@ -135,18 +340,16 @@ class SqlScriptsHelper:
     @classmethod
     def get_pgpm_db_version(cls, cur, schema_name='_pgpm'):
         """
-        returns current version of pgpm schema
+        returns current version of pgpm schema. Packages table is queried directly (same as _find_schema with 'x'
+        version requirement does) so that search_path is not changed
         :return: tuple of major, minor and patch components of version
         """
-        cls.set_search_path(cur, schema_name)
-        cur.execute("SELECT _find_schema('{0}', '{1}')"
-                    .format(schema_name, 'x'))
-        # TODO: make it work with the way it's written below. currently throws error as func returns record
-        # without column list
-        # cur.callproc('_find_schema', [schema_name, 'x'])
-        pgpm_v_ext = tuple(cur.fetchone()[0][1:-1].split(','))
+        cur.execute("SELECT pkg_v_major, pkg_v_minor, pkg_v_patch FROM {0}.packages WHERE pkg_name = %s "
+                    "ORDER BY pkg_v_major DESC, pkg_v_minor DESC, pkg_v_patch DESC LIMIT 1;".format(schema_name),
+                    [schema_name])
+        pgpm_v_ext = cur.fetchone()
 
-        return pgpm_v_ext[2], pgpm_v_ext[3], pgpm_v_ext[4]
+        return str(pgpm_v_ext[0]), str(pgpm_v_ext[1]), str(pgpm_v_ext[2])
 
     @classmethod
     def create_db_schema(cls, cur, schema_name):
@@ -200,10 +403,49 @@ class SqlScriptsHelper:
     @classmethod
     def set_search_path(cls, cur, schema_name):
         """
-        Sets search path
+        Sets search path. Skipped if connection tracks search_path and it's already set to the same value.
+        Set for current transaction only if connection is in transaction pooling mode
         """
-        cur.execute('set search_path TO {0}, public;'
-                    .format(schema_name))
+        search_path = '{0}, public'.format(schema_name)
+        if getattr(cur.connection, 'search_path', None) == search_path:
+            return
+        if getattr(cur.connection, 'transaction_pooling', False):
+            cur.execute('set local search_path TO {0};'.format(search_path))
+        else:
+            cur.execute('set search_path TO {0};'.format(search_path))
+        if hasattr(cur.connection, 'search_path'):
+            cur.connection.search_path = search_path
+
+    @classmethod
+    def make_settings_local(cls, script):
+        """
+        Turns SET statements of a script into SET LOCAL ones so that settings are applied within
+        current transaction only. Other statements (e.g. UPDATE with SET clause) are kept as they are
+        :param script: SQL script (string or bytes)
+        :return: SQL script string with statements separated by new lines
+        """
+        if isinstance(script, bytes):
+            script = script.decode('utf-8')
+        statements = []
+        for statement in pgpm.lib.utils.sql.iter_statements(script):
+            if pgpm.lib.utils.sql.get_statement_type(statement) == 'SET':
+                statement = _SESSION_SET_RE.sub(r'\1SET LOCAL ', statement, count=1)
+            statements.append(statement)
+        return '\n'.join(statements)
+
+    @classmethod
+    def pin_functions_search_path(cls, cur, schema_name, exclude=('set_search_path',)):
+        """
+        Pins search_path of all functions in a schema to that schema, so that functions can be called
+        schema-qualified regardless of search_path of the session
+        :param exclude: names of functions that must keep search_path of the caller
+        """
+        cur.execute("SELECT quote_ident(n.nspname) || '.' || quote_ident(p.proname) || "
+                    "'(' || pg_get_function_identity_arguments(p.oid) || ')' "
+                    "FROM pg_proc p JOIN pg_namespace n ON n.oid = p.pronamespace "
+                    "WHERE n.nspname = %s AND NOT (p.proname = ANY(%s));", [schema_name, list(exclude)])
+        for function_signature in [row[0] for row in cur.fetchall()]:
+            cur.execute('ALTER FUNCTION {0} SET search_path = {1}, public;'.format(function_signature, schema_name))
 
     @classmethod
     def schema_exists(cls, cur, schema_name):
@@ -0,0 +1,154 @@
+import bisect
+import heapq
+import itertools
+
+import pgpm.lib.utils.sql
+
+# class of statements executed with callproc
+CALLPROC_STATEMENT_CLASS = 'CALLPROC'
+
+DEFAULT_LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 60.0)
+
+
+def get_statement_class(query):
+    """
+    :param query: SQL statement (str or bytes)
+    :return: first keyword of statement in upper case (e.g. SELECT, CREATE) or UNKNOWN if there is none.
+    See get_statement_type
+    """
+    if isinstance(query, bytes):
+        query = query.decode('utf-8', 'ignore')
+    return pgpm.lib.utils.sql.get_statement_type(query)
+
+
+class StatementEvent(object):
+    """
+    Statement execution passed to instrumentation hooks. Duration, rowcount and failed are set
+    once statement is executed
+    """
+    __slots__ = ('query', 'statement_class', 'script_key', 'start', 'duration', 'rowcount', 'failed')
+
+    def __init__(self, query, statement_class, script_key, start):
+        """
+        :param query: executed statement or name of called procedure
+        :param statement_class: see get_statement_class. CALLPROC_STATEMENT_CLASS for procedure calls
+        :param script_key: key of the script statement comes from (e.g. file name) or None if unknown
+        :param start: clock value when execution started
+        """
+        self.query = query
+        self.statement_class = statement_class
+        self.script_key = script_key
+        self.start = start
+        self.duration = None
+        self.rowcount = None
+        self.failed = None
+
+
+class InstrumentationHook(object):
+    """
+    Base class of hooks registered on MegaConnection. Both callbacks do nothing by default
+    """
+    def before_statement(self, event):
+        """
+        :param event: StatementEvent of statement about to be executed
+        """
+        pass
+
+    def after_statement(self, event):
+        """
+        :param event: StatementEvent of executed statement
+        """
+        pass
+
+
+class LatencyHistogram(InstrumentationHook):
+    """
+    Counts executed statements by duration buckets, overall and per statement class
+    """
+    def __init__(self, buckets=DEFAULT_LATENCY_BUCKETS):
+        """
+        :param buckets: ascending upper bounds of buckets in seconds. Slower statements fall into the overflow bucket
+        """
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.class_counts = {}
+        self.count = 0
+        self.total_duration = 0
+
+    def after_statement(self, event):
+        bucket_index = bisect.bisect_left(self.buckets, event.duration)
+        self.counts[bucket_index] += 1
+        class_counts = self.class_counts.get(event.statement_class)
+        if class_counts is None:
+            class_counts = self.class_counts[event.statement_class] = [0] * (len(self.buckets) + 1)
+        class_counts[bucket_index] += 1
+        self.count += 1
+        self.total_duration += event.duration
+
+    def get_percentile(self, percentile):
+        """
+        :param percentile: percentile from 0 to 100
+        :return: upper bound of the bucket percentile falls into (None for the overflow bucket or if nothing counted)
+        """
+        if not self.count:
+            return None
+        threshold = self.count * percentile / 100.0
+        cumulative_count = 0
+        for bucket_index, bucket_count in enumerate(self.counts):
+            cumulative_count += bucket_count
+            if bucket_count and cumulative_count >= threshold:
+                return self.buckets[bucket_index] if bucket_index < len(self.buckets) else None
+        return None
+
+    def to_dict(self):
+        """
+        serialisable representation of histogram
+        :return: dict with bucket bounds (None for the overflow bucket), counts and totals
+        """
+        bounds = list(self.buckets) + [None]
+        return {
+            'buckets': bounds,
+            'counts': list(self.counts),
+            'class_counts': dict((statement_class, list(counts))
+                                 for statement_class, counts in self.class_counts.items()),
+            'count': self.count,
+            'total_duration': self.total_duration
+        }
+
+
+class SlowestStatements(InstrumentationHook):
+    """
+    Keeps top N slowest statements
+    """
+    def __init__(self, limit=10):
+        """
+        :param limit: number of statements kept
+        """
+        self.limit = limit
+        self._heap = []  # min heap of (duration, sequence number, event)
+        self._sequence = itertools.count()
+
+    def after_statement(self, event):
+        item = (event.duration, next(self._sequence), event)
+        if len(self._heap) < self.limit:
+            heapq.heappush(self._heap, item)
+        elif item[0] > self._heap[0][0]:
+            heapq.heapreplace(self._heap, item)
+
+    def get_statements(self):
+        """
+        :return: list of StatementEvent objects from the slowest one
+        """
+        return [event for duration, sequence, event in sorted(self._heap, reverse=True)]
+
+    def to_dict(self):
+        return {
+            'statements': [{'query': event.query if not isinstance(event.query, bytes)
+                            else event.query.decode('utf-8', 'ignore'),
+                            'statement_class': event.statement_class,
+                            'script_key': event.script_key,
+                            'duration': event.duration,
+                            'rowcount': event.rowcount,
+                            'failed': event.failed}
+                           for event in self.get_statements()]
+        }
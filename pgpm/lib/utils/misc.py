@@ -1,3 +1,5 @@
+import codecs
+import hashlib
 import io
 import logging
 import os
@@ -18,7 +20,17 @@ def find_whole_word(w):
     return re.compile(r'\b({0})\b'.format(w), flags=re.IGNORECASE).search
 
 
-def collect_scripts_from_sources(script_paths, files_deployment,  project_path='.', is_package=False, logger=None):
+def get_content_hash(content):
+    """
+    Returns hash of script content that is used to check if script changed
+    :param content: text of a script
+    :return: hex digest
+    """
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
+def collect_scripts_from_sources(script_paths, files_deployment,  project_path='.', is_package=False, logger=None,
+                                 relative_keys=False):
     """
     Collects postgres scripts from source files
     :param script_paths: list of strings or a string with a relative path to the directory containing files with scripts
@@ -27,6 +39,8 @@ def collect_scripts_from_sources(script_paths, files_deployment,  project_path='
     :param project_path: path to the project source code
     :param is_package: are files packaged with pip egg
     :param logger: pass the logger object if needed
+    :param relative_keys: key scripts by their paths relative to project_path instead of file names
+    (see collect_script_paths_from_sources)
     :return:
     """
     logger = logger or logging.getLogger(__name__)
@@ -45,33 +59,85 @@ def collect_scripts_from_sources(script_paths, files_deployment,  project_path='
                     else:
                         logger.debug('File {0}/{1} not collected as it\'s empty.'.format(script_path, file_info))
         else:
-            if files_deployment:  # if specific script to be deployed, only find them
-                for list_file_name in files_deployment:
-                    list_file_full_path = os.path.join(project_path, list_file_name)
-                    if os.path.isfile(list_file_full_path):
-                        for i in range(len(script_paths)):
-                            if script_paths[i] in list_file_full_path:
-                                file_content = io.open(list_file_full_path, 'r', -1, 'utf-8-sig', 'ignore').read()
-                                if file_content:
-                                    scripts_dict[list_file_name] = file_content
-                                    logger.debug('File {0} collected.'.format(list_file_full_path))
-                                else:
-                                    logger.debug('File {0} not collected as it\'s empty.'.format(list_file_full_path))
-                    else:
-                        logger.debug('File {0} is not found in any of {1} folders, please specify a correct path'
-                                       .format(list_file_full_path, script_paths))
-            else:
-                for script_path in script_paths:
-                    for subdir, dirs, files in os.walk(script_path):
-                        files = sorted(files)
-                        for file_info in files:
-                            if file_info != settings.CONFIG_FILE_NAME and file_info[0] != '.':
-                                file_content = io.open(os.path.join(subdir, file_info),
-                                                       'r', -1, 'utf-8-sig', 'ignore').read()
-                                if file_content:
-                                    scripts_dict[file_info] = file_content
-                                    logger.debug('File {0} collected'.format(os.path.join(subdir, file_info)))
-                                else:
-                                    logger.debug('File {0} not collected as it\'s empty.'
-                                                 .format(os.path.join(subdir, file_info)))
+            for file_name, file_path in collect_script_paths_from_sources(script_paths, files_deployment,
+                                                                          project_path, logger,
+                                                                          relative_keys).items():
+                file_content = read_script_file(file_path)
+                if file_content:
+                    scripts_dict[file_name] = file_content
+                    logger.debug('File {0} collected'.format(file_path))
+                else:
+                    logger.debug('File {0} not collected as it\'s empty.'.format(file_path))
     return scripts_dict
+
+
+def _get_relative_key(file_path, project_path):
+    return os.path.relpath(file_path, project_path).replace(os.sep, '/')
+
+
+def collect_script_paths_from_sources(script_paths, files_deployment, project_path='.', logger=None,
+                                      relative_keys=False):
+    """
+    Collects paths to files with postgres scripts without reading them. Empty files are omitted
+    :param script_paths: list of strings or a string with a relative path to the directory containing files with scripts
+    :param files_deployment: list of files that need to be harvested. Files from there will only be taken
+    if the path to the file is in script_paths
+    :param project_path: path to the project source code
+    :param logger: pass the logger object if needed
+    :param relative_keys: key files by their paths relative to project_path (with / as separator) so that files
+    with the same name in different folders don't collide
+    :return: dictionary with file names (or names as in files_deployment) as keys and full paths as values
+    """
+    logger = logger or logging.getLogger(__name__)
+    paths_dict = {}
+    if script_paths:
+        if not isinstance(script_paths, list):  # can be list of paths or a string, anyways converted to list
+            script_paths = [script_paths]
+        if files_deployment:  # if specific script to be deployed, only find them
+            for list_file_name in files_deployment:
+                list_file_full_path = os.path.join(project_path, list_file_name)
+                if os.path.isfile(list_file_full_path):
+                    for i in range(len(script_paths)):
+                        if script_paths[i] in list_file_full_path:
+                            if _is_file_empty(list_file_full_path):
+                                logger.debug('File {0} not collected as it\'s empty.'.format(list_file_full_path))
+                            else:
+                                paths_dict[_get_relative_key(list_file_full_path, project_path)
+                                           if relative_keys else list_file_name] = list_file_full_path
+                else:
+                    logger.debug('File {0} is not found in any of {1} folders, please specify a correct path'
+                                 .format(list_file_full_path, script_paths))
+        else:
+            for script_path in script_paths:
+                for subdir, dirs, files in os.walk(script_path):
+                    files = sorted(files)
+                    for file_info in files:
+                        if file_info != settings.CONFIG_FILE_NAME and file_info[0] != '.':
+                            if _is_file_empty(os.path.join(subdir, file_info)):
+                                logger.debug('File {0} not collected as it\'s empty.'
+                                             .format(os.path.join(subdir, file_info)))
+                            else:
+                                file_path = os.path.join(subdir, file_info)
+                                paths_dict[_get_relative_key(file_path, project_path)
+                                           if relative_keys else file_info] = file_path
+    return paths_dict
+
+
+def read_script_file(file_path):
+    """
+    Reads content of a file with a script
+    :param file_path: path to the file
+    :return: content of the file
+    """
+    with io.open(file_path, 'r', -1, 'utf-8-sig', 'ignore') as script_file:
+        return script_file.read()
+
+
+def _is_file_empty(file_path):
+    """
+    Checks if file has no content without reading it (unless it's so small it can hold only a BOM)
+    """
+    file_size = os.path.getsize(file_path)
+    if file_size > len(codecs.BOM_UTF8):
+        return False
+    return not read_script_file(file_path)
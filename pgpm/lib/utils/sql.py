@@ -0,0 +1,327 @@
+import re
+
+# characters after which scanning state may change
+_SPECIAL_RE = re.compile(r'[;\'"$/-]')
+# single quoted string. Backslash escapes are honoured as standard_conforming_strings is off during deployments
+_STRING_RE = re.compile(r"'(?:[^'\\]|\\.|'')*'", flags=re.DOTALL)
+_QUOTED_IDENTIFIER_RE = re.compile(r'"(?:[^"]|"")*"')
+_DOLLAR_QUOTE_TAG_RE = re.compile(r'\$(?:[^\W\d]\w*)?\$', flags=re.UNICODE)
+_BLOCK_COMMENT_RE = re.compile(r'/\*|\*/')
+_IDENTIFIER_CHAR_RE = re.compile(r'[\w$]', flags=re.UNICODE)
+_KEYWORD_RE = re.compile(r'[^\W\d]\w*', flags=re.UNICODE)
+_IDENTIFIER_RE = r'(?:"(?:[^"]|"")*"|[^\W\d][\w$]*)'
+_QUALIFIED_NAME_RE = r'({0}(?:\s*\.\s*{0})?)'.format(_IDENTIFIER_RE)
+_ALTER_TABLE_RE = re.compile(r'ALTER\s+TABLE\s+(?:IF\s+EXISTS\s+)?(?:ONLY\s+)?' + _QUALIFIED_NAME_RE,
+                             flags=re.IGNORECASE | re.UNICODE)
+_CREATE_INDEX_RE = re.compile(r'CREATE\s+(?:UNIQUE\s+)?INDEX\s+(CONCURRENTLY\s+)?(?:(?:IF\s+NOT\s+EXISTS\s+)?{0}\s+)?'
+                              r'ON\s+(?:ONLY\s+)?'.format(_IDENTIFIER_RE) + _QUALIFIED_NAME_RE,
+                              flags=re.IGNORECASE | re.UNICODE)
+# statements that may list several tables, with the first table name as the only group
+_TABLE_LIST_STATEMENT_RES = [
+    re.compile(prefix + _QUALIFIED_NAME_RE, flags=re.IGNORECASE | re.UNICODE) for prefix in (
+        r'DROP\s+TABLE\s+(?:IF\s+EXISTS\s+)?',
+        r'TRUNCATE\s+(?:TABLE\s+)?(?:ONLY\s+)?',
+        r'LOCK\s+(?:TABLE\s+)?(?:ONLY\s+)?'
+    )]
+_NEXT_TABLE_RE = re.compile(r'\s*(?:\*\s*)?,\s*(?:ONLY\s+)?' + _QUALIFIED_NAME_RE, flags=re.IGNORECASE | re.UNICODE)
+# statements working on a single table with the table name as the last group
+_TABLE_STATEMENT_RES = [_ALTER_TABLE_RE, _CREATE_INDEX_RE] + _TABLE_LIST_STATEMENT_RES + [
+    re.compile(prefix + _QUALIFIED_NAME_RE, flags=re.IGNORECASE | re.UNICODE) for prefix in (
+        r'UPDATE\s+(?:ONLY\s+)?',
+        r'DELETE\s+FROM\s+(?:ONLY\s+)?',
+        r'INSERT\s+INTO\s+',
+        r'CLUSTER\s+(?:VERBOSE\s+)?'
+    )]
+_IDENTIFIER_PART_RE = re.compile(_IDENTIFIER_RE, flags=re.UNICODE)
+
+
+def iter_statements(script):
+    """
+    Splits SQL script into separate statements on semicolons that are not within quotes, quoted identifiers,
+    dollar quotes or comments. Statements are yielded as they are found so that large scripts are not copied around.
+    Statements keep their leading comments and trailing semicolons, fragments with comments only are omitted
+    :param script: string with SQL script
+    :return: generator of statements with surrounding whitespaces stripped
+    """
+    script_length = len(script)
+    statement_start = 0
+    has_content = False
+    pos = 0
+    while pos < script_length:
+        match = _SPECIAL_RE.search(script, pos)
+        if not match:
+            if not has_content and script[pos:].strip():
+                has_content = True
+            break
+        special_pos = match.start()
+        if not has_content and script[pos:special_pos].strip():
+            has_content = True
+        char = match.group()
+        pos = special_pos + 1
+
+        if char == ';':
+            if has_content:
+                yield script[statement_start:pos].strip()
+            statement_start = pos
+            has_content = False
+        elif char == '-':
+            if script.startswith('-', pos):
+                line_end = script.find('\n', pos)
+                pos = script_length if line_end == -1 else line_end + 1
+            else:
+                has_content = True
+        elif char == '/':
+            if script.startswith('*', pos):
+                pos = _skip_block_comment(script, pos + 1)
+            else:
+                has_content = True
+        elif char == "'":
+            has_content = True
+            string_match = _STRING_RE.match(script, special_pos)
+            pos = string_match.end() if string_match else script_length
+        elif char == '"':
+            has_content = True
+            identifier_match = _QUOTED_IDENTIFIER_RE.match(script, special_pos)
+            pos = identifier_match.end() if identifier_match else script_length
+        else:  # dollar sign
+            has_content = True
+            # $ within identifiers ($ is allowed there) or positional parameters are not quotes
+            if special_pos == 0 or not _IDENTIFIER_CHAR_RE.match(script[special_pos - 1]):
+                tag_match = _DOLLAR_QUOTE_TAG_RE.match(script, special_pos)
+                if tag_match:
+                    quote_end = script.find(tag_match.group(), tag_match.end())
+                    pos = script_length if quote_end == -1 else quote_end + len(tag_match.group())
+
+    if has_content:
+        yield script[statement_start:].strip()
+
+
+def split_statements(script):
+    """
+    Splits SQL script into separate statements. See iter_statements
+    :param script: string with SQL script
+    :return: list of statements
+    """
+    return list(iter_statements(script))
+
+
+def count_statements(script):
+    """
+    Counts statements of SQL script. See iter_statements
+    :param script: string with SQL script
+    :return: number of statements
+    """
+    return sum(1 for statement in iter_statements(script))
+
+
+def strip_comments(statement):
+    """
+    Replaces comments that are not within quotes, quoted identifiers or dollar quotes with spaces
+    :param statement: SQL statement or script
+    :return: statement without comments
+    """
+    statement_length = len(statement)
+    parts = []
+    part_start = 0
+    pos = 0
+    while pos < statement_length:
+        match = _SPECIAL_RE.search(statement, pos)
+        if not match:
+            break
+        special_pos = match.start()
+        char = match.group()
+        pos = special_pos + 1
+
+        if char == '-':
+            if statement.startswith('-', pos):
+                line_end = statement.find('\n', pos)
+                pos = statement_length if line_end == -1 else line_end + 1
+                parts.append(statement[part_start:special_pos])
+                part_start = pos
+        elif char == '/':
+            if statement.startswith('*', pos):
+                pos = _skip_block_comment(statement, pos + 1)
+                parts.append(statement[part_start:special_pos])
+                part_start = pos
+        elif char == "'":
+            string_match = _STRING_RE.match(statement, special_pos)
+            pos = string_match.end() if string_match else statement_length
+        elif char == '"':
+            identifier_match = _QUOTED_IDENTIFIER_RE.match(statement, special_pos)
+            pos = identifier_match.end() if identifier_match else statement_length
+        elif char == '$':
+            if special_pos == 0 or not _IDENTIFIER_CHAR_RE.match(statement[special_pos - 1]):
+                tag_match = _DOLLAR_QUOTE_TAG_RE.match(statement, special_pos)
+                if tag_match:
+                    quote_end = statement.find(tag_match.group(), tag_match.end())
+                    pos = statement_length if quote_end == -1 else quote_end + len(tag_match.group())
+
+    parts.append(statement[part_start:])
+    return ' '.join(parts)
+
+
+def get_statement_type(statement):
+    """
+    Gets type of a statement by its first keyword, comments and opening parentheses are skipped.
+    Unlike full SQL parsers it doesn't look into CTEs, so WITH is returned for them
+    :param statement: SQL statement
+    :return: first keyword in upper case (e.g. CREATE or DROP) or UNKNOWN if statement has no keywords
+    """
+    keyword_match = _KEYWORD_RE.match(statement, _skip_leading_comments(statement))
+    if keyword_match:
+        return keyword_match.group().upper()
+    return 'UNKNOWN'
+
+
+def get_altered_table(statement):
+    """
+    Gets table changed by ALTER TABLE statement
+    :param statement: SQL statement
+    :return: tuple (schema name or None if not qualified, table name) with names unquoted (and lower cased
+    if they weren't quoted) or None if statement is not ALTER TABLE
+    """
+    alter_table_match = _ALTER_TABLE_RE.match(statement, _skip_leading_comments(statement))
+    if not alter_table_match:
+        return None
+    return _parse_qualified_name(alter_table_match.group(1))
+
+
+def get_statement_table(statement):
+    """
+    Gets table a statement works on for statements that work on a single table: ALTER TABLE, CREATE INDEX,
+    DROP TABLE, TRUNCATE, LOCK, UPDATE, DELETE, INSERT and CLUSTER. Only the first table is
+    returned for statements listing several of them
+    :param statement: SQL statement
+    :return: tuple (schema name or None if not qualified, table name) as in get_altered_table or None
+    if statement doesn't work on a table
+    """
+    pos = _skip_leading_comments(statement)
+    for table_statement_re in _TABLE_STATEMENT_RES:
+        table_statement_match = table_statement_re.match(statement, pos)
+        if table_statement_match:
+            return _parse_qualified_name(table_statement_match.group(table_statement_match.lastindex))
+    return None
+
+
+def get_statement_tables(statement):
+    """
+    Gets all tables a statement works on. Unlike get_statement_table every table listed by DROP TABLE,
+    TRUNCATE and LOCK is returned
+    :param statement: SQL statement
+    :return: list of tuples as in get_statement_table in order they are listed. Empty list if statement
+    doesn't work on a table
+    """
+    pos = _skip_leading_comments(statement)
+    for table_list_statement_re in _TABLE_LIST_STATEMENT_RES:
+        table_match = table_list_statement_re.match(statement, pos)
+        if table_match:
+            tables = []
+            while table_match:
+                tables.append(_parse_qualified_name(table_match.group(1)))
+                table_match = _NEXT_TABLE_RE.match(statement, table_match.end())
+            return tables
+    table = get_statement_table(statement)
+    return [table] if table else []
+
+
+def get_index_creation(statement):
+    """
+    Gets table an index is created on by CREATE INDEX statement
+    :param statement: SQL statement
+    :return: tuple (table as in get_statement_table, True if index is created concurrently) or None
+    if statement is not CREATE INDEX
+    """
+    create_index_match = _CREATE_INDEX_RE.match(statement, _skip_leading_comments(statement))
+    if not create_index_match:
+        return None
+    return _parse_qualified_name(create_index_match.group(create_index_match.lastindex)), \
+        bool(create_index_match.group(1))
+
+
+def get_alter_table_actions(statement):
+    """
+    Splits ALTER TABLE statement into its actions (e.g. ADD COLUMN, ALTER COLUMN) on commas that are not
+    within parentheses, quotes or quoted identifiers
+    :param statement: SQL statement
+    :return: list of actions with surrounding whitespaces and trailing semicolon stripped. Empty list if statement
+    is not ALTER TABLE
+    """
+    alter_table_match = _ALTER_TABLE_RE.match(statement, _skip_leading_comments(statement))
+    if not alter_table_match:
+        return []
+    actions = []
+    depth = 0
+    action_start = pos = alter_table_match.end()
+    statement_length = len(statement)
+    while pos < statement_length:
+        char = statement[pos]
+        if char == "'":
+            string_match = _STRING_RE.match(statement, pos)
+            pos = string_match.end() if string_match else statement_length
+            continue
+        elif char == '"':
+            identifier_match = _QUOTED_IDENTIFIER_RE.match(statement, pos)
+            pos = identifier_match.end() if identifier_match else statement_length
+            continue
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            actions.append(statement[action_start:pos].strip())
+            action_start = pos + 1
+        pos += 1
+    actions.append(statement[action_start:].strip().rstrip(';').strip())
+    return [action for action in actions if action]
+
+
+def _parse_qualified_name(qualified_name):
+    name_parts = [_unquote_identifier(part) for part in _IDENTIFIER_PART_RE.findall(qualified_name)]
+    if len(name_parts) == 1:
+        return None, name_parts[0]
+    return name_parts[0], name_parts[1]
+
+
+def _unquote_identifier(identifier):
+    if identifier.startswith('"'):
+        return identifier[1:-1].replace('""', '"')
+    return identifier.lower()
+
+
+def _skip_leading_comments(statement):
+    """
+    Skips whitespaces, comments and opening parentheses at the beginning of a statement
+    :param statement: SQL statement
+    :return: position of the first meaningful character
+    """
+    pos = 0
+    statement_length = len(statement)
+    while pos < statement_length:
+        char = statement[pos]
+        if char.isspace() or char == '(':
+            pos += 1
+        elif statement.startswith('--', pos):
+            line_end = statement.find('\n', pos)
+            pos = statement_length if line_end == -1 else line_end + 1
+        elif statement.startswith('/*', pos):
+            pos = _skip_block_comment(statement, pos + 2)
+        else:
+            break
+    return pos
+
+
+def _skip_block_comment(script, pos):
+    """
+    Finds the end of a block comment. Block comments can be nested in Postgres
+    :param script: string with SQL script
+    :param pos: position right after opening of a comment
+    :return: position right after the comment
+    """
+    depth = 1
+    while depth > 0:
+        match = _BLOCK_COMMENT_RE.search(script, pos)
+        if not match:
+            return len(script)
+        depth += 1 if match.group() == '/*' else -1
+        pos = match.end()
+    return pos
@@ -0,0 +1,109 @@
+import collections
+import contextlib
+import time
+
+# high resolution clock where available (python 3.3+)
+clock = getattr(time, 'perf_counter', time.time)
+
+# execution of a script. Size (in bytes) and number of statements are None if unknown
+ScriptTiming = collections.namedtuple('ScriptTiming', ['script_type', 'key', 'seconds', 'size', 'statements_count'])
+
+
+class Timings(object):
+    """
+    Collects durations of phases of an operation and of individual scripts executed within it.
+    Durations are in seconds
+    """
+    def __init__(self):
+        self._phases = collections.OrderedDict()
+        self._scripts = []
+        self._current_phase = None
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """
+        Context manager measuring a phase. Time of a phase entered several times is summed up
+        :param name: name of the phase
+        """
+        start = clock()
+        try:
+            yield
+        finally:
+            self.add_phase(name, clock() - start)
+
+    def start_phase(self, name):
+        """
+        Ends current phase (if any) and starts a new one. For operations that go through phases one after another
+        :param name: name of the phase
+        """
+        self.end_phase()
+        self._current_phase = (name, clock())
+
+    def end_phase(self):
+        """
+        Ends phase started with start_phase
+        """
+        if self._current_phase:
+            name, start = self._current_phase
+            self._current_phase = None
+            self.add_phase(name, clock() - start)
+
+    def add_phase(self, name, seconds):
+        self._phases[name] = self._phases.get(name, 0) + seconds
+
+    def add_script(self, script_type, key, seconds, size=None, statements_count=None):
+        """
+        :param script_type: type of the script (function, table, etc.)
+        :param key: script key. Scripts executed in one batch are added one by one
+        :param seconds: duration of execution
+        :param size: size of the script in bytes
+        :param statements_count: number of statements in the script
+        """
+        self._scripts.append(ScriptTiming(script_type, key, seconds, size, statements_count))
+
+    def update(self, other):
+        """
+        Adds phases and scripts of other timings (e.g. of plan compilation) to these ones
+        :param other: Timings
+        """
+        for name, seconds in other.phases.items():
+            self.add_phase(name, seconds)
+        self._scripts.extend(other.scripts)
+
+    @property
+    def phases(self):
+        """
+        :return: OrderedDict of phase names and durations in order phases were entered
+        """
+        return collections.OrderedDict(self._phases)
+
+    @property
+    def scripts(self):
+        """
+        :return: list of ScriptTiming in order of execution
+        """
+        return list(self._scripts)
+
+    @property
+    def total(self):
+        return sum(self._phases.values())
+
+    def get_slowest_scripts(self, limit=None):
+        """
+        :param limit: max number of scripts returned. All if omitted
+        :return: list of ScriptTiming from the slowest one
+        """
+        return sorted(self._scripts, key=lambda script: script.seconds, reverse=True)[:limit]
+
+    def to_dict(self):
+        """
+        serialisable representation of timings
+        :return: dict with total, phases and scripts in order of execution
+        """
+        return {
+            'total': self.total,
+            'phases': collections.OrderedDict(self._phases),
+            'scripts': [{'type': script.script_type, 'file': script.key, 'seconds': script.seconds,
+                         'bytes': script.size, 'statements': script.statements_count}
+                        for script in self._scripts]
+        }
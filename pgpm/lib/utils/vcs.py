@@ -36,3 +36,36 @@ def get_git_remote_url(path='.', remote='origin'):
     """
     return dulwich.repo.Repo.discover(path).get_config()\
         .get((b'remote', remote.encode('utf-8')), b'url').decode('utf-8')
+
+
+def _is_in_directory(file_path, directory):
+    return not os.path.relpath(file_path, directory).startswith(os.pardir)
+
+
+def get_changed_files(path='.', from_ref=None, to_ref=None, script_paths=None):
+    """
+    Get files added or modified between two commits. Deleted files are omitted.
+    Commits are compared, so changes not committed to `to_ref` (e.g. in the working tree) are not taken into account
+    :param path: path to repo
+    :param from_ref: hash of a commit to compare from
+    :param to_ref: hash of a commit to compare to. Defaults to HEAD
+    :param script_paths: list of directories. If set, only files inside of them are returned
+    :return: list of paths to files relative to `path` (files outside of `path` are omitted)
+    """
+    repo = dulwich.repo.Repo.discover(path)
+    from_tree = repo[from_ref.encode('utf-8')].tree
+    to_tree = repo[to_ref.encode('utf-8') if to_ref else repo.head()].tree
+    repo_path = os.path.realpath(repo.path)
+    if script_paths is not None:
+        script_paths = [os.path.realpath(script_path) for script_path in script_paths]
+    changed_files = []
+    for (old_path, new_path), modes, shas in repo.object_store.tree_changes(from_tree, to_tree):
+        if new_path:
+            full_file_path = os.path.join(repo_path, new_path.decode('utf-8'))
+            if not _is_in_directory(full_file_path, os.path.realpath(path)):
+                continue
+            if script_paths is not None and \
+                    not any(_is_in_directory(full_file_path, script_path) for script_path in script_paths):
+                continue
+            changed_files.append(os.path.relpath(full_file_path, os.path.realpath(path)))
+    return sorted(changed_files)
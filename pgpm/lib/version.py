@@ -1 +1 @@
-__version__ = '0.1.62'
+__version__ = '0.1.70'
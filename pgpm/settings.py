@@ -9,5 +9,6 @@ PGPM_VERSION = config.Version(__version__, config.VersionTypes.python)
 
 MIGRATIONS_FOLDER_NAME = 'lib/db_scripts/migrations'
 CONFIG_FILE_NAME = 'config.json'
+BUNDLE_FILE_EXTENSION = '.pgpm'
 
 LOGGING_FORMATTER = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
@@ -0,0 +1,114 @@
+import logging
+import sys
+import threading
+import multiprocessing.pool
+
+
+class TargetResult(object):
+    """
+    Outcome of running an operation against a single target database
+    """
+    STATUS_OK = 'OK'
+    STATUS_FAILED = 'FAILED'
+    STATUS_SKIPPED = 'SKIPPED'
+
+    def __init__(self, target_name, connection_string):
+        self.target_name = target_name
+        self.connection_string = connection_string
+        self.status = self.STATUS_SKIPPED
+        self.result = None
+        self.exc_info = None
+
+    @property
+    def succeeded(self):
+        return self.status == self.STATUS_OK
+
+    def to_dict(self):
+        """
+        serialisable representation of the result
+        :return: dict with target name, status, result and error (if any)
+        """
+        return {
+            'target_name': self.target_name,
+            'status': self.status,
+            'result': self.result,
+            'error': str(self.exc_info[1]) if self.exc_info else None
+        }
+
+
+class FanOutReport(object):
+    """
+    Aggregated report of an operation run against a set of targets. Results are kept in the order targets were given
+    """
+    def __init__(self, results):
+        self.results = results
+
+    @property
+    def succeeded(self):
+        return [item for item in self.results if item.status == TargetResult.STATUS_OK]
+
+    @property
+    def failed(self):
+        return [item for item in self.results if item.status == TargetResult.STATUS_FAILED]
+
+    @property
+    def skipped(self):
+        return [item for item in self.results if item.status == TargetResult.STATUS_SKIPPED]
+
+    @property
+    def is_ok(self):
+        return len(self.succeeded) == len(self.results)
+
+    def to_dict(self):
+        return {
+            'targets_count': len(self.results),
+            'succeeded_count': len(self.succeeded),
+            'failed_count': len(self.failed),
+            'skipped_count': len(self.skipped),
+            'targets': [item.to_dict() for item in self.results]
+        }
+
+
+def fan_out(targets, func, jobs=1, logger=None):
+    """
+    Runs `func` for every target, up to `jobs` targets concurrently. Threads are used as the work is I/O bound
+    (waiting on databases). Once any target fails, targets that haven't started yet are skipped,
+    targets in progress are allowed to finish.
+    :param targets: list of tuples (target_name, connection_string)
+    :param func: callable taking a connection string and returning a result for that target
+    :param jobs: max number of targets processed at the same time
+    :param logger: logger object
+    :return: FanOutReport
+    """
+    logger = logger or logging.getLogger(__name__)
+    results = [TargetResult(target_name, connection_string) for target_name, connection_string in targets]
+    abort_event = threading.Event()
+
+    def _run_target(target_result):
+        if abort_event.is_set():
+            logger.warning('Skipping {0} as operation on another target failed'.format(target_result.target_name))
+            return target_result
+        try:
+            target_result.result = func(target_result.connection_string)
+            target_result.status = TargetResult.STATUS_OK
+        except BaseException:  # sys.exit is used in managers so SystemExit has to be caught as well
+            target_result.status = TargetResult.STATUS_FAILED
+            target_result.exc_info = sys.exc_info()
+            abort_event.set()
+            logger.error('Operation failed for {0}: {1}'.format(target_result.target_name, target_result.exc_info[1]))
+        return target_result
+
+    jobs = max(1, min(int(jobs or 1), len(results) or 1))
+    if jobs == 1:
+        for target_result in results:
+            _run_target(target_result)
+    else:
+        logger.debug('Running operation on {0} targets with {1} parallel jobs'.format(len(results), jobs))
+        pool = multiprocessing.pool.ThreadPool(jobs)
+        try:
+            pool.map(_run_target, results, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+
+    return FanOutReport(results)
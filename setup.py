@@ -64,7 +64,7 @@ setup(
     url='https://github.com/affinitas/pgpm',
     packages=['pgpm', 'pgpm.utils', 'pgpm.lib', 'pgpm.lib.utils'],
     long_description=open('README.rst').read(),
-    install_requires=['docopt', 'psycopg2', 'sqlparse', 'colorama', 'requests', 'dulwich'],
+    install_requires=['docopt', 'psycopg2>=2.7', 'colorama', 'requests', 'dulwich'],
     classifiers=[
         'Development Status :: 3 - Alpha',
         'Environment :: Console',
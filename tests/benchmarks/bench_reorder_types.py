@@ -0,0 +1,30 @@
+"""
+Benchmark of ordering of type definitions. Not collected by py.test, run it directly:
+
+    python -m tests.benchmarks.bench_reorder_types
+
+Every type depends on the previous one and definitions are given in reverse order,
+so time per type should stay roughly the same as number of types grows
+"""
+import timeit
+
+import pgpm.lib.plan
+
+
+def _get_types_script(types_count):
+    statements = ['CREATE TYPE t_0 AS (value TEXT);']
+    for i in range(1, types_count):
+        statements.append('CREATE TYPE t_{0} AS (prev t_{1}, amount INTEGER, label TEXT);'.format(i, i - 1))
+    return '\n'.join(reversed(statements))
+
+
+def main():
+    print('{0:>8} {1:>12} {2:>16}'.format('types', 'total, s', 'per type, ms'))
+    for types_count in (100, 200, 400, 800, 1600):
+        types_script = _get_types_script(types_count)
+        duration = min(timeit.repeat(lambda: pgpm.lib.plan.reorder_types(types_script), number=1, repeat=3))
+        print('{0:>8} {1:>12.3f} {2:>16.3f}'.format(types_count, duration, duration * 1000 / types_count))
+
+
+if __name__ == '__main__':
+    main()
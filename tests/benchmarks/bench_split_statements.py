@@ -0,0 +1,54 @@
+"""
+Benchmark of splitting SQL scripts into statements. Not collected by py.test, run it directly:
+
+    python -m tests.benchmarks.bench_split_statements
+
+Script consists of PL/pgSQL functions with large bodies, which is the usual content of pgpm packages.
+sqlparse is measured for comparison if it's installed
+"""
+import timeit
+
+import pgpm.lib.utils.sql
+
+FUNCTION_TEMPLATE = """
+-- function number {0}; returns sum of its arguments
+CREATE OR REPLACE FUNCTION f_{0}(p_a INTEGER, p_b INTEGER)
+    RETURNS INTEGER AS
+$BODY$
+DECLARE
+    l_result INTEGER := 0; /* local; variable */
+BEGIN
+{1}
+    RETURN l_result;
+END;
+$BODY$
+LANGUAGE 'plpgsql' VOLATILE SECURITY DEFINER;
+"""
+FUNCTION_BODY_LINE = "    l_result := l_result + p_a + p_b; RAISE NOTICE 'step; %', E'\\\\';\n"
+
+
+def _get_script(functions_count, body_lines_count):
+    body = FUNCTION_BODY_LINE * body_lines_count
+    return ''.join(FUNCTION_TEMPLATE.format(i, body) for i in range(functions_count))
+
+
+def main():
+    try:
+        import sqlparse
+    except ImportError:
+        sqlparse = None
+    print('{0:>10} {1:>12} {2:>14} {3:>14}'.format('functions', 'size, KB', 'pgpm, s', 'sqlparse, s'))
+    for functions_count in (10, 50, 250):
+        script = _get_script(functions_count, 100)
+        assert len(pgpm.lib.utils.sql.split_statements(script)) == functions_count
+        pgpm_duration = min(timeit.repeat(lambda: pgpm.lib.utils.sql.split_statements(script), number=1, repeat=3))
+        sqlparse_duration = '-'
+        if sqlparse:
+            sqlparse_duration = '{0:.3f}'.format(min(timeit.repeat(lambda: sqlparse.split(script),
+                                                                   number=1, repeat=3)))
+        print('{0:>10} {1:>12} {2:>14.4f} {3:>14}'.format(functions_count, len(script) // 1024, pgpm_duration,
+                                                          sqlparse_duration))
+
+
+if __name__ == '__main__':
+    main()
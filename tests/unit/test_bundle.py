@@ -0,0 +1,99 @@
+import io
+import os
+import subprocess
+import sys
+
+import pytest
+
+import pgpm.lib.bundle
+import pgpm.lib.plan
+import pgpm.lib.utils.config
+
+# reads a bundle with vcs and SQL parsing libraries made unimportable, as on hosts bundles are deployed from
+_READ_BUNDLE_WITHOUT_LIBRARIES_SCRIPT = """
+import sys
+sys.modules['dulwich'] = None
+sys.modules['sqlparse'] = None
+import pgpm.app
+import pgpm.lib.bundle
+import pgpm.lib.deploy
+plan = pgpm.lib.bundle.read_bundle(sys.argv[1])
+assert [script_source.read() for key, script_source in plan.get_scripts('table')]
+"""
+
+
+def _write_file(path, content):
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with io.open(path, 'w', encoding='utf-8') as f:
+        f.write(content)
+
+
+@pytest.fixture
+def plan(tmpdir):
+    path = str(tmpdir.mkdir('package'))
+    _write_file(os.path.join(path, 'types', 'a_type.sql'),
+                u'DROP TYPE IF EXISTS t_old;\nCREATE TYPE t_inner AS (value TEXT);')
+    _write_file(os.path.join(path, 'tables', '1.sql'), u'CREATE TABLE t (id INTEGER, name TEXT DEFAULT \'ä\');')
+    _write_file(os.path.join(path, 'functions', 'f.sql'),
+                u'CREATE OR REPLACE FUNCTION f() RETURNS INTEGER AS $$ SELECT 1; $$ LANGUAGE sql;')
+    config = pgpm.lib.utils.config.SchemaConfiguration(
+        config_dict={'name': 'test_schema', 'subclass': 'basic', 'version': '0_1_0', 'types_path': 'types',
+                     'tables_path': 'tables', 'functions_path': 'functions'},
+        project_path=path)
+    return pgpm.lib.plan.DeploymentPlan.compile(config, path, vcs_ref='abc')
+
+
+def test_bundle_roundtrip(plan, tmpdir):
+    """
+    Test that plan read from a bundle is the same as the one bundle was built from
+    and that rebuilding the bundle gives byte identical file
+    :return:
+    """
+    bundle_path = str(tmpdir.join('test_schema_0_1_0.pgpm'))
+    pgpm.lib.bundle.write_bundle(plan, bundle_path)
+    loaded_plan = pgpm.lib.bundle.read_bundle(bundle_path, {'owner_role': 'owner'})
+
+    assert loaded_plan.config.name == 'test_schema'
+    assert loaded_plan.config.version.raw == '0_1_0'
+    assert loaded_plan.config.owner_role == 'owner'
+    assert loaded_plan.vcs_ref == 'abc'
+    for script_type in ('type', 'function', 'view', 'trigger'):
+        assert loaded_plan.get_scripts(script_type) == plan.get_scripts(script_type)
+    assert [(key, script_source.read()) for key, script_source in loaded_plan.get_scripts('table')] == \
+        [(key, script_source.read()) for key, script_source in plan.get_scripts('table')]
+    assert loaded_plan.type_drop_statements == plan.type_drop_statements
+    assert loaded_plan.type_ordered_statements == plan.type_ordered_statements
+
+    rebuilt_bundle_path = str(tmpdir.join('rebuilt.pgpm'))
+    pgpm.lib.bundle.write_bundle(pgpm.lib.bundle.read_bundle(bundle_path), rebuilt_bundle_path)
+    with open(bundle_path, 'rb') as f, open(rebuilt_bundle_path, 'rb') as f_rebuilt:
+        assert f.read() == f_rebuilt.read()
+
+
+def test_bundle_corrupted(plan, tmpdir):
+    """
+    Test that changed content of a bundle is detected
+    :return:
+    """
+    bundle_path = str(tmpdir.join('test_schema_0_1_0.pgpm'))
+    pgpm.lib.bundle.write_bundle(plan, bundle_path)
+    with open(bundle_path, 'rb') as f:
+        content = f.read()
+    with open(bundle_path, 'wb') as f:
+        f.write(content.replace(b'SELECT 1', b'SELECT 2'))
+
+    with pytest.raises(pgpm.lib.bundle.BundleError):
+        pgpm.lib.bundle.read_bundle(bundle_path)
+
+
+def test_bundle_read_without_libraries(plan, tmpdir):
+    """
+    Test that pgpm can be imported and a bundle read without dulwich and sqlparse
+    :return:
+    """
+    bundle_path = str(tmpdir.join('test_schema_0_1_0.pgpm'))
+    pgpm.lib.bundle.write_bundle(plan, bundle_path)
+    main_path = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(pgpm.lib.bundle.__file__))))
+    assert subprocess.call([sys.executable, '-c', _READ_BUNDLE_WITHOUT_LIBRARIES_SCRIPT, bundle_path],
+                           cwd=main_path) == 0
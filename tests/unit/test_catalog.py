@@ -0,0 +1,53 @@
+import pytest
+
+import pgpm.lib.catalog
+
+
+class _Cursor(object):
+    def __init__(self, results):
+        self._results = list(results)
+        self.queries = []
+
+    def execute(self, query, args=None):
+        self.queries.append(query)
+
+    def fetchall(self):
+        return self._results.pop(0)
+
+
+@pytest.fixture
+def catalog():
+    cur = _Cursor([
+        [('public',), ('_pgpm',), ('a',), ('a_0',)],
+        [(1, '_pgpm', 0, 1, 65, None, None),
+         (2, 'a', 1, 2, 3, None, None),
+         (3, 'a', 1, 2, 3, None, 0),
+         (4, 'a', 1, 1, 9, None, None),
+         (5, 'a', 0, 9, 0, None, None)]
+    ])
+    return pgpm.lib.catalog.CatalogSnapshot(cur)
+
+
+def test_catalog_snapshot_schemas(catalog):
+    """
+    Test that schemas are answered from snapshot and changed by pgpm DDL
+    :return:
+    """
+    assert catalog.is_pgpm_installed
+    assert catalog.pgpm_version == ('0', '1', '65')
+    assert catalog.schema_exists('a_0') and not catalog.schema_exists('a_1')
+    catalog.rename_schema('a', 'a_1')
+    catalog.add_schema('a')
+    assert catalog.schema_exists('a_1') and catalog.schema_exists('a')
+    catalog.drop_schema('a')
+    assert not catalog.schema_exists('a')
+    assert len(catalog._cur.queries) == 2
+
+
+def test_catalog_snapshot_packages(catalog):
+    """
+    Test that packages are listed from the latest version
+    :return:
+    """
+    assert [package.pkg_id for package in catalog.get_packages('a')] == [2, 3, 4, 5]
+    assert catalog.get_packages('b') == []
@@ -1,8 +1,16 @@
 import pytest
 import os
 import subprocess
+import sys
 
+import psycopg2
+
+import pgpm.lib.bundle
+import pgpm.lib.deploy
 import pgpm.lib.install
+import pgpm.lib.plan
+import pgpm.lib.utils.config
+import pgpm.lib.utils.timing
 
 
 def get_pgpm_path():
@@ -22,6 +30,93 @@ TEST_SCHEMA_TOP_0_1_0_PATH = get_pgpm_path() + "/tests/fixtures/pgpm_packages/te
 TEST_SCHEMA_TOP_0_2_0_PATH = get_pgpm_path() + "/tests/fixtures/pgpm_packages/test_schema_top_0_2_0"
 TEST_CONFIG_FILE_NAME = "config.json"
 
+# deploys a bundle with vcs and SQL parsing libraries made unimportable, as on hosts bundles are deployed from
+DEPLOY_BUNDLE_WITHOUT_LIBRARIES_SCRIPT = """
+import sys
+sys.modules['dulwich'] = None
+sys.modules['sqlparse'] = None
+import pgpm.app
+import pgpm.lib.bundle
+import pgpm.lib.deploy
+plan = pgpm.lib.bundle.read_bundle(sys.argv[1])
+deployment_manager = pgpm.lib.deploy.DeploymentManager(sys.argv[2], config_object=plan.config)
+deploy_result = deployment_manager.deploy_schema_to_db(mode='unsafe', plan=plan)
+sys.exit(deploy_result['code'])
+"""
+
+
+class _Connection(object):
+    script_key = None
+    closed = False
+    autocommit = False
+
+    def cursor(self):
+        return _Cursor()
+
+    def rollback(self):
+        pass
+
+
+class _Cursor(object):
+    """
+    records executed queries and fails queries that mix given statements with others as multi-command strings do
+    """
+    def __init__(self, failing_statement=None):
+        self.connection = _Connection()
+        self.queries = []
+        self._failing_statement = failing_statement
+
+    def execute(self, query):
+        self.queries.append(query)
+        if self._failing_statement and self._failing_statement in query and \
+                query.strip() != self._failing_statement:
+            raise psycopg2.Error('cannot be executed from a multi-command string')
+
+
+class _Catalog(object):
+    is_pgpm_installed = False
+
+
+def test_execute_scripts_in_batches():
+    """
+    Test that failed batch is replayed one by one, deployment goes on if replay succeeds and last savepoint is released
+    :return:
+    """
+    deployment_manager = pgpm.lib.deploy.DeploymentManager(
+        '', config_path=os.path.join(TEST_SCHEMA_LOW_0_5_0_PATH, TEST_CONFIG_FILE_NAME))
+    cur = _Cursor('VACUUM;')
+    timings = pgpm.lib.utils.timing.Timings()
+    scripts = [('a.sql', 'SELECT 1;'), ('b.sql', 'VACUUM;'), ('c.sql', 'SELECT 3;')]
+    deployment_manager._execute_scripts(cur, scripts, batch_size=18, timings=timings, script_type='function')
+    assert [script.key for script in timings.scripts] == ['a.sql', 'b.sql', 'c.sql']
+    assert cur.queries == ['SAVEPOINT pgpm_batch;\nSELECT 1;\n;\nVACUUM;', 'ROLLBACK TO SAVEPOINT pgpm_batch;',
+                           'SELECT 1;', 'VACUUM;',
+                           'RELEASE SAVEPOINT pgpm_batch;\nSAVEPOINT pgpm_batch;\nSELECT 3;',
+                           'RELEASE SAVEPOINT pgpm_batch;']
+
+    cur = _Cursor('SELECT 2;')
+    with pytest.raises(psycopg2.Error):
+        deployment_manager._execute_scripts(cur, [('a.sql', 'SELECT 1;'), ('b.sql', 'SELECT 2; SELECT 2;')],
+                                            batch_size=100)
+    assert cur.queries[-1] == 'SELECT 2; SELECT 2;' and cur.connection.script_key == 'b.sql'
+
+
+def test_plan_deployment_without_pgpm():
+    """
+    Test that plan reports deployment to DB without pgpm as failing instead of exiting
+    :return:
+    """
+    config = pgpm.lib.utils.config.SchemaConfiguration(
+        os.path.join(TEST_SCHEMA_LOW_0_5_0_PATH, TEST_CONFIG_FILE_NAME), None, TEST_SCHEMA_LOW_0_5_0_PATH)
+    deployment_manager = pgpm.lib.deploy.DeploymentManager('', config_object=config)
+    deployment_manager._connection = _Connection()
+    deployment_manager._catalog = _Catalog()
+    plan_result = deployment_manager.plan_deployment(
+        pgpm.lib.plan.DeploymentPlan.compile(config, TEST_SCHEMA_LOW_0_5_0_PATH))
+    assert plan_result['code'] == pgpm.lib.deploy.DeploymentManager.PLAN_OUTPUT_CODE_WOULD_FAIL
+    assert 'pgpm install' in plan_result['message']
+    assert plan_result['scripts'] == [] and deployment_manager._connection is None
+
 
 class TestDeploymentManager:
 
@@ -37,3 +132,36 @@ class TestDeploymentManager:
             config_path=os.path.join(TEST_SCHEMA_TOP_0_2_0_PATH, TEST_CONFIG_FILE_NAME),
             source_code_path=TEST_SCHEMA_TOP_0_2_0_PATH) == 0
         assert installation_manager.uninstall_pgpm_from_db() == 0
+
+    def test_resolve_dependencies(self, installation_manager, deployment_manager):
+        assert installation_manager.install_pgpm_to_db(None) == 0
+        for package_path in (TEST_SCHEMA_LOW_0_5_0_PATH, TEST_SCHEMA_TOP_0_1_0_PATH):
+            assert deployment_manager.deploy_schema_to_db(
+                config_path=os.path.join(package_path, TEST_CONFIG_FILE_NAME),
+                source_code_path=package_path)['code'] == 0
+        # test_schema_top keeps depending on the old revision of test_schema_low renamed in moderate mode
+        assert deployment_manager.deploy_schema_to_db(
+            mode='moderate', config_path=os.path.join(TEST_SCHEMA_LOW_0_5_0_PATH, TEST_CONFIG_FILE_NAME),
+            source_code_path=TEST_SCHEMA_LOW_0_5_0_PATH)['code'] == 0
+        is_resolved, deps_ids, unresolved_deps = deployment_manager._resolve_dependencies(
+            deployment_manager._conn.cursor(),
+            {'test_schema_low': '0_5_0', 'test_schema_top': '0_1_0', 'test_schema_missing': 'x'})
+        deployment_manager._release_connection()
+        assert not is_resolved
+        assert len(deps_ids) == 2
+        assert unresolved_deps == ['test_schema_missing: x']
+        assert installation_manager.uninstall_pgpm_from_db() == 0
+
+    def test_deploy_bundle_without_libraries(self, installation_manager, tmpdir):
+        assert installation_manager.install_pgpm_to_db(None) == 0
+        config = pgpm.lib.utils.config.SchemaConfiguration(
+            os.path.join(TEST_SCHEMA_LOW_0_5_0_PATH, TEST_CONFIG_FILE_NAME), None, TEST_SCHEMA_LOW_0_5_0_PATH)
+        bundle_path = str(tmpdir.join('test_schema_low.pgpm'))
+        pgpm.lib.bundle.write_bundle(pgpm.lib.plan.DeploymentPlan.compile(config, TEST_SCHEMA_LOW_0_5_0_PATH),
+                                     bundle_path)
+        connection_string = "host={0} port={1} dbname={2} user={3} password={4}".format(
+            os.environ['PGPM_TEST_DB_HOST'], os.environ['PGPM_TEST_DB_PORT'], os.environ['PGPM_TEST_DB_NAME'],
+            os.environ['PGPM_TEST_USER_NAME'], os.environ['PGPM_TEST_USER_PASSWORD'])
+        assert subprocess.call([sys.executable, '-c', DEPLOY_BUNDLE_WITHOUT_LIBRARIES_SCRIPT, bundle_path,
+                                connection_string], cwd=get_pgpm_path()) == 0
+        assert installation_manager.uninstall_pgpm_from_db() == 0
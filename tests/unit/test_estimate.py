@@ -0,0 +1,20 @@
+import pgpm.lib.estimate
+
+
+def test_estimate_script():
+    """
+    Test that scripts are estimated from their history, then from altered tables, then from scripts of the same type
+    :return:
+    """
+    estimator = pgpm.lib.estimate.DurationEstimator(
+        [('function', 'f.sql', 3.0), ('function', 'f.sql', 1.0), ('function', 'f.sql', 2.0),
+         ('function', 'g.sql', 2.0), ('function', 'functions/h, i.sql', 2.0), ('table', '1.sql', 10.0)],
+        overhead_durations=[0.5, 1.5], rows_per_second=1000)
+    assert estimator.estimate_script('function', 'f.sql') == (2.0, pgpm.lib.estimate.ESTIMATE_SOURCE_HISTORY)
+    assert estimator.estimate_script('function', 'functions/h, i.sql') == \
+        (2.0, pgpm.lib.estimate.ESTIMATE_SOURCE_HISTORY)
+    assert estimator.estimate_script('table', '2.sql', 5000) == (5.0, pgpm.lib.estimate.ESTIMATE_SOURCE_TABLE_STATS)
+    assert estimator.estimate_script('function', 'new.sql') == (2.0, pgpm.lib.estimate.ESTIMATE_SOURCE_TYPE_AVERAGE)
+    assert estimator.estimate_script('view', 'v.sql') == (None, None)
+    assert estimator.estimate_overhead() == 1.0
+    assert pgpm.lib.estimate.DurationEstimator().estimate_overhead() == 0
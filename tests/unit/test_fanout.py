@@ -0,0 +1,44 @@
+import pgpm.utils.fanout
+
+
+def _operation(connection_string):
+    if connection_string == 'broken':
+        raise ValueError('broken target')
+    return {'deployed_files_count': 1}
+
+
+def test_fan_out_collects_results_in_order():
+    """
+    Test that every target result is collected in the order targets were given
+    :return:
+    """
+    targets = [('db_{0}'.format(i), 'conn_{0}'.format(i)) for i in range(10)]
+    report = pgpm.utils.fanout.fan_out(targets, _operation, jobs=4)
+    assert report.is_ok
+    assert [item.target_name for item in report.results] == [target[0] for target in targets]
+    assert all(item.result == {'deployed_files_count': 1} for item in report.results)
+
+
+def test_fan_out_skips_after_failure():
+    """
+    Test that targets not started yet are skipped once a target fails
+    :return:
+    """
+    report = pgpm.utils.fanout.fan_out([('a', 'conn_a'), ('b', 'broken'), ('c', 'conn_c')], _operation, jobs=1)
+    assert not report.is_ok
+    assert [item.target_name for item in report.succeeded] == ['a']
+    assert [item.target_name for item in report.failed] == ['b']
+    assert [item.target_name for item in report.skipped] == ['c']
+    assert report.to_dict()['targets'][1]['error'] == 'broken target'
+
+
+def test_fan_out_catches_system_exit():
+    """
+    Test that sys.exit called inside of an operation doesn't kill worker threads
+    :return:
+    """
+    def _exiting_operation(connection_string):
+        raise SystemExit(1)
+
+    report = pgpm.utils.fanout.fan_out([('a', 'conn_a'), ('b', 'conn_b')], _exiting_operation, jobs=2)
+    assert len(report.failed) + len(report.skipped) == 2
@@ -0,0 +1,75 @@
+import pgpm.lib.utils.db
+import pgpm.lib.utils.instrumentation
+
+
+def _event(duration, statement_class='SELECT', query='SELECT 1;'):
+    event = pgpm.lib.utils.instrumentation.StatementEvent(query, statement_class, None, 0)
+    event.duration = duration
+    return event
+
+
+def test_get_statement_class():
+    """
+    Test that comments and whitespace are skipped to find the first keyword
+    :return:
+    """
+    get_statement_class = pgpm.lib.utils.instrumentation.get_statement_class
+    assert get_statement_class('select 1;') == 'SELECT'
+    assert get_statement_class(b'  -- comment\n/* multi\nline */ CREATE TABLE t ();') == 'CREATE'
+    assert get_statement_class('-- only comment') == 'UNKNOWN'
+
+
+def test_latency_histogram():
+    """
+    Test that statements are counted in buckets overall and per statement class
+    :return:
+    """
+    histogram = pgpm.lib.utils.instrumentation.LatencyHistogram(buckets=(0.1, 1))
+    for duration, statement_class in ((0.05, 'SELECT'), (0.1, 'SELECT'), (0.5, 'CREATE'), (2, 'CREATE')):
+        histogram.after_statement(_event(duration, statement_class))
+    assert histogram.counts == [2, 1, 1]
+    assert histogram.class_counts == {'SELECT': [2, 0, 0], 'CREATE': [0, 1, 1]}
+    assert histogram.get_percentile(50) == 0.1
+    assert histogram.get_percentile(75) == 1
+    assert histogram.get_percentile(100) is None
+    assert histogram.to_dict()['buckets'] == [0.1, 1, None]
+
+
+def test_slowest_statements():
+    """
+    Test that only top N slowest statements are kept
+    :return:
+    """
+    slowest_statements = pgpm.lib.utils.instrumentation.SlowestStatements(limit=2)
+    for duration in (0.3, 0.1, 0.5, 0.2):
+        slowest_statements.after_statement(_event(duration))
+    assert [event.duration for event in slowest_statements.get_statements()] == [0.5, 0.3]
+
+
+class _Connection(object):
+    start_statement = pgpm.lib.utils.db.MegaConnection.__dict__['start_statement']
+    end_statement = pgpm.lib.utils.db.MegaConnection.__dict__['end_statement']
+
+    def __init__(self, hooks):
+        self.instrumentation_hooks = hooks
+        self.script_key = 'f.sql'
+
+
+def test_statement_hooks():
+    """
+    Test that hooks get statement class, script key, duration and rowcount
+    :return:
+    """
+    events = []
+
+    class _Hook(pgpm.lib.utils.instrumentation.InstrumentationHook):
+        def before_statement(self, event):
+            events.append(('before', event.statement_class, event.script_key, event.duration))
+
+        def after_statement(self, event):
+            events.append(('after', event.rowcount, event.failed, event.duration >= 0))
+
+    conn = _Connection([_Hook()])
+    event = conn.start_statement('UPDATE t SET a = 1;')
+    conn.end_statement(event, 3, False)
+    assert events == [('before', 'UPDATE', 'f.sql', None), ('after', 3, False, True)]
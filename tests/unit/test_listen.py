@@ -0,0 +1,54 @@
+import io
+import json
+
+import pgpm.lib.listen
+
+
+def _notification(channel, payload, received):
+    return pgpm.lib.listen.Notification(channel, payload, 1, received)
+
+
+def test_notification_batcher_debounce():
+    """
+    Test that batch is released only after debounce interval without notifications or after max delay
+    :return:
+    """
+    batcher = pgpm.lib.listen.NotificationBatcher(debounce_interval=1, max_delay=3)
+    assert batcher.get_timeout(0) is None
+    batcher.add(_notification('deployment_events$$a', '1_0_0', 0))
+    batcher.add(_notification('deployment_events$$a', '1_0_1', 0.5))
+    assert batcher.get_timeout(0.5) == 1
+    assert batcher.pop_batch(1) == []
+    batcher.add(_notification('deployment_events$$b', '1_0_0', 1.2))
+    batcher.add(_notification('deployment_events$$b', '1_0_1', 2.8))
+    assert batcher.pop_batch(2.9) == []
+    batch = batcher.pop_batch(3)
+    assert [n.payload for n in batch] == ['1_0_0', '1_0_1', '1_0_0', '1_0_1']
+    assert batcher.pop_batch(10) == [] and len(batcher) == 0
+
+
+def test_notification_batcher_collapse():
+    """
+    Test that same notifications are collapsed and max batch size releases batch immediately
+    :return:
+    """
+    batcher = pgpm.lib.listen.NotificationBatcher(debounce_interval=1, max_batch_size=2, collapse=True)
+    batcher.add(_notification('deployment_events$$a', '1_0_0', 0))
+    batcher.add(_notification('deployment_events$$a', '1_0_0', 0.1))
+    assert len(batcher) == 1 and batcher.get_timeout(0.1) == 1
+    batcher.add(_notification('deployment_events$$b', '1_0_0', 0.2))
+    batch = batcher.pop_batch(0.2)
+    assert [(n.package_name, n.received) for n in batch] == [('a', 0.1), ('b', 0.2)]
+
+
+def test_jsonl_writer():
+    """
+    Test that notifications are written as JSON lines
+    :return:
+    """
+    stream = io.StringIO()
+    pgpm.lib.listen.get_jsonl_writer(stream)([_notification('deployment_events$$a', '1_0_0', 0),
+                                              _notification('ddl_change', '{}', 1)])
+    lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert lines[0]['package'] == 'a' and lines[0]['payload'] == '1_0_0'
+    assert lines[1]['package'] is None and lines[1]['channel'] == 'ddl_change'
@@ -0,0 +1,77 @@
+import pgpm.lib.locks
+
+
+def test_analyze_alter_table():
+    """
+    Test that ALTER TABLE actions are classified by lock level and rewrite or scan of the table
+    depending on server version
+    :return:
+    """
+    statement_lock = pgpm.lib.locks.analyze_statement(u'ALTER TABLE s.t ADD COLUMN a INT DEFAULT 0;', 90605)
+    assert statement_lock.table == (u's', u't')
+    assert statement_lock.lock_level == pgpm.lib.locks.ACCESS_EXCLUSIVE
+    assert statement_lock.rewrite
+    assert not pgpm.lib.locks.analyze_statement(u'ALTER TABLE t ADD COLUMN a INT DEFAULT 0;', 110002).rewrite
+    assert pgpm.lib.locks.analyze_statement(u'ALTER TABLE t ADD a UUID DEFAULT gen_random_uuid();', 110002).rewrite
+    assert pgpm.lib.locks.analyze_statement(u'ALTER TABLE t ALTER COLUMN a TYPE BIGINT;', 110002).rewrite
+
+    statement_lock = pgpm.lib.locks.analyze_statement(
+        u"ALTER TABLE t ALTER COLUMN a SET DEFAULT 'TYPE, x', ALTER b SET NOT NULL;", 110002)
+    assert (statement_lock.rewrite, statement_lock.scan) == (False, True)
+
+    statement_lock = pgpm.lib.locks.analyze_statement(
+        u'ALTER TABLE t ADD CONSTRAINT t_fk FOREIGN KEY (a) REFERENCES u (id) NOT VALID;', 110002)
+    assert statement_lock.lock_level == pgpm.lib.locks.SHARE_ROW_EXCLUSIVE
+    assert not statement_lock.scan
+    statement_lock = pgpm.lib.locks.analyze_statement(u'ALTER TABLE t VALIDATE CONSTRAINT t_fk;', 110002)
+    assert statement_lock.lock_level == pgpm.lib.locks.SHARE_UPDATE_EXCLUSIVE
+    assert statement_lock.scan
+
+
+def test_analyze_other_statements():
+    """
+    Test that statements other than ALTER TABLE are classified and those not locking existing tables are ignored
+    :return:
+    """
+    statement_lock = pgpm.lib.locks.analyze_statement(u'CREATE INDEX t_a_idx ON t (a);', 110002)
+    assert (statement_lock.lock_level, statement_lock.scan) == (pgpm.lib.locks.SHARE, True)
+    assert pgpm.lib.locks.analyze_statement(u'LOCK TABLE t IN SHARE ROW EXCLUSIVE MODE;', 110002).lock_level == \
+        pgpm.lib.locks.SHARE_ROW_EXCLUSIVE
+    assert pgpm.lib.locks.analyze_statement(u'UPDATE t SET a = 1;', 110002).scan
+    assert not pgpm.lib.locks.analyze_statement(u'UPDATE t SET a = 1 WHERE a IS NULL;', 110002).scan
+    assert pgpm.lib.locks.analyze_statement(u'UPDATE t SET a = 1 -- WHERE\n;', 110002).scan
+    assert pgpm.lib.locks.analyze_statement(u'DELETE FROM t /* WHERE a */;', 110002).scan
+    assert pgpm.lib.locks.analyze_statement(u'UPDATE t SET a = (SELECT b FROM u WHERE u.id = t.id);', 110002).scan
+    assert pgpm.lib.locks.analyze_statement(
+        u'DELETE FROM t USING (SELECT id FROM u WHERE b) v;', 110002).scan
+    assert not pgpm.lib.locks.analyze_statement(
+        u"DELETE FROM t WHERE id IN (SELECT id FROM u) AND c = '(';", 110002).scan
+    statement_lock = pgpm.lib.locks.analyze_statement(u'CREATE INDEX CONCURRENTLY ON s.t (a);', 110002)
+    assert (statement_lock.table, statement_lock.lock_level) == ((u's', u't'), pgpm.lib.locks.SHARE_UPDATE_EXCLUSIVE)
+    assert [statement_lock.table for statement_lock in
+            pgpm.lib.locks.analyze_statement_locks(u'TRUNCATE a, ONLY s.b *, c;', 110002)] == \
+        [(None, u'a'), (u's', u'b'), (None, u'c')]
+    assert len(pgpm.lib.locks.analyze_statement_locks(u'DROP TABLE IF EXISTS a, b CASCADE;', 110002)) == 2
+    assert pgpm.lib.locks.analyze_statement_locks(u'CREATE TABLE t (a INT);', 110002) == []
+    assert pgpm.lib.locks.analyze_statement(u'CREATE TABLE t (a INT);', 110002) is None
+    assert pgpm.lib.locks.analyze_statement(u'CREATE FUNCTION f() RETURNS INT AS $$SELECT 1$$ LANGUAGE sql;',
+                                            110002) is None
+
+
+def test_get_risk():
+    """
+    Test that risk depends on lock level, rewrite or scan and size of the table
+    :return:
+    """
+    rewrite = pgpm.lib.locks.analyze_statement(u'ALTER TABLE t ALTER COLUMN a TYPE BIGINT;', 110002)
+    assert pgpm.lib.locks.get_risk(rewrite, 2000000) == pgpm.lib.locks.RISK_HIGH
+    assert pgpm.lib.locks.get_risk(rewrite, 2000000, big_table_rows=5000000) == pgpm.lib.locks.RISK_MEDIUM
+    assert pgpm.lib.locks.get_risk(rewrite, None) == pgpm.lib.locks.RISK_LOW
+    assert pgpm.lib.locks.get_risk(rewrite, -1) == pgpm.lib.locks.RISK_LOW
+
+    quick = pgpm.lib.locks.analyze_statement(u'ALTER TABLE t DROP COLUMN a;', 110002)
+    assert pgpm.lib.locks.get_risk(quick, 2000000) == pgpm.lib.locks.RISK_MEDIUM
+    assert pgpm.lib.locks.get_risk(quick, 100) == pgpm.lib.locks.RISK_LOW
+
+    concurrently = pgpm.lib.locks.analyze_statement(u'CREATE INDEX CONCURRENTLY t_a_idx ON t (a);', 110002)
+    assert pgpm.lib.locks.get_risk(concurrently, None) == pgpm.lib.locks.RISK_HIGH
@@ -0,0 +1,129 @@
+import io
+import os
+
+import pytest
+
+import pgpm.lib.plan
+import pgpm.lib.utils.config
+
+
+def _write_file(path, content):
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with io.open(path, 'w', encoding='utf-8') as f:
+        f.write(content)
+
+
+@pytest.fixture
+def package_path(tmpdir):
+    """
+    Package with types depending on each other, table scripts and functions
+    """
+    path = str(tmpdir)
+    _write_file(os.path.join(path, 'types', 'a_type.sql'),
+                u'CREATE TYPE t_outer AS (inner_value t_inner, amount INTEGER);')
+    _write_file(os.path.join(path, 'types', 'b_type.sql'),
+                u'DROP TYPE IF EXISTS t_old;\nCREATE TYPE t_inner AS (value TEXT);')
+    _write_file(os.path.join(path, 'tables', '10.sql'), u'ALTER TABLE t ADD COLUMN c INTEGER;')
+    _write_file(os.path.join(path, 'tables', '9.sql'), u'CREATE TABLE t (id INTEGER);')
+    _write_file(os.path.join(path, 'functions', 'f.sql'),
+                u'CREATE OR REPLACE FUNCTION f() RETURNS INTEGER AS $$ SELECT 1; $$ LANGUAGE sql;')
+    return path
+
+
+@pytest.fixture
+def config(package_path):
+    return pgpm.lib.utils.config.SchemaConfiguration(
+        config_dict={'name': 'test_schema', 'subclass': 'basic', 'version': '0_1_0', 'types_path': 'types',
+                     'tables_path': 'tables', 'functions_path': 'functions'},
+        project_path=package_path)
+
+
+def test_compile_plan(config, package_path):
+    """
+    Test that plan holds ordered statements and scripts of each type
+    :return:
+    """
+    plan = pgpm.lib.plan.DeploymentPlan.compile(config, package_path, compare_table_scripts_as_int=True,
+                                                vcs_ref='abc')
+    assert plan.vcs_ref == 'abc'
+    assert plan.type_drop_statements == ('DROP TYPE IF EXISTS t_old;',)
+    assert [statement.split()[2] for statement in plan.type_ordered_statements] == ['t_inner', 't_outer']
+    assert [key for key, value in plan.get_scripts('table')] == ['9.sql', '10.sql']
+    assert plan.get_requested_files('function') == ['functions/f.sql']
+    assert plan.get_requested_files('view') == []
+    assert list(plan.timings.phases.keys()) == ['collect_files', 'reorder_types']
+
+
+def test_compile_plan_same_file_names(config, package_path):
+    """
+    Test that function scripts with the same name in different folders are keyed by their relative paths
+    :return:
+    """
+    _write_file(os.path.join(package_path, 'functions', 'sub', 'f.sql'),
+                u'CREATE OR REPLACE FUNCTION sub_f() RETURNS INTEGER AS $$ SELECT 2; $$ LANGUAGE sql;')
+    plan = pgpm.lib.plan.DeploymentPlan.compile(config, package_path)
+    assert sorted(key for key, value in plan.get_scripts('function')) == ['functions/f.sql', 'functions/sub/f.sql']
+
+
+def test_compile_plan_files_deployment(config, package_path):
+    """
+    Test that with specific files all requested files are reported as function scripts
+    :return:
+    """
+    plan = pgpm.lib.plan.DeploymentPlan.compile(config, package_path, files_deployment=['functions/f.sql'],
+                                                vcs_ref='abc')
+    assert plan.get_requested_files('function') == ['functions/f.sql']
+    assert plan.get_requested_files('table') == []
+    assert [key for key, value in plan.get_scripts('function')] == ['functions/f.sql']
+    assert plan.get_scripts('table') == ()
+
+
+def test_reorder_types():
+    """
+    Test that types are put after types they depend on, including qualified and differently cased names
+    :return:
+    """
+    types_script = '\n'.join([
+        'CREATE TYPE t_c AS (b s.T_B, a t_a);',
+        'CREATE DOMAIN t_b AS t_a;',
+        'DROP TYPE IF EXISTS t_old;',
+        'CREATE TYPE t_a AS (value TEXT);',
+        'COMMENT ON TYPE t_a IS \'t_c\';'
+    ])
+    drop_statements, ordered_statements, unordered_statements = pgpm.lib.plan.reorder_types(types_script)
+    assert drop_statements == ['DROP TYPE IF EXISTS t_old;']
+    assert [statement.split()[2] for statement in ordered_statements] == ['t_a', 't_b', 't_c']
+    assert unordered_statements == ['COMMENT ON TYPE t_a IS \'t_c\';']
+
+
+def test_reorder_types_cycle():
+    """
+    Test that cyclic dependencies are reported instead of looping forever
+    :return:
+    """
+    types_script = 'CREATE TYPE t_a AS (b t_b);\nCREATE TYPE t_b AS (a t_a);\nCREATE TYPE t_c AS (c t_c);'
+    with pytest.raises(ValueError) as excinfo:
+        pgpm.lib.plan.reorder_types(types_script)
+    assert 't_a, t_b' in str(excinfo.value)
+
+
+def test_compile_plan_table_scripts_changed(config, package_path):
+    """
+    Test that table scripts changed after plan was compiled are not deployed
+    :return:
+    """
+    plan = pgpm.lib.plan.DeploymentPlan.compile(config, package_path, compare_table_scripts_as_int=True,
+                                                vcs_ref='abc')
+    table_scripts = plan.get_scripts('table')
+    assert table_scripts[1][1].read() == u'ALTER TABLE t ADD COLUMN c INTEGER;'
+    _write_file(os.path.join(package_path, 'tables', '10.sql'), u'ALTER TABLE t ADD COLUMN d INTEGER;')
+    with pytest.raises(ValueError) as excinfo:
+        table_scripts[1][1].read()
+    assert '10.sql' in str(excinfo.value)
+
+    plan = pgpm.lib.plan.DeploymentPlan.compile(config, package_path, compare_table_scripts_as_int=True,
+                                                vcs_ref='abc')
+    _write_file(os.path.join(package_path, 'tables', '10.sql'), u'ALTER TABLE t ADD COLUMN e BIGINT;')
+    with pytest.raises(ValueError):
+        plan.get_scripts('table')[1][1].read()
@@ -0,0 +1,152 @@
+import glob
+import io
+import os
+
+import pytest
+
+import pgpm.lib.utils.sql
+
+
+# scripts that both pgpm splitter and sqlparse must split the same way
+SPLIT_CORPUS = [
+    u'SELECT 1; SELECT 2;',
+    u'SELECT 1; -- trailing comment; with semicolon\nSELECT 2',
+    u'CREATE FUNCTION f() RETURNS INTEGER AS $$ BEGIN RETURN 1; END; $$ LANGUAGE plpgsql; SELECT f();',
+    u'CREATE FUNCTION f() RETURNS TEXT AS $body$ SELECT $$;$$; $body$ LANGUAGE sql;\nDROP TYPE t;',
+    u'SELECT \'a;b\', E\'c\\\';d\', "we;ird""name"; SELECT 2;',
+    u'INSERT INTO t VALUES (\'it\'\'s;\'); -- comment;\n',
+    u'CREATE TYPE t_a AS (v TEXT);\nCREATE DOMAIN d AS INTEGER CHECK (VALUE > 0);\n-- only comment\n',
+    u'PREPARE p AS SELECT $1; EXECUTE p(1);',
+    u'CREATE TABLE a$b (c INTEGER); SELECT 1 AS a$b$;',
+]
+
+
+def _get_corpus():
+    """
+    corpus of scripts: handwritten ones plus all SQL scripts of pgpm itself and of test packages
+    """
+    root_path = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    corpus = list(SPLIT_CORPUS)
+    for pattern in ('pgpm/lib/db_scripts/*.sql', 'pgpm/lib/db_scripts/*/*.sql', 'tests/fixtures/*/*/*.sql',
+                    'tests/unit/*.sql'):
+        for file_path in sorted(glob.glob(os.path.join(root_path, pattern))):
+            corpus.append(io.open(file_path, encoding='utf-8').read())
+    return corpus
+
+
+def test_split_statements():
+    """
+    Test splitting on semicolons outside of quotes, dollar quotes and comments
+    :return:
+    """
+    assert pgpm.lib.utils.sql.split_statements(SPLIT_CORPUS[2]) == [
+        u'CREATE FUNCTION f() RETURNS INTEGER AS $$ BEGIN RETURN 1; END; $$ LANGUAGE plpgsql;', u'SELECT f();']
+    assert pgpm.lib.utils.sql.split_statements(u'/* a; /* nested; */ still; */ SELECT 1; SELECT 2') == [
+        u'/* a; /* nested; */ still; */ SELECT 1;', u'SELECT 2']
+    assert pgpm.lib.utils.sql.split_statements(u'SELECT 1;\n-- nothing here;\n/* and here; */\n;') == [u'SELECT 1;']
+    assert pgpm.lib.utils.sql.split_statements(u'SELECT $a$ unterminated; quote') == [
+        u'SELECT $a$ unterminated; quote']
+    assert pgpm.lib.utils.sql.split_statements(u'') == []
+    assert pgpm.lib.utils.sql.count_statements(SPLIT_CORPUS[6]) == 2
+
+
+def test_get_altered_table():
+    """
+    Test that table of ALTER TABLE statements is found with names unquoted
+    :return:
+    """
+    assert pgpm.lib.utils.sql.get_altered_table(u'-- c\nALTER TABLE IF EXISTS ONLY s."My""T" ADD a INT;') == \
+        (u's', u'My"T')
+    assert pgpm.lib.utils.sql.get_altered_table(u'alter table Foo add b int') == (None, u'foo')
+    assert pgpm.lib.utils.sql.get_altered_table(u'ALTER INDEX i RENAME TO j') is None
+
+
+def test_get_statement_table():
+    """
+    Test that table of statements working on a single table is found
+    :return:
+    """
+    assert pgpm.lib.utils.sql.get_statement_table(u'CREATE UNIQUE INDEX IF NOT EXISTS i ON ONLY s.t (a);') == \
+        (u's', u't')
+    assert pgpm.lib.utils.sql.get_statement_table(u'create index on T (a);') == (None, u't')
+    assert pgpm.lib.utils.sql.get_statement_table(u'DELETE FROM "T";') == (None, u'T')
+    assert pgpm.lib.utils.sql.get_statement_table(u'CREATE TABLE t (a INT);') is None
+
+
+def test_strip_comments():
+    """
+    Test that comments are stripped but comment like content of quotes is kept
+    :return:
+    """
+    assert pgpm.lib.utils.sql.strip_comments(u'SELECT 1 -- a\n, 2 /* b /* c */ */;').split() == \
+        [u'SELECT', u'1', u',', u'2', u';']
+    assert pgpm.lib.utils.sql.strip_comments(u"SELECT '--a', \"/*b*/\", $$--c$$;") == \
+        u"SELECT '--a', \"/*b*/\", $$--c$$;"
+
+
+def test_get_statement_tables():
+    """
+    Test that all tables listed by a statement are found
+    :return:
+    """
+    assert pgpm.lib.utils.sql.get_statement_tables(u'LOCK TABLE a, "B" IN EXCLUSIVE MODE;') == \
+        [(None, u'a'), (None, u'B')]
+    assert pgpm.lib.utils.sql.get_statement_tables(u'UPDATE t SET a = 1, b = 2;') == [(None, u't')]
+    assert pgpm.lib.utils.sql.get_statement_tables(u'CREATE TABLE t (a INT);') == []
+
+
+def test_get_index_creation():
+    """
+    Test that table and concurrency of CREATE INDEX statement are found
+    :return:
+    """
+    assert pgpm.lib.utils.sql.get_index_creation(u'CREATE INDEX CONCURRENTLY i ON s.t (a);') == ((u's', u't'), True)
+    assert pgpm.lib.utils.sql.get_index_creation(u'-- comment\ncreate unique index on t (a);') == ((None, u't'), False)
+    assert pgpm.lib.utils.sql.get_index_creation(u'ALTER TABLE t ADD a INT;') is None
+
+
+def test_get_alter_table_actions():
+    """
+    Test that ALTER TABLE is split into actions on commas outside of parentheses and quotes
+    :return:
+    """
+    assert pgpm.lib.utils.sql.get_alter_table_actions(
+        u"ALTER TABLE t ADD a NUMERIC(10, 2) DEFAULT ',', ALTER COLUMN \"b,c\" TYPE TEXT;") == \
+        [u"ADD a NUMERIC(10, 2) DEFAULT ','", u'ALTER COLUMN "b,c" TYPE TEXT']
+    assert pgpm.lib.utils.sql.get_alter_table_actions(u'ALTER INDEX i RENAME TO j;') == []
+
+
+def test_get_statement_type():
+    """
+    Test statement classification by the first keyword
+    :return:
+    """
+    assert pgpm.lib.utils.sql.get_statement_type(u'-- comment\n/* block */ create or replace view v AS SELECT 1;') \
+        == 'CREATE'
+    assert pgpm.lib.utils.sql.get_statement_type(u'DROP TYPE IF EXISTS t;') == 'DROP'
+    assert pgpm.lib.utils.sql.get_statement_type(u'(SELECT 1);') == 'SELECT'
+    assert pgpm.lib.utils.sql.get_statement_type(u'-- only comment') == 'UNKNOWN'
+
+
+def test_compatibility_with_sqlparse():
+    """
+    Test that statements found in the corpus are the same as sqlparse finds (disregarding comments
+    and whitespaces) and that CREATE and DROP statements are classified the same way
+    :return:
+    """
+    sqlparse = pytest.importorskip('sqlparse')
+
+    def _normalise(statements):
+        normalised_statements = []
+        for statement in statements:
+            statement = sqlparse.format(statement, strip_comments=True).strip()
+            if statement and statement != ';':
+                normalised_statements.append(' '.join(statement.split()))
+        return normalised_statements
+
+    for script in _get_corpus():
+        assert _normalise(pgpm.lib.utils.sql.split_statements(script)) == _normalise(sqlparse.split(script))
+        for statement in sqlparse.split(script):
+            statement_parsed = sqlparse.parse(statement)
+            if statement_parsed and statement_parsed[0].get_type() in ('CREATE', 'DROP'):
+                assert pgpm.lib.utils.sql.get_statement_type(statement) == statement_parsed[0].get_type()
@@ -2,7 +2,10 @@ import pytest
 import os
 import subprocess
 
+import pgpm.lib.abstract_deploy
+import pgpm.lib.utils.db
 import pgpm.lib.utils.misc
+import pgpm.lib.utils.timing
 import pgpm.lib.utils.vcs
 
 
@@ -51,3 +54,181 @@ def test_collect_scripts_from_sources():
     :return:
     """
     assert 0
+
+
+def test_get_content_hash():
+    """
+    Test that content hash depends on content only
+    :return:
+    """
+    assert pgpm.lib.utils.misc.get_content_hash(u'SELECT 1;') == pgpm.lib.utils.misc.get_content_hash(u'SELECT 1;')
+    assert pgpm.lib.utils.misc.get_content_hash(u'SELECT 1;') != pgpm.lib.utils.misc.get_content_hash(u'SELECT 2;')
+
+
+def test_get_changed_files(tmpdir):
+    """
+    Test getting files changed between commits
+    :return:
+    """
+    repo_path = str(tmpdir)
+    git = ['git', '-c', 'user.name=pgpm', '-c', 'user.email=pgpm@localhost']
+    os.makedirs(os.path.join(repo_path, 'package', 'functions'))
+    for file_name in ('f_changed.sql', 'f_unchanged.sql', 'f_deleted.sql'):
+        with open(os.path.join(repo_path, 'package', 'functions', file_name), 'w') as f:
+            f.write('SELECT 1;')
+    with open(os.path.join(repo_path, 'outside.sql'), 'w') as f:
+        f.write('SELECT 1;')
+    subprocess.check_call(['git', 'init', '-q', repo_path])
+    subprocess.check_call(git + ['add', '.'], cwd=repo_path)
+    subprocess.check_call(git + ['commit', '-q', '-m', 'first'], cwd=repo_path)
+    first_ref = pgpm.lib.utils.vcs.get_git_revision_hash(repo_path)
+
+    with open(os.path.join(repo_path, 'package', 'functions', 'f_changed.sql'), 'w') as f:
+        f.write('SELECT 2;')
+    with open(os.path.join(repo_path, 'package', 'functions', 'f_added.sql'), 'w') as f:
+        f.write('SELECT 3;')
+    with open(os.path.join(repo_path, 'package', 'readme.txt'), 'w') as f:
+        f.write('functions')
+    with open(os.path.join(repo_path, 'outside.sql'), 'w') as f:
+        f.write('SELECT 2;')
+    os.remove(os.path.join(repo_path, 'package', 'functions', 'f_deleted.sql'))
+    subprocess.check_call(git + ['add', '-A', '.'], cwd=repo_path)
+    subprocess.check_call(git + ['commit', '-q', '-m', 'second'], cwd=repo_path)
+
+    assert pgpm.lib.utils.vcs.get_changed_files(os.path.join(repo_path, 'package'), first_ref) == \
+        [os.path.join('functions', 'f_added.sql'), os.path.join('functions', 'f_changed.sql'), 'readme.txt']
+    assert pgpm.lib.utils.vcs.get_changed_files(os.path.join(repo_path, 'package'), first_ref,
+                                                script_paths=[os.path.join(repo_path, 'package', 'functions')]) == \
+        [os.path.join('functions', 'f_added.sql'), os.path.join('functions', 'f_changed.sql')]
+
+
+class _Connection(object):
+    search_path = None
+    track_query = pgpm.lib.utils.db.MegaConnection.__dict__['track_query']
+
+
+class _Cursor(object):
+    def __init__(self):
+        self.connection = _Connection()
+        self.queries = []
+
+    def execute(self, query, args=None):
+        self.queries.append(query)
+        self.connection.track_query(query)
+
+
+def test_set_search_path_skips_redundant_set():
+    """
+    Test that search_path is set only when it's not known to be set already
+    :return:
+    """
+    cur = _Cursor()
+    pgpm.lib.utils.db.SqlScriptsHelper.set_search_path(cur, 'test_schema')
+    pgpm.lib.utils.db.SqlScriptsHelper.set_search_path(cur, 'test_schema')
+    assert len(cur.queries) == 1
+    cur.execute('SELECT 1;')
+    pgpm.lib.utils.db.SqlScriptsHelper.set_search_path(cur, 'test_schema')
+    assert len(cur.queries) == 2
+    cur.execute('RESET ALL;')
+    pgpm.lib.utils.db.SqlScriptsHelper.set_search_path(cur, 'test_schema')
+    pgpm.lib.utils.db.SqlScriptsHelper.set_search_path(cur, 'other_schema')
+    assert len(cur.queries) == 5
+
+
+def test_make_settings_local():
+    """
+    Test that settings of a script are applied to current transaction only
+    :return:
+    """
+    script = u'SET statement_timeout = 0;\n-- messages\nset session client_min_messages = warning;\n' \
+        u'SET LOCAL check_function_bodies = false;\nUPDATE t\nSET a = 1;'
+    assert pgpm.lib.utils.db.SqlScriptsHelper.make_settings_local(script) == \
+        u'SET LOCAL statement_timeout = 0;\n-- messages\nSET LOCAL client_min_messages = warning;\n' \
+        u'SET LOCAL check_function_bodies = false;\nUPDATE t\nSET a = 1;'
+
+
+class _PooledConnection(_Connection):
+    closed = False
+    autocommit = False
+
+    def rollback(self):
+        pass
+
+    def __init__(self):
+        self.cur = _Cursor()
+
+    def cursor(self):
+        return self.cur
+
+    def close(self):
+        self.closed = True
+
+
+def test_connection_pool_reuses_connections():
+    """
+    Test that released connections are reused for the same connection string only and closed with the pool
+    :return:
+    """
+    pool = pgpm.lib.utils.db.ConnectionPool()
+    conn = _PooledConnection()
+    pool.release_connection('dbname=a', conn)
+    assert pool.get_connection('dbname=a') is conn
+    pool.release_connection('dbname=a', conn)
+    pool.close_all()
+    assert conn.closed
+    assert not pool._idle_connections
+
+
+def test_connection_released_on_error():
+    """
+    Test that connection of a manager is reset and given back to the pool when its method fails
+    :return:
+    """
+    class _Manager(pgpm.lib.abstract_deploy.AbstractDeploymentManager):
+        @pgpm.lib.abstract_deploy.release_connection_on_error
+        def fail(self):
+            raise ValueError('failed')
+
+    pool = pgpm.lib.utils.db.ConnectionPool()
+    manager = _Manager('dbname=a', connection_pool=pool)
+    conn = manager._connection = _PooledConnection()
+    with pytest.raises(ValueError):
+        manager.fail()
+    assert manager._connection is None
+    assert conn.cur.queries == ['DISCARD ALL;']
+    assert pool.get_connection('dbname=a') is conn
+
+
+def test_timings():
+    """
+    Test that sequential phases are summed up by name and scripts are sorted from the slowest
+    :return:
+    """
+    timings = pgpm.lib.utils.timing.Timings()
+    timings.start_phase('a')
+    timings.start_phase('b')
+    timings.end_phase()
+    with timings.phase('a'):
+        pass
+    timings.add_script('function', 'f1.sql', 0.5)
+    timings.add_script('function', 'f2.sql', 1.5)
+    assert list(timings.phases.keys()) == ['a', 'b']
+    assert [script.key for script in timings.get_slowest_scripts(1)] == ['f2.sql']
+    timings_dict = timings.to_dict()
+    assert timings_dict['total'] == timings.total
+    assert [script['file'] for script in timings_dict['scripts']] == ['f1.sql', 'f2.sql']
+
+
+def test_notice_stream():
+    """
+    Test that notices are forwarded to callbacks as they come and only the last ones are kept
+    :return:
+    """
+    received_notices = []
+    notice_stream = pgpm.lib.utils.db.NoticeStream(maxlen=2)
+    notice_stream.callbacks.append(received_notices.append)
+    for i in range(3):
+        notice_stream.append('NOTICE:  step {0}\n'.format(i))
+    assert len(received_notices) == 3
+    assert list(notice_stream) == ['NOTICE:  step 1\n', 'NOTICE:  step 2\n']
+    assert notice_stream[-1] == 'NOTICE:  step 2\n'